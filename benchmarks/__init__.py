@@ -0,0 +1,5 @@
+"""Benchmarks of pubs, run as scripts (e.g. `python -m benchmarks.decoders`).
+`benchmarks.commands` times the commands on large generated repositories.
+
+They are not part of the test suite, nor of the installed package.
+"""
@@ -0,0 +1,251 @@
+"""Time pubs commands on large synthetic repositories.
+
+    python -m benchmarks.commands [--sizes N [N ...]] [--repeat N]
+                                  [--storage files|sqlite] [--workdir DIR]
+                                  [-o results.json] [--compare old.json]
+
+For each size, a repository is generated with varied authors, tags,
+documents and notes. Each command is then run as from the shell, by a new
+pubs process, with a cold cache (removed before each run) and with a warm
+one. The best time of several runs is reported, and all timings are written
+as JSON, to compare them between commits (see `--compare`).
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pubs import __version__, completion, config, endecoder
+from pubs.content import write_file
+from pubs.paper import Paper
+from pubs.repo import Repository
+
+from .decoders import synthetic_bibtex
+
+
+SIZES = (1000, 10000, 100000)
+
+TAGS = ['ml', 'physics', 'math', 'toread', 'review', 'quantum', 'networks',
+        'classic', 'survey', 'thesis']
+DOC_RATIO = 0.3   # papers with a document
+NOTE_RATIO = 0.2  # papers with notes
+IMPORT_SIZE = 1000  # papers imported by the import benchmark
+
+PUBS = [sys.executable, '-c',
+        'import sys; from pubs import pubs_cmd; pubs_cmd.execute(sys.argv)']
+COMPLETE = [sys.executable, '-c',
+            'import sys; from pubs import config, completion; '
+            'conf = config.load_conf(path=sys.argv[1]); '
+            'completion.CiteKeyOrTagCompletion(conf)(prefix="")']
+
+# Commands run on each repository, as (name, arguments). The ones that modify
+# the repository are run last.
+COMMANDS = [
+    ('list', ['list']),
+    ('list -k', ['list', '-k']),
+    ('list author', ['list', 'author:turing']),
+    ('list title', ['list', 'title:quantum']),
+    ('list year', ['list', 'year:1950-1960']),
+    ('list tag', ['list', 'tag:toread']),
+    ('list combined', ['list', 'author:noether', 'tag:math', 'year:2000-']),
+    ('tag list', ['tag']),
+    ('tag query', ['tag', 'ml+physics']),
+    ('statistics', ['statistics']),
+    ('export', ['export']),
+    ('cache rebuild', ['cache', 'rebuild', '--all']),
+    ('completion', None),
+    ('tag edit', ['tag', 'key0', '+benchmark{run}']),
+    ('tag bulk', ['tag', '--query', 'year:1950-1960', '+bulk{run}']),
+    ('add', ['add', '{bibfile}', '-k', 'add{run}']),
+    ('import', ['import', '{importfile}']),
+]
+
+
+def _run(args, check=True):
+    return subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, check=check)
+
+
+def generate_repository(directory, n, storage='files', seed=0):
+    """Create a repository of `n` papers in `directory`.
+
+    :returns: the path of its configuration file.
+    """
+    conf_path = os.path.join(directory, 'pubsrc')
+    _run(PUBS + ['-c', conf_path, 'init', '-p', os.path.join(directory, 'pubs')])
+    if storage != 'files':
+        _run(PUBS + ['-c', conf_path, 'storage', storage])
+    conf = config.load_conf(path=conf_path)
+
+    rand = random.Random(seed)
+    docfile = os.path.join(directory, 'paper.pdf')
+    write_file(docfile, '%PDF-1.4\n')
+    entries = endecoder.EnDecoder(decoder='fast').decode_bibdata(
+        synthetic_bibtex(n, seed=seed))
+    rp = Repository(conf)
+    papers = []
+    for citekey in sorted(entries, key=lambda k: int(k[3:])):
+        paper = Paper.from_bibentry({citekey: entries[citekey]})
+        paper.tags = set(rand.sample(TAGS, rand.randint(0, 3)))
+        if rand.random() < DOC_RATIO:
+            paper.docpath = rp.databroker.add_doc(citekey, docfile)
+        if rand.random() < NOTE_RATIO:
+            write_file(rp.databroker.real_notepath(citekey, conf['main']['note_extension']),
+                       'Notes on {}.\n'.format(citekey))
+        papers.append(paper)
+    rp.push_papers(papers)
+    rp.close()
+
+    write_file(os.path.join(directory, 'add.bib'), synthetic_bibtex(1, seed=seed + 1))
+    write_file(os.path.join(directory, 'import.bib'),
+               synthetic_bibtex(IMPORT_SIZE, seed=seed + 2, prefix='import'))
+    return conf_path
+
+
+def clear_caches(conf_path):
+    """Remove the caches of the repository, as for its first use."""
+    rp = Repository(config.load_conf(path=conf_path))
+    broker = rp.databroker.databroker
+    for name in ('metacache', 'bibcache', 'searchindex'):
+        broker.filebroker.remove_cachefile(name)
+        broker.remove_cache_journal(name)
+    broker.filebroker.remove_cachefile(completion.INDEX_NAME)
+    broker.close()
+    rp.close()  # releases the lock of the repository
+
+
+def _command_args(conf_path, args, run):
+    if args is None:
+        return COMPLETE + [conf_path]
+    directory = os.path.dirname(conf_path)
+    values = {'run': run, 'bibfile': os.path.join(directory, 'add.bib'),
+              'importfile': os.path.join(directory, 'import.bib')}
+    return PUBS + ['-c', conf_path] + [a.format(**values) for a in args]
+
+
+def _remove_imported(conf_path):
+    """Undo the import benchmark, so that it can be run again."""
+    _run(PUBS + ['-c', conf_path, 'remove', '-f'] +
+         ['import{}'.format(i) for i in range(IMPORT_SIZE)], check=False)
+
+
+def time_command(conf_path, name, args, cache, repeat, counter):
+    """Return the times of `repeat` runs of a command."""
+    times = []
+    if cache == 'warm':
+        _run(_command_args(conf_path, args, next(counter)))
+        if name == 'import':
+            _remove_imported(conf_path)
+    for _ in range(repeat):
+        if cache == 'cold':
+            clear_caches(conf_path)
+        cmd = _command_args(conf_path, args, next(counter))
+        start = time.time()
+        _run(cmd)
+        times.append(time.time() - start)
+        if name == 'import':
+            _remove_imported(conf_path)
+    return times
+
+
+def time_init(directory, repeat):
+    times = []
+    for i in range(repeat):
+        conf_path = os.path.join(directory, 'init{}'.format(i), 'pubsrc')
+        os.makedirs(os.path.dirname(conf_path))
+        start = time.time()
+        _run(PUBS + ['-c', conf_path, 'init', '-p',
+                     os.path.join(os.path.dirname(conf_path), 'pubs')])
+        times.append(time.time() - start)
+    return times
+
+
+def _git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                      stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help='numbers of papers of the repositories '
+                             '(default: {})'.format(' '.join(map(str, SIZES))))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs for each command (default: 3)')
+    parser.add_argument('--storage', default='files', choices=['files', 'sqlite'],
+                        help='storage of the repositories (default: files)')
+    parser.add_argument('--workdir', default=None,
+                        help='directory where repositories are generated, '
+                             'and kept (default: a temporary directory)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file for the results (default: stdout)')
+    parser.add_argument('--compare', default=None, metavar='FILE',
+                        help='JSON results of a previous run, to show the '
+                             'ratio of the new times to the old ones')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            for t in json.load(f)['timings']:
+                previous[t['size'], t['command'], t['cache']] = t['best']
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pubs-benchmark-')
+    counter = iter(range(sys.maxsize))
+    results = {'pubs_version': __version__, 'commit': _git_commit(),
+               'python': platform.python_version(), 'platform': platform.platform(),
+               'storage': args.storage, 'repeat': args.repeat,
+               'generation': {}, 'timings': []}
+
+    def report(size, name, cache, times):
+        results['timings'].append({'size': size, 'command': name, 'cache': cache,
+                                   'times': times, 'best': min(times)})
+        line = '{:>7} {:<14} {:<5} {:8.3f}s'.format(size, name, cache, min(times))
+        if previous.get((size, name, cache)):
+            line += ' {:6.2f}x'.format(min(times) / previous[size, name, cache])
+        print(line, file=sys.stderr)
+
+    try:
+        report(0, 'init', 'cold', time_init(os.path.join(workdir, 'init'), args.repeat))
+        for size in args.sizes:
+            directory = os.path.join(workdir, '{}-{}'.format(args.storage, size))
+            conf_path = os.path.join(directory, 'pubsrc')
+            if not os.path.exists(conf_path):
+                os.makedirs(directory)
+                start = time.time()
+                generate_repository(directory, size, storage=args.storage)
+                results['generation'][str(size)] = time.time() - start
+            for name, cmd_args in COMMANDS:
+                for cache in ('cold', 'warm'):
+                    times = time_command(conf_path, name, cmd_args, cache,
+                                         args.repeat, counter)
+                    report(size, name, cache, times)
+    finally:
+        shutil.rmtree(os.path.join(workdir, 'init'), ignore_errors=True)
+        if args.workdir is None:
+            shutil.rmtree(workdir)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare the speed of the bibtex decoders.
+
+    python -m benchmarks.decoders [-n ENTRIES] [--repeat N] [file.bib ...]
+
+Decodes the given files, or synthetic bibtex data, with each of the decoders
+of `pubs.endecoder` and reports the best time of several runs.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import random
+import time
+
+from pubs import endecoder
+
+
+FIRST_NAMES = ['Alan', 'Ada', 'Claude', 'Grace', 'John', 'Marie', 'Emmy', 'Kurt']
+LAST_NAMES = ['Turing', 'Lovelace', 'Shannon', 'Hopper', 'von Neumann', 'Curie',
+              'Noether', 'G{\\"o}del', 'de la Vall{\\\'e}e Poussin']
+WORDS = ['learning', 'computing', 'machinery', 'intelligence', 'theory',
+         'quantum', 'networks', 'on', 'the', 'of', 'a', 'analysis', 'random']
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct',
+          'nov', 'dec']
+
+
+def synthetic_bibtex(n, seed=0, prefix='key'):
+    """Return bibtex data with `n` varied entries, with citekeys made of
+    `prefix` and a number."""
+    rand = random.Random(seed)
+
+    def words(k):
+        return ' '.join(rand.choice(WORDS) for _ in range(k))
+
+    def names(k):
+        return ' and '.join('{}, {}'.format(rand.choice(LAST_NAMES), rand.choice(FIRST_NAMES))
+                            for _ in range(k))
+
+    entries = ['@string{jmlr = "Journal of Machine Learning Research"}\n']
+    for i in range(n):
+        fields = [
+            ('author', '{' + names(rand.randint(1, 6)) + '}'),
+            ('title', '{{' + words(rand.randint(3, 12)).capitalize() + '}}'),
+            ('journal', rand.choice(['jmlr', '{Nature}', '"Physical Review"'])),
+            ('year', str(rand.randint(1900, 2030))),
+            ('month', rand.choice(MONTHS)),
+            ('pages', '{{{}-{}}}'.format(i, i + rand.randint(1, 30))),
+            ('keywords', '{' + ', '.join(words(1) for _ in range(3)) + '}'),
+            ('abstract', '{' + '\n    '.join(words(12) for _ in range(rand.randint(0, 6))) + '}'),
+        ]
+        entries.append('@{}{{{}{},\n{}\n}}\n'.format(
+            rand.choice(['article', 'inproceedings', 'book', 'misc']), prefix, i,
+            ',\n'.join('  {} = {}'.format(k, v) for k, v in fields)))
+    return '\n'.join(entries)
+
+
+def time_decoder(decoder, bibstr, repeat):
+    coder = endecoder.EnDecoder(decoder=decoder)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.time()
+        entries = coder.decode_bibdata(bibstr)
+        best = min(best, time.time() - start)
+    return best, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', help='bibtex files to decode')
+    parser.add_argument('-n', '--entries', type=int, default=1000,
+                        help='number of synthetic entries (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs for each decoder (default: 3)')
+    args = parser.parse_args()
+
+    if args.files:
+        bibstr = ''.join(io.open(f, encoding='utf-8').read() for f in args.files)
+    else:
+        bibstr = synthetic_bibtex(args.entries)
+    times = {}
+    for decoder in endecoder.DECODERS:
+        times[decoder], count = time_decoder(decoder, bibstr, args.repeat)
+        print('{:<14} {:6d} entries in {:7.3f}s ({:8.0f} entries/s)'.format(
+            decoder, count, times[decoder], count / times[decoder]))
+    print('speedup: {:.1f}x'.format(times['bibtexparser'] / times['fast']))
+
+
+if __name__ == '__main__':
+    main()
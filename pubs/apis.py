@@ -2,14 +2,11 @@
 import re
 import datetime
 
-import requests
-import bibtexparser
-from bibtexparser.bibdatabase import BibDatabase
-import feedparser
-from bs4 import BeautifulSoup
-
 from . import endecoder
 
+# requests, feedparser, bs4 and bibtexparser are imported in the functions
+# using them, as they are slow to import and only needed to query the APIs.
+
 
 class ReferenceNotFoundError(Exception):
     pass
@@ -67,6 +64,7 @@ def _get_request(url, headers=None):
     :raise ConnectionError:  if anything goes bad (connection refused, timeout
                              http status error (401, 404, etc)).
     """
+    import requests
     try:
         r = requests.get(url, headers=headers)
         r.raise_for_status()
@@ -96,6 +94,7 @@ def isbn2bibtex(isbn, **kwargs):
     """Return a bibtex string from an ISBN"""
 
     url = 'https://www.ottobib.com/isbn/{}/bibtex'.format(isbn)
+    from bs4 import BeautifulSoup
     r = _get_request(url)
     soup = BeautifulSoup(r.text, "html.parser")
     citation = soup.find("textarea").text
@@ -140,6 +139,11 @@ def arxiv2bibtex(arxiv_id, try_doi=True, ui=None):
     :param ui:       if not None, will display a warning if the doi request
                      fails.
     """
+    import requests
+    import feedparser
+    import bibtexparser
+    from bibtexparser.bibdatabase import BibDatabase
+
     ## handle errors
     url = 'https://export.arxiv.org/api/query?id_list={}'.format(arxiv_id)
     try:
@@ -0,0 +1,370 @@
+"""A fast bibtex decoder.
+
+Decodes bibtex data into the same entries as bibtexparser, with the options
+and customizations used by pubs (see `endecoder`), but with a hand-written,
+single-pass tokenizer instead of a pyparsing grammar. The quirks of the
+grammar are reproduced: malformed entries are skipped as comments, up to the
+next line starting with '@', and undefined strings raise an error.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+
+COMMON_STRINGS = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April',
+    'may': 'May', 'jun': 'June', 'jul': 'July', 'aug': 'August',
+    'sep': 'September', 'oct': 'October', 'nov': 'November',
+    'dec': 'December',
+}
+
+# alternative field names (bibtexparser's homogenize_fields)
+ALT_FIELDS = {
+    'keyw': 'keyword',
+    'keywords': 'keyword',
+    'authors': 'author',
+    'editors': 'editor',
+    'urls': 'url',
+    'link': 'url',
+    'links': 'url',
+    'subjects': 'subject',
+    'xref': 'crossref',
+}
+
+
+class UndefinedString(KeyError):
+    pass
+
+
+class _NoMatch(Exception):
+    """The data does not match the element being parsed."""
+
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+_KEYWORD_RE = re.compile(r'@(string|preamble|comment)(?![A-Za-z0-9_$])',
+                         re.IGNORECASE)
+_ENTRY_START_RE = re.compile(r'@[ \t\n\r]*([A-Za-z]+)[ \t\n\r]*([{(])')
+_COMMENT_END_RE = re.compile(r'\n[ \t\n\r]*@')
+_FIELD_NAME_RE = re.compile(r'[A-Za-z0-9_\-().+]+')
+_STRING_NAME_RE = re.compile(r'[A-Za-z0-9_\-:]+')
+_INTEGER_RE = re.compile(r'[0-9]+')
+_BRACE_RE = re.compile(r'[{}]')
+_QUOTED_TEXT_RE = re.compile(r'[^"{}]+')
+
+_CLOSING = {'{': '}', '(': ')'}
+
+
+class _Ref(object):
+    """Reference to a bibtex string, in a value."""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name.lower()
+
+
+def _strip_after_new_lines(s):
+    """Removes leading whitespaces in all but first line."""
+    lines = s.splitlines()
+    if len(lines) > 1:
+        lines = [lines[0]] + [l.lstrip() for l in lines[1:]]
+    return '\n'.join(lines)
+
+
+class _Decoder(object):
+
+    def __init__(self, bibstr):
+        if bibstr.startswith('\ufeff'):  # byte order mark
+            bibstr = bibstr[1:]
+        self.s = bibstr.expandtabs()  # as pyparsing does
+        self.strings = dict(COMMON_STRINGS)
+        self.entries = {}
+
+    # Tokens
+
+    def skip(self, pos):
+        return _WHITESPACE_RE.match(self.s, pos).end()
+
+    def expect(self, pos, char):
+        pos = self.skip(pos)
+        if not self.s.startswith(char, pos):
+            raise _NoMatch()
+        return pos + 1
+
+    def match(self, regex, pos):
+        m = regex.match(self.s, self.skip(pos))
+        if m is None:
+            raise _NoMatch()
+        return m
+
+    def braced(self, pos):
+        """Return the end of the braced text starting at pos."""
+        depth = 0
+        for m in _BRACE_RE.finditer(self.s, pos):
+            depth += 1 if m.group() == '{' else -1
+            if depth == 0:
+                return m.end()
+        raise _NoMatch()
+
+    def quoted(self, pos):
+        """Return the end of the quoted text starting at pos."""
+        s, pos = self.s, pos + 1
+        while pos < len(s):
+            c = s[pos]
+            if c == '"':
+                return pos + 1
+            elif c == '{':
+                pos = self.braced(pos)
+            elif c == '}':
+                break
+            else:
+                pos = _QUOTED_TEXT_RE.match(s, pos).end()
+        raise _NoMatch()
+
+    # Values
+
+    def string_expr(self, pos):
+        """Parse a '#'-separated list of quoted values, braced values and
+        string names. Return (parts, end)."""
+        parts = []
+        while True:
+            pos = self.skip(pos)
+            c = self.s[pos:pos + 1]
+            if c == '"':
+                end = self.quoted(pos)
+                parts.append(self.s[pos + 1:end - 1])
+            elif c == '{':
+                end = self.braced(pos)
+                parts.append(self.s[pos + 1:end - 1])
+            else:
+                end = self.match(_STRING_NAME_RE, pos).end()
+                parts.append(_Ref(self.s[pos:end]))
+            pos = self.skip(end)
+            if not self.s.startswith('#', pos):
+                return parts, end
+            pos += 1
+
+    def value(self, pos):
+        m = _INTEGER_RE.match(self.s, self.skip(pos))
+        if m is not None:
+            return [m.group()], m.end()
+        return self.string_expr(pos)
+
+    def interpolate(self, parts):
+        if len(parts) == 1 and not isinstance(parts[0], _Ref):
+            value = parts[0]
+            return '' if value in ('', '{}') else value
+        try:
+            return ''.join(self.strings[p.name] if isinstance(p, _Ref) else p
+                           for p in parts)
+        except KeyError as e:
+            raise UndefinedString(e.args[0])
+
+    # Declarations
+
+    def field(self, pos):
+        name = self.match(_FIELD_NAME_RE, pos)
+        pos = self.expect(name.end(), '=')
+        parts, pos = self.value(pos)
+        parts = [p if isinstance(p, _Ref) else _strip_after_new_lines(p)
+                 for p in parts]
+        return (name.group(), parts), pos
+
+    def entry(self, pos):
+        m = _ENTRY_START_RE.match(self.s, pos)
+        if m is None:
+            raise _NoMatch()
+        entry_type, closing = m.group(1), _CLOSING[m.group(2)]
+        pos = self.skip(m.end())
+        comma = self.s.find(',', pos)
+        if comma < 0:
+            raise _NoMatch()
+        citekey = self.s[pos:comma].strip()
+        if not citekey or any(c.isspace() for c in citekey):
+            raise _NoMatch()
+        field, pos = self.field(comma + 1)
+        fields = [field]
+        while True:
+            try:
+                field, end = self.field(self.expect(pos, ','))
+            except _NoMatch:
+                break
+            fields.append(field)
+            pos = end
+        try:
+            pos = self.expect(pos, ',')
+        except _NoMatch:
+            pass
+        pos = self.expect(pos, closing)
+        self.add_entry(entry_type, citekey, fields)
+        return pos
+
+    def opening(self, pos):
+        """Parse an opening brace or parenthesis; return (closing, end)."""
+        pos = self.skip(pos)
+        closing = _CLOSING.get(self.s[pos:pos + 1])
+        if closing is None:
+            raise _NoMatch()
+        return closing, pos + 1
+
+    def string_def(self, pos):
+        closing, pos = self.opening(pos)
+        name = self.match(_STRING_NAME_RE, pos)
+        parts, pos = self.string_expr(self.expect(name.end(), '='))
+        pos = self.expect(pos, closing)
+        self.strings[name.group().lower()] = self.interpolate(parts)
+        return pos
+
+    def preamble(self, pos):
+        closing, pos = self.opening(pos)
+        _, pos = self.value(pos)
+        return self.expect(pos, closing)
+
+    def comment(self, pos):
+        """Skip text up to the next line starting with '@'."""
+        m = _COMMENT_END_RE.search(self.s, pos)
+        return len(self.s) if m is None else m.end() - 1
+
+    def add_entry(self, entry_type, citekey, fields):
+        raw = {name: parts for name, parts in reversed(fields)}
+        entry = {}
+        for name in raw:
+            name_lower = name.lower()
+            entry[ALT_FIELDS.get(name_lower, name_lower)] = self.interpolate(raw[name])
+        entry['ENTRYTYPE'] = entry_type.lower()
+        entry['ID'] = citekey
+        self.entries[citekey] = customizations(entry)
+
+    def decode(self):
+        s = self.s
+        pos = self.skip(0)
+        while pos < len(s):
+            keyword = _KEYWORD_RE.match(s, pos)
+            kind = keyword.group(1).lower() if keyword else None
+            try:
+                if kind == 'string':
+                    pos = self.string_def(keyword.end())
+                elif kind == 'preamble':
+                    pos = self.preamble(keyword.end())
+                elif kind == 'comment':
+                    pos = self.comment(keyword.end())
+                else:
+                    raise _NoMatch()
+            except _NoMatch:
+                try:
+                    pos = self.entry(pos)
+                except _NoMatch:
+                    pos = self.comment(pos)
+            pos = self.skip(pos)
+        return self.entries
+
+
+# Customizations (same as bibtexparser.customization)
+
+def _find_matching(text, opening, closing):
+    """Return {index_opening: index_closing} for the non-escaped brackets.
+
+    :raises IndexError: if brackets are unbalanced.
+    """
+    a = [m.start() for m in re.finditer(r'(?<!\\)' + re.escape(opening), text)]
+    b = [-m.start() for m in re.finditer(r'(?<!\\)' + re.escape(closing), text)]
+    if len(a) != len(b):
+        raise IndexError()
+    matching, stack = {}, []
+    for i in sorted(a + b, key=abs):
+        if i >= 0:
+            stack.append(i)
+        else:
+            if not stack:
+                raise IndexError()
+            matching[stack.pop()] = -i
+    if stack:
+        raise IndexError()
+    return matching
+
+
+def getnames(names):
+    """Convert people names as surname, firstnames or surname, initials."""
+    tidynames = []
+    for namestring in names:
+        namestring = namestring.strip()
+        if len(namestring) < 1:
+            continue
+        if ',' in namestring:
+            namesplit = namestring.split(',', 1)
+            last = namesplit[0].strip()
+            firsts = [i.strip() for i in namesplit[1].split()]
+        else:
+            if '{' in namestring and '}' in namestring:
+                try:
+                    brackets = _find_matching(namestring, '{', '}')
+                except IndexError:
+                    tidynames.append(namestring)
+                    continue
+                namesplit = []
+                start = 0
+                i = 0
+                while True:
+                    if i in brackets:
+                        i = brackets[i]
+                    else:
+                        i += 1
+                    if i >= len(namestring):
+                        break
+                    if namestring[i] == ' ':
+                        namesplit.append(namestring[start:i])
+                        start = i + 1
+                    elif i == len(namestring) - 1:
+                        namesplit.append(namestring[start:])
+            else:
+                namesplit = namestring.split()
+            last = namesplit.pop()
+            firsts = [i.replace('.', '. ').strip() for i in namesplit]
+        if last in ['jnr', 'jr', 'junior']:
+            last = firsts.pop()
+        for item in firsts:
+            if item in ['ben', 'van', 'der', 'de', 'la', 'le']:
+                last = firsts.pop() + ' ' + last
+        tidynames.append(last + ', ' + ' '.join(firsts))
+    return tidynames
+
+
+_AUTHOR_SEP_RE = re.compile(r' and ', re.IGNORECASE)
+_KEYWORD_SEP_RE = re.compile(r',|;')
+_PAGE_SEPARATORS = ['‐', '‑', '–', '—', '-', '−']
+
+
+def _split_names(record, field, split):
+    if field in record:
+        if record[field]:
+            names = split(record[field].replace('\n', ' '))
+            record[field] = getnames([i.strip() for i in names])
+        else:
+            del record[field]
+
+
+def customizations(record):
+    """Split author, editor and keyword fields into lists, and separate
+    pages by a double hyphen."""
+    _split_names(record, 'author', _AUTHOR_SEP_RE.split)
+    _split_names(record, 'editor', lambda names: names.split(' and '))
+    if 'keyword' in record:
+        record['keyword'] = [i.strip() for i in
+                             _KEYWORD_SEP_RE.split(record['keyword'].replace('\n', ''))]
+    if 'pages' in record:
+        for separator in _PAGE_SEPARATORS:
+            if separator in record['pages']:
+                p = [i.strip().strip(separator)
+                     for i in record['pages'].split(separator)]
+                record['pages'] = p[0] + '--' + p[-1]
+    return record
+
+
+def decode(bibstr):
+    """Decode bibtex data into a dictionary of entries, by citekey.
+
+    Entries hold the 'ID' and 'ENTRYTYPE' keys, as bibtexparser's.
+    :raises UndefinedString: if a value uses an undefined string.
+    """
+    return _Decoder(bibstr).decode()
@@ -0,0 +1,119 @@
+"""Indexed format of the caches of bibtex and metadata entries.
+
+    MAGIC | header size (8 bytes) | header | records
+
+The header is a pickled dictionary, with a `table` giving the offset, size
+and timestamp of the record of each citekey, and the information needed to
+validate the cache (see `databroker.DataBroker.pull_entries_cache`). Each
+record is a pickled cache entry. On load, only the header is decoded: entries
+are decoded when first accessed, from a memory map of the file when
+possible. Pulling one paper from a large cache costs one record, not the
+whole cache.
+"""
+
+from __future__ import unicode_literals
+
+import struct
+
+from collections.abc import MutableMapping
+
+from .p3 import pickle
+
+
+MAGIC = b'PUBSIDX\n'
+_SIZE = struct.Struct('<Q')
+
+
+class IndexedEntries(MutableMapping):
+    """Cache entries, decoded from their records when first accessed.
+
+    Entries must have a `timestamp` attribute, which is kept in the table
+    so that entries can be checked without being decoded.
+    """
+
+    def __init__(self, entries=None, buffer=b'', table=None, start=0):
+        self._buffer = buffer
+        self._start = start  # of the records in the buffer
+        self._table = table or {}  # citekey -> (offset, size, timestamp)
+        self._decoded = dict(entries or {})
+
+    def __getitem__(self, citekey):
+        try:
+            return self._decoded[citekey]
+        except KeyError:
+            offset, size, _ = self._table.pop(citekey)
+            entry = pickle.loads(self._record(offset, size))
+            self._decoded[citekey] = entry
+            return entry
+
+    def __setitem__(self, citekey, entry):
+        self._decoded[citekey] = entry
+        self._table.pop(citekey, None)
+
+    def __delitem__(self, citekey):
+        if self._table.pop(citekey, None) is None:
+            del self._decoded[citekey]
+        else:
+            self._decoded.pop(citekey, None)
+
+    def discard(self, citekey):
+        """Remove an entry if there is one, without decoding it."""
+        if citekey in self:
+            del self[citekey]
+
+    def __contains__(self, citekey):
+        return citekey in self._decoded or citekey in self._table
+
+    def __iter__(self):
+        # entries move from the table when decoded, possibly while iterating
+        return iter(list(self._decoded) + list(self._table))
+
+    def __len__(self):
+        return len(self._decoded) + len(self._table)
+
+    def timestamp(self, citekey):
+        """Timestamp of an entry, without decoding it."""
+        if citekey in self._table:
+            return self._table[citekey][2]
+        return self._decoded[citekey].timestamp
+
+    def records(self):
+        """Yield (citekey, record, timestamp), records of decoded entries
+        being encoded again."""
+        for citekey, entry in self._decoded.items():
+            yield citekey, pickle.dumps(entry), entry.timestamp
+        for citekey, (offset, size, timestamp) in self._table.items():
+            yield citekey, self._record(offset, size), timestamp
+
+    def _record(self, offset, size):
+        offset += self._start
+        return self._buffer[offset:offset + size]
+
+
+def encode(header, entries):
+    """Encode entries (a dictionary or `IndexedEntries`), with a header
+    dictionary to which the table is added."""
+    if not isinstance(entries, IndexedEntries):
+        entries = IndexedEntries(entries)
+    table, records, offset = {}, [], 0
+    for citekey, record, timestamp in entries.records():
+        table[citekey] = (offset, len(record), timestamp)
+        records.append(record)
+        offset += len(record)
+    header = pickle.dumps(dict(header, table=table))
+    return b''.join([MAGIC, _SIZE.pack(len(header)), header] + records)
+
+
+def decode(buffer):
+    """Decode the header of a cache, and return it with the entries.
+
+    :param buffer:  bytes, or a memory map of the cache file.
+    :raises ValueError:  if the buffer is not in this format.
+    """
+    start = len(MAGIC) + _SIZE.size
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not an indexed cache.')
+    size, = _SIZE.unpack(buffer[len(MAGIC):start])
+    header = pickle.loads(buffer[start:start + size])
+    table = header.pop('table')
+    return header, IndexedEntries(buffer=buffer, table=table, start=start + size)
@@ -2,6 +2,33 @@
 or help messages.
 """
 
+import argparse
+
+
+def non_negative_int(value):
+    """Type of the arguments counting papers (e.g. `list --limit`)."""
+    try:
+        count = int(value)
+    except ValueError:
+        count = -1
+    if count < 0:
+        raise argparse.ArgumentTypeError(
+            'invalid value: {} (0 or more expected)'.format(value))
+    return count
+
+
+def jobs_count(value):
+    """Type of the --jobs arguments: a number of processes, 0 for one
+    per CPU."""
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = -1
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(
+            'invalid number of jobs: {} (0 or more expected)'.format(value))
+    return jobs
+
 
 def add_doc_copy_arguments(parser, copy=True):
     doc_add_group = parser.add_mutually_exclusive_group()
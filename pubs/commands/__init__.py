@@ -1,20 +1 @@
-# core
-from . import init_cmd
-from . import conf_cmd
-
-from . import add_cmd
-from . import rename_cmd
-from . import remove_cmd
-from . import list_cmd
-from . import edit_cmd
-from . import tag_cmd
-from . import statistics_cmd
-# doc
-from . import doc_cmd
-from . import note_cmd
-# bulk
-from . import export_cmd
-from . import import_cmd
-# bonus
-from . import websearch_cmd
-from . import url_cmd
+# Modules of the commands are imported on demand, see `pubs_cmd.CORE_CMDS`.
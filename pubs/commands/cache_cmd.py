@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+
+import time
+
+from .. import repo
+from ..uis import get_ui
+from ..command_utils import jobs_count
+
+
+# cache --- rebuild [-j|--jobs N] [-a|--all]
+
+def parser(subparsers, conf):
+    cache_parser = subparsers.add_parser(
+        'cache',
+        help='manage the caches of the repository')
+    cache_subparsers = cache_parser.add_subparsers(
+        title='cache actions', dest='action',
+        help='actions on the caches')
+    cache_subparsers.required = True
+
+    rebuild_parser = cache_subparsers.add_parser(
+        'rebuild', help='decode the outdated cache entries in parallel',
+        description=('Decode the bibtex and metadata of the papers whose cache '
+                     'entry is missing or outdated (e.g. after a pull of the '
+                     'repository), in parallel, and save the caches.'))
+    rebuild_parser.add_argument(
+        '-j', '--jobs', type=jobs_count, default=0,
+        help='number of processes decoding entries (default: one per CPU)')
+    rebuild_parser.add_argument(
+        '-a', '--all', action='store_true', default=False,
+        help='decode all entries, even up to date ones')
+    return cache_parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    rp = repo.Repository(conf)
+
+    if args.action == 'rebuild':
+        start = time.time()
+        count = rp.databroker.rebuild(jobs=args.jobs, force=args.all)
+        rp.databroker.search_index(rp.citekeys)
+        rp.databroker.flush_cache(force=True)
+        duration = time.time() - start
+        ui.message('{} cache entr{} rebuilt in {:.1f}s ({:.0f} entries/s).'.format(
+            count, 'ies' if count != 1 else 'y', duration,
+            count / max(duration, 1e-3)))
+
+    rp.close()
@@ -15,6 +15,7 @@ from ..completion import CiteKeyCompletion
 #       +- remove $key [$key [...]] [-f|--force]
 #       +- export $key [$path]
 #       +- open $key [-w|--with $cmd]
+#       +- dedup [-r|--report]
 # supplements attach, open
 
 def parser(subparsers, conf):
@@ -59,13 +60,32 @@ def parser(subparsers, conf):
                              ).completer = CiteKeyCompletion(conf)
     open_parser.add_argument('-w', '--with', dest='cmd', help='command to open the file with')
 
+    dedup_parser = doc_subparsers.add_parser(
+        'dedup', help='store each document once, and report the space saved',
+        description=('Store the content of each document of the repository once, '
+                     'under doc/objects/ (by hash), documents being hard links to '
+                     'their content. Documents added, renamed or added again are '
+                     'then not copied. Reports the space saved. Documents with the '
+                     'same content are then the same file: editing one in place '
+                     '(e.g. annotating a PDF) changes the others too.'))
+    dedup_parser.add_argument('-r', '--report', action='store_true', default=False,
+                              help='only report the space used by the documents')
+
     return doc_parser
 
 
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024.
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(size)
+
+
 def command(conf, args):
 
     ui = get_ui()
-    rp = repo.Repository(conf)
+    rp = repo.Repository(conf, shared=getattr(args, 'report', False))
 
     # print(args)
     # ui.exit()
@@ -167,4 +187,12 @@ def command(conf, args):
             ui.error("Command does not exist: %s." % with_command)
             ui.exit(127)
 
+    elif args.action == 'dedup':
+        if not args.report:
+            rp.databroker.deduplicate_docs()
+        count, size, used = rp.databroker.docs_usage()
+        ui.message('{} document{}, {} ({} on disk): deduplication saves {}.'.format(
+            count, 's' if count != 1 else '', _format_size(size), _format_size(used),
+            _format_size(size - used)))
+
     rp.close()
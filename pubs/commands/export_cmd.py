@@ -40,24 +40,25 @@ def command(conf, args):
     # :param bib_format (only 'bibtex' now)
 
     ui = get_ui()
-    rp = repo.Repository(conf)
+    rp = repo.Repository(conf, shared=True)
 
-    papers = []
+    # Entries are written as they are encoded, in the order of citekeys
+    # (as bibtexparser sorts them).
     if len(args.citekeys) < 1:
-        papers = rp.all_papers()
+        papers = rp.all_papers(sort=True)
     else:
-        for key in resolve_citekey_list(rp, conf, args.citekeys, ui=ui, exit_on_fail=True):
-            papers.append(rp.pull_paper(key))
+        keys = resolve_citekey_list(rp, conf, args.citekeys, ui=ui, exit_on_fail=True)
+        papers = (rp.pull_paper(key) for key in sorted(set(keys)))
 
-    bib = {}
-    for p in papers:
-        bib[p.citekey] = p.bibdata
+    exporter = endecoder.EnDecoder()
 
-    # exclude bibtex fields if specified
-    remove_bibtex_fields(bib, conf['main']['exclude_bibtex_fields'])
+    def encoded_entries():
+        for p in papers:
+            bib = {p.citekey: dict(p.bibdata)}
+            # exclude bibtex fields if specified
+            remove_bibtex_fields(bib, conf['main']['exclude_bibtex_fields'])
+            yield exporter.encode_bibdata(bib, args.ignore_fields)
 
-    exporter = endecoder.EnDecoder()
-    bibdata_raw = exporter.encode_bibdata(bib, args.ignore_fields)
-    ui.message(bibdata_raw)
+    ui.message_lines(encoded_entries())
 
     rp.close()
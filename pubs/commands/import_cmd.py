@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
 import os
+import time
 import datetime
+import itertools
 
 from .. import repo
 from .. import endecoder
@@ -10,14 +12,19 @@ from .. import color
 from .. import content
 from ..paper import Paper
 from ..uis import get_ui
-from ..content import system_path, read_text_file
+from ..content import system_path, read_text_file, read_text_lines
 from ..utils import remove_bibtex_fields
-from ..command_utils import add_doc_copy_arguments
+from ..command_utils import add_doc_copy_arguments, jobs_count
 
 
 _ABORT_USE_IGNORE_MSG = " Aborting import. Use --ignore-malformed to ignore."
 _IGNORING_MSG = " Ignoring it."
 
+# With --jobs, large files are split in chunks of this many entries decoded
+# in parallel. Papers are pushed to the repository in batches.
+CHUNK_SIZE = 500
+BATCH_SIZE = 1000
+
 
 def parser(subparsers, conf):
     parser = subparsers.add_parser(
@@ -37,22 +44,61 @@ def parser(subparsers, conf):
     parser.add_argument(
         '-i', '--ignore-malformed', action='store_true', default=False,
         help="ignore malformed and unreadable files and entries.")
+    parser.add_argument(
+        '-j', '--jobs', type=jobs_count, default=1,
+        help=("number of processes decoding bibtex files in parallel "
+              "(default: 1; 0 for one per CPU)."))
     add_doc_copy_arguments(parser, copy=False)
     return parser
 
 
-def many_from_path(ui, bibpath, exclude_bibtex_fields=[], ignore=False):
+def _decode_chunk(bibstr, decoder):
+    """Decode a chunk of bibtex data into a list of (citekey, entry | error).
+
+    Runs in the worker processes, if any.
+    """
+    coder = endecoder.EnDecoder(decoder=decoder)
+    return list(coder.decode_bibentries(bibstr.splitlines(True)))
+
+
+def _decode_files(files, jobs=1):
+    """Yield (filepath, citekey, entry | error) for the entries of the files.
+
+    With a single job, files are read and decoded incrementally. Otherwise
+    they are split in chunks decoded by `jobs` processes.
+    """
+    if jobs == 1:
+        coder = endecoder.EnDecoder()
+        for filepath in files:
+            for citekey, entry in coder.decode_bibentries(read_text_lines(filepath)):
+                yield filepath, citekey, entry
+        return
+    chunks, chunk_files = [], []
+    for filepath in files:
+        file_chunks = endecoder.split_bibdata(read_text_file(filepath), CHUNK_SIZE)
+        chunks.extend(file_chunks)
+        chunk_files.extend([filepath] * len(file_chunks))
+    decoders = itertools.repeat(endecoder.get_decoder())
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs or None) as executor:
+        decoded = executor.map(_decode_chunk, chunks, decoders)
+        for filepath, entries in zip(chunk_files, decoded):
+            for citekey, entry in entries:
+                yield filepath, citekey, entry
+
+
+def many_from_path(ui, bibpath, exclude_bibtex_fields=[], ignore=False, jobs=1,
+                   keys=None):
     """Extract list of papers found in bibliographic files in path.
 
     The behavior is to:
         - ignore wrong entries,
         - overwrite duplicated entries.
-    :returns: dictionary of (key, paper | exception)
-        if loading of entry failed, the excpetion is returned in the
-        dictionary in place of the paper
+    Files are decoded entry by entry, or split in chunks decoded in
+    parallel by `jobs` processes (0 for one per CPU). If `keys` is given,
+    only these entries are kept.
+    :returns: dictionary of (key, paper)
     """
-    coder = endecoder.EnDecoder()
-
     bibpath = system_path(bibpath)
     if os.path.isdir(bibpath):
         all_files = [os.path.join(bibpath, f) for f in os.listdir(bibpath)
@@ -60,36 +106,35 @@ def many_from_path(ui, bibpath, exclude_bibtex_fields=[], ignore=False):
     else:
         all_files = [bibpath]
 
-    biblist = []
-    for filepath in all_files:
-        try:
-            bibentry = coder.decode_bibdata(read_text_file(filepath))
-            # exclude bibtex fields if specified
-            remove_bibtex_fields(bibentry, exclude_bibtex_fields)
-            biblist.append(bibentry)
-        except coder.BibDecodingError:
-            error = "Could not parse bibtex at {}.".format(filepath)
-            if ignore:
-                ui.warning(error + _IGNORING_MSG)
-            else:
-                ui.error(error + _ABORT_USE_IGNORE_MSG)
-                ui.exit()
+    def fail(error):
+        if ignore:
+            ui.warning(error + _IGNORING_MSG)
+        else:
+            ui.error(error + _ABORT_USE_IGNORE_MSG)
+            ui.exit()
 
     papers = {}
-    for b in biblist:
-        for k, b in b.items():
-            if k in papers:
-                ui.warning('Duplicated citekey {}. Keeping the last one.'.format(k))
-            try:
-                papers[k] = Paper(k, b)
-                papers[k].added = datetime.datetime.now()
-            except ValueError as e:
-                error = 'Could not load entry for citekey {} ({}).'.format(k, e)
-                if ignore:
-                    ui.warning(error + _IGNORING_MSG)
-                else:
-                    ui.error(error + _ABORT_USE_IGNORE_MSG)
-                    ui.exit()
+    empty_files = set(all_files)
+    for filepath, k, b in _decode_files(all_files, jobs=jobs):
+        empty_files.discard(filepath)
+        if isinstance(b, Exception):
+            fail('Could not parse entry {} in {}.'.format(
+                 k or '(unknown citekey)', filepath))
+            continue
+        if keys is not None and k not in keys:
+            continue
+        if k in papers:
+            ui.warning('Duplicated citekey {}. Keeping the last one.'.format(k))
+        # exclude bibtex fields if specified
+        remove_bibtex_fields({k: b}, exclude_bibtex_fields)
+        try:
+            papers[k] = Paper(k, b)
+            papers[k].added = datetime.datetime.now()
+        except ValueError as e:
+            fail('Could not load entry for citekey {} ({}).'.format(k, e))
+    for filepath in all_files:
+        if filepath in empty_files:
+            fail("Could not parse bibtex at {}.".format(filepath))
     return papers
 
 
@@ -102,30 +147,42 @@ def command(conf, args):
     bibpath = args.bibpath
     doc_import = args.doc_copy or 'copy'
 
+    start = time.time()
     rp = repo.Repository(conf)
     # Extract papers from bib
     papers = many_from_path(ui, bibpath,
         exclude_bibtex_fields=conf['main']['exclude_bibtex_fields'],
-        ignore=args.ignore_malformed)
-    keys = args.keys or papers.keys()
+        ignore=args.ignore_malformed, jobs=args.jobs, keys=args.keys or None)
+    keys = args.keys or list(papers.keys())
     for k in keys:
-        p = papers[k]
-        try:
-            rp.push_paper(p, overwrite=args.overwrite)
-        except repo.CiteKeyCollision:
-            ui.warning("{} already in repository, use '-O' to overwrite".format(
-                    color.dye_out(p.citekey, 'citekey')
+        if k not in papers:
+            ui.warning('No entry found for citekey {}.'.format(k))
+    keys = [k for k in keys if k in papers]
+    imported = 0
+    for i in range(0, len(keys), BATCH_SIZE):
+        batch = [papers[k] for k in keys[i:i + BATCH_SIZE]]
+        collisions = set(p.citekey for p in
+                         rp.push_papers(batch, overwrite=args.overwrite))
+        for p in batch:
+            if p.citekey in collisions:
+                ui.warning("{} already in repository, use '-O' to overwrite".format(
+                        color.dye_out(p.citekey, 'citekey')
+                    )
                 )
-            )
-            continue
-        ui.info('{} imported.'.format(color.dye_out(p.citekey, 'citekey')))
-        docfile = bibstruct.extract_docfile(p.bibdata)
-        if docfile is None:
-            ui.warning("No file for {}.".format(p.citekey))
-        else:
-            rp.push_doc(p.citekey, docfile,
-                        copy=(doc_import in ('copy', 'move')))
-            if doc_import == 'move' and content.content_type(docfile) != 'url':
-                content.remove_file(docfile)
+                continue
+            imported += 1
+            ui.info('{} imported.'.format(color.dye_out(p.citekey, 'citekey')))
+            docfile = bibstruct.extract_docfile(p.bibdata)
+            if docfile is None:
+                ui.warning("No file for {}.".format(p.citekey))
+            else:
+                rp.push_doc(p.citekey, docfile,
+                            copy=(doc_import in ('copy', 'move')))
+                if doc_import == 'move' and content.content_type(docfile) != 'url':
+                    content.remove_file(docfile)
 
     rp.close()
+    duration = time.time() - start
+    ui.info('{} paper{} imported in {:.1f}s ({:.0f} papers/s).'.format(
+        imported, 's' if imported != 1 else '', duration,
+        imported / max(duration, 1e-3)))
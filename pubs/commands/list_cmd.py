@@ -1,11 +1,14 @@
 from __future__ import unicode_literals
 
+import heapq
 from datetime import datetime
 
 from .. import repo
 from .. import pretty
+from .. import timings
 from ..uis import get_ui
 from ..query import get_paper_filter, QUERY_HELP
+from ..command_utils import non_negative_int
 
 
 def parser(subparsers, conf):
@@ -28,6 +31,14 @@ def parser(subparsers, conf):
     parser.add_argument('--no-docs', action='store_true',
                         dest='nodocs', default=False,
                         help='list only pubs without attached documents.')
+    parser.add_argument('-r', '--reverse', action='store_true', default=False,
+                        help=('reverse the order (most recent first, by default), '
+                              'before --limit and --offset apply: with -r, '
+                              '-n N lists the last N papers.'))
+    parser.add_argument('-n', '--limit', type=non_negative_int, default=None, metavar='N',
+                        help='list at most N papers.')
+    parser.add_argument('--offset', type=non_negative_int, default=0, metavar='N',
+                        help='skip the first N papers.')
     parser.add_argument('query', nargs='*',
                         help=QUERY_HELP)
     return parser
@@ -37,24 +48,53 @@ def date_added(p):
     return p.added or datetime(1, 1, 1)
 
 
+# Sort keys; the citekey breaks ties, so that pages (see --offset) are
+# consistent between calls.
+
+def _added_key(p):
+    return date_added(p), p.citekey
+
+
+def _citekey_key(p):
+    return p.citekey
+
+
+def _year_key(p):
+    return 'year' not in p.bibdata, p.bibdata.get('year'), date_added(p), p.citekey
+
+
+def select_papers(papers, key, offset=0, limit=None, reverse=False):
+    """Return the papers sorted by key, from offset, and at most limit of them.
+
+    With a limit, only offset + limit papers are kept, in a heap, rather than
+    sorting all of them.
+    """
+    if limit is None:
+        return sorted(papers, key=key, reverse=reverse)[offset:]
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return select(offset + limit, papers, key=key)[offset:]
+
+
 def command(conf, args):
     ui = get_ui()
-    rp = repo.Repository(conf)
-    papers = filter(get_paper_filter(args.query,
-                                     case_sensitive=args.case_sensitive,
-                                     strict=args.strict),
-                    rp.all_papers())
+    rp = repo.Repository(conf, shared=True)
+    papers = rp.filter_papers(get_paper_filter(args.query,
+                                               case_sensitive=args.case_sensitive,
+                                               strict=args.strict))
     if args.nodocs:
-        papers = [p for p in papers if p.docpath is None]
+        papers = (p for p in papers if p.docpath is None)
     if args.alphabetical:
-        papers = sorted(papers, key=lambda p: p.citekey)
+        key = _citekey_key
     elif args.chronological:
-        papers = sorted(papers, key=lambda p: ('year' not in p.bibdata, p.bibdata.get('year'), date_added))
+        key = _year_key
     else:
-        papers = sorted(papers, key=date_added)
-    if len(papers) > 0:
-        ui.message('\n'.join(
+        key = _added_key
+    with timings.phase('filter'):
+        papers = select_papers(papers, key, offset=args.offset,
+                               limit=args.limit, reverse=args.reverse)
+    with timings.phase('render'):
+        ui.message_lines(
             pretty.paper_oneliner(p, citekey_only=args.citekeys, max_authors=conf['main']['max_authors'])
-            for p in papers))
+            for p in papers)
 
     rp.close()
@@ -38,12 +38,13 @@ def command(conf, args):
         sure = ui.input_yn(question=are_you_sure, default='n')
     if force or sure:
         failed = False  # Whether something failed
-        for c in keys:
-            try:
-                rp.remove_paper(c)
-            except Exception as e:
-                ui.error(ustr(e))
-                failed = True
+        with rp.batch():
+            for c in keys:
+                try:
+                    rp.remove_paper(c)
+                except Exception as e:
+                    ui.error(ustr(e))
+                    failed = True
         if failed:
             ui.exit()  # Exit with nonzero error code
         else:
@@ -56,3 +57,5 @@ def command(conf, args):
         ui.message('The publication{} {} were {} removed'.format(plural,
             ', '.join([color.dye_out(c, 'citekey') for c in keys]),
             color.dye_out('not','bold')))
+
+    rp.close()
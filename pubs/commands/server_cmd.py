@@ -0,0 +1,43 @@
+from __future__ import unicode_literals
+
+from .. import server
+from ..uis import get_ui
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'server',
+        help='keep the repository loaded, to run commands faster',
+        description=('Run a server, in the foreground, keeping the repository '
+                     'loaded between commands. While it runs, the {} commands '
+                     'are run by the server.'.format(', '.join(server.SERVED_CMDS))))
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--stop', action='store_true', default=False,
+                       help='stop the running server')
+    group.add_argument('--status', action='store_true', default=False,
+                       help='show whether the server is running')
+    parser.add_argument('--interval', type=float, default=server.POLL_INTERVAL,
+                        metavar='SECONDS',
+                        help='delay between two checks of the files of the '
+                             'repository (default: %(default)s)')
+    return parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+
+    if args.stop:
+        if not server.stop(conf.filename):
+            ui.message('No pubs server is running.')
+    elif args.status:
+        if server.is_running(conf.filename):
+            ui.message('A pubs server is running on {}.'.format(
+                server.socket_path(conf.filename)))
+        else:
+            ui.message('No pubs server is running.')
+    else:
+        try:
+            server.Server(conf, conf.filename, interval=args.interval).serve(ui)
+        except KeyboardInterrupt:
+            pass
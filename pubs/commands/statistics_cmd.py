@@ -3,6 +3,10 @@ from ..uis import get_ui
 from .. import color
 
 
+# number of tags shown, by decreasing number of papers
+TOP_TAGS = 10
+
+
 def parser(subparsers, conf):
     parser = subparsers.add_parser(
         'statistics',
@@ -12,7 +16,7 @@ def parser(subparsers, conf):
 
 def command(conf, args):
     ui = get_ui()
-    rp = Repository(conf)
+    rp = Repository(conf, shared=True)
     papers = list(rp.all_papers())
 
     paper_count = len(papers)
@@ -21,7 +25,8 @@ def command(conf, args):
 
     else:
         doc_count = sum([0 if p.docpath is None else 1 for p in papers])
-        tag_count = len(list(rp.get_tags()))
+        tag_counts = rp.tag_counts()
+        tag_count = len(tag_counts)
         papers_with_tags = sum([1 if p.tags else 0 for p in papers])
 
         ui.message(color.dye_out('Repository statistics:', 'bold'))
@@ -35,3 +40,10 @@ def command(conf, args):
             color.dye_out('{:d}'.format(papers_with_tags), 'bold'),
             '{:.0f}%'.format(100. * papers_with_tags / paper_count),
         ))
+        if tag_count > 0:
+            top_tags = sorted(tag_counts.items(), key=lambda tc: (-tc[1], tc[0]))
+            ui.message('Most used tags: {}'.format(', '.join(
+                '{} ({})'.format(color.dye_out(tag, 'tag'), count)
+                for tag, count in top_tags[:TOP_TAGS])))
+
+    rp.close()
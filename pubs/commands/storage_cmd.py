@@ -0,0 +1,52 @@
+from __future__ import unicode_literals
+
+from .. import config
+from .. import color
+from .. import lock
+from ..uis import get_ui
+from ..databroker import STORAGES, convert_storage, destroy_storage
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'storage',
+        help='show or convert the storage of the repository',
+        description=('Without argument, show how the bibtex and metadata of '
+                     'the repository are stored. With one, convert the '
+                     'repository to this storage and update the configuration.'))
+    parser.add_argument('storage', nargs='?', default=None,
+                        choices=sorted(STORAGES),
+                        help='storage to convert the repository to')
+    return parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    current = conf['main']['storage']
+
+    if args.storage is None:
+        ui.message(current)
+    elif args.storage == current:
+        ui.message('The repository is already stored as {}.'.format(current))
+    else:
+        pubsdir = conf['main']['pubsdir']
+        repo_lock = lock.get_lock(pubsdir)
+        if repo_lock is not None:
+            repo_lock.acquire(timeout=conf['main']['lock_timeout'])
+        try:
+            convert_storage(pubsdir, current, args.storage)
+            # the source is only removed once the configuration points to
+            # the converted repository
+            try:
+                conf['main']['storage'] = args.storage
+                config.save_conf(conf)
+            except BaseException:
+                destroy_storage(pubsdir, args.storage)
+                raise
+            destroy_storage(pubsdir, current)
+        finally:
+            if repo_lock is not None:
+                repo_lock.release()
+        ui.message('The repository was converted from {} to {}.'.format(
+            color.dye_out(current, 'bold'), color.dye_out(args.storage, 'bold')))
@@ -15,27 +15,47 @@ The different use cases are :
     If 'math' is not a citekey, then display all papers with the tag 'math'
 7. > pubs tag -war+math+romance
     display all papers with the tag 'math', 'romance' but not 'war'
+8. > pubs tag citekey1 citekey2 citekey3 math-war
+    Add 'math' and remove 'war' for each of the given citekeys
+9. > pubs tag --query author:turing year:1950 math-war
+    Add 'math' and remove 'war' for each paper matching the query (see `pubs list`)
+
+Papers are modified as a single batch: only those whose tags change are
+written, and they are committed at once by the git plugin.
 """
 from __future__ import unicode_literals
 
 import re
+import collections
 
 from ..repo import Repository
 from ..uis import get_ui
 from .. import pretty
 from .. import color
-from ..utils import resolve_citekey
+from ..utils import resolve_citekey, resolve_citekey_list
+from ..query import get_paper_filter
 from ..completion import CiteKeyOrTagCompletion, TagModifierCompletion
 from ..events import TagEvent
 
 
 def parser(subparsers, conf):
     parser = subparsers.add_parser('tag', help="add, remove and show tags")
+    parser.add_argument('-q', '--query', action='store_true', default=False,
+                        help='modify the tags of the papers matching a query, '
+                             'made of the arguments before the tags.')
+    parser.add_argument('-i', '--ignore-case', action='store_false',
+                        default=None, dest='case_sensitive')
+    parser.add_argument('-I', '--force-case', action='store_true',
+                        dest='case_sensitive')
+    parser.add_argument('--strict', action='store_true', default=False,
+                        help='force strict unicode comparison of query')
     parser.add_argument('citekeyOrTag', nargs='?', default=None,
                         help='citekey or tag.').completer = CiteKeyOrTagCompletion(conf)
-    parser.add_argument('tags', nargs='?', default=None,
+    parser.add_argument('tags', nargs='*', default=[],
                         help='If the previous argument was a citekey, then '
-                             'a list of tags separated by + and -.'
+                             'a list of tags separated by + and -. With several '
+                             'arguments, the last one is the list of tags, and '
+                             'the others are citekeys (or a query, with --query).'
                         ).completer = TagModifierCompletion(conf)
     # TODO find a way to display clear help for multiple command semantics,
     #      indistinguisable for argparse. (fabien, 201306)
@@ -77,16 +97,54 @@ def _tag_groups(tags):
     return set(plus_tags), set(minus_tags)
 
 
+def _modify_tags(rp, papers, tags):
+    """Apply a list of tags separated by + and - to papers, as a batch.
+    Only the papers whose tags change are pushed.
+
+    :returns:  the number of papers changed.
+    """
+    add_tags, remove_tags = _tag_groups(_parse_tag_seq(tags))
+    changed = 0
+    with rp.batch():
+        for p in papers:
+            old_tags = set(p.tags)
+            for tag in add_tags:
+                p.add_tag(tag)
+            for tag in remove_tags:
+                p.remove_tag(tag)
+            if p.tags != old_tags:
+                rp.push_metadata(p, event=False)
+                rp.send_event(TagEvent(p.citekey))
+                changed += 1
+    return changed
+
+
 def command(conf, args):
     """Add, remove and show tags"""
 
     ui = get_ui()
     citekeyOrTag = args.citekeyOrTag
-    tags = args.tags
+    tags = args.tags[-1] if args.tags else None
 
-    rp = Repository(conf)
+    rp = Repository(conf, shared=tags is None)
 
-    if citekeyOrTag is None:
+    if args.query or len(args.tags) > 1:
+        if tags is None:
+            ui.error('A list of tags is expected after the query.')
+            ui.exit()
+        targets = [citekeyOrTag] + args.tags[:-1]
+        if args.query:
+            papers = list(rp.filter_papers(get_paper_filter(
+                targets, case_sensitive=args.case_sensitive, strict=args.strict)))
+        else:
+            citekeys = resolve_citekey_list(rp, conf, targets, ui=ui, exit_on_fail=True)
+            # a paper given twice is only counted once
+            papers = [rp.pull_paper(citekey) for citekey
+                      in collections.OrderedDict.fromkeys(citekeys)]
+        changed = _modify_tags(rp, papers, tags)
+        ui.info('Tags of {} paper{} updated ({} matching).'.format(
+            changed, 's' if changed != 1 else '', len(papers)))
+    elif citekeyOrTag is None:
         ui.message(color.dye_out(', '.join(sorted(rp.get_tags())), 'tag'))
     else:
         not_citekey = False
@@ -99,13 +157,7 @@ def command(conf, args):
             if tags is None:
                 ui.message(color.dye_out(', '.join(sorted(p.tags)), 'tag'))
             else:
-                add_tags, remove_tags = _tag_groups(_parse_tag_seq(tags))
-                for tag in add_tags:
-                    p.add_tag(tag)
-                for tag in remove_tags:
-                    p.remove_tag(tag)
-                rp.push_paper(p, overwrite=True, event=False)
-                TagEvent(citekeyOrTag).send()
+                _modify_tags(rp, [p], tags)
         elif tags is not None:
             ui.error(ui.error('No entry found for citekey {}.'.format(citekeyOrTag)))
             ui.exit()
@@ -113,13 +165,10 @@ def command(conf, args):
             ui.info('Assuming {} to be a tag.'.format(color.dye_out(citekeyOrTag)))
             # case where we want to find papers with specific tags
             included, excluded = _tag_groups(_parse_tag_seq(citekeyOrTag))
-            papers_list = []
-            for p in rp.all_papers():
-                if (p.tags.issuperset(included) and
-                    len(p.tags.intersection(excluded)) == 0):
-                    papers_list.append(p)
+            papers_list = [rp.pull_paper(citekey) for citekey in
+                           rp.tagged_citekeys(included, excluded)]
 
             ui.message('\n'.join(pretty.paper_oneliner(p, max_authors=conf['main']['max_authors'])
                                  for p in papers_list))
 
-        rp.close()
+    rp.close()
@@ -14,7 +14,64 @@ except ImportError:
 
     argcomplete = FakeModule()
 
-from . import repo
+
+# Name of the completion index in the cache of the repository. It lists the
+# citekeys of the papers, with their tags, one paper per line:
+#     citekey<TAB>tag1<TAB>tag2...
+# after a first line <TAB>stamp, the metadata stamp of the storage when it
+# was written. It is maintained by `datacache.DataCache`, and read by the
+# completers without loading the repository (nor its slow dependencies).
+INDEX_NAME = 'completion'
+
+
+def paper_tags(metadata):
+    """Return the tags of a paper, from its raw metadata."""
+    return set((metadata or {}).get('tags') or [])
+
+
+def encode_index(index, stamp):
+    """Encode the completion index.
+
+    :param index:  dictionary associating citekeys to sets of tags.
+    :param stamp:  metadata stamp of the storage (see
+                   `filebroker.FileBroker.metadata_stamp`).
+    """
+    lines = ['\t' + stamp] + ['\t'.join([citekey] + sorted(tags))
+                               for citekey, tags in sorted(index.items())]
+    return '\n'.join(lines).encode('utf-8')
+
+
+def decode_index(data):
+    """Return (stamp, index), stamp being None if not recorded."""
+    stamp, index = None, {}
+    for line in data.decode('utf-8').split('\n'):
+        if line.startswith('\t'):
+            stamp = line[1:]
+        elif line:
+            fields = line.split('\t')
+            index[fields[0]] = set(fields[1:])
+    return stamp, index
+
+
+def pull_index(conf):
+    """Read the completion index of the repository.
+
+    Only the module of the storage of the repository is imported.
+    :raise IOError:  if the index does not exist, or is outdated (the
+                     metadata was changed since, e.g. by a git pull).
+    """
+    if conf['main']['storage'] == 'sqlite':
+        from .sqlitebroker import SQLiteBroker as Broker
+    else:
+        from .filebroker import FileBroker as Broker
+    broker = Broker(conf['main']['pubsdir'])
+    try:
+        stamp, index = decode_index(broker.pull_cachefile(INDEX_NAME))
+        if stamp != broker.metadata_stamp():
+            raise IOError('Outdated completion index.')
+    finally:
+        broker.close()
+    return index
 
 
 def autocomplete(parser):
@@ -32,19 +89,34 @@ class BaseCompleter(object):
         except Exception as e:
             argcomplete.warn(e)
 
+    def _index(self):
+        try:
+            return pull_index(self.conf)
+        except IOError:  # no index or outdated, rebuilt from the repository
+            from . import repo
+            rp = repo.Repository(self.conf, shared=True)
+            try:
+                return rp.databroker.rebuild_completion()
+            finally:
+                rp.close()
+
+    def _citekeys(self):
+        return set(self._index())
+
+    def _tags(self):
+        return set().union(*self._index().values())
+
 
 class CiteKeyCompletion(BaseCompleter):
 
     def _complete(self, **kwargs):
-        rp = repo.Repository(self.conf)
-        return rp.citekeys
+        return self._citekeys()
 
 
 class CiteKeyOrTagCompletion(BaseCompleter):
 
     def _complete(self, **kwargs):
-        rp = repo.Repository(self.conf)
-        return rp.citekeys.union(rp.get_tags())
+        return self._citekeys().union(self._tags())
 
 
 class TagModifierCompletion(BaseCompleter):
@@ -52,7 +124,7 @@ class TagModifierCompletion(BaseCompleter):
     regxp = r"[^:+-]*$"  # prefix of tag after last separator
 
     def _complete(self, prefix, **kwargs):
-        tags = repo.Repository(self.conf).get_tags()
+        tags = self._tags()
         start, _ = re.search(self.regxp, prefix).span()
         partial_expr = prefix[:start]
         t_prefix = prefix[start:]
@@ -6,6 +6,29 @@ configspec = """
 # Where the pubs repository files (bibtex, metadata, notes) are located
 pubsdir = string(default='~/pubs')
 
+# How the bibtex and metadata of the papers are stored in pubsdir: 'files'
+# stores them in the bib/ and meta/ directories, one file per paper;
+# 'sqlite' stores them in a single SQLite database (pubs.sqlite), which is
+# faster with large repositories. Use `pubs storage` to convert an existing
+# repository rather than changing this value directly.
+storage = option('files', 'sqlite', default='files')
+
+# Files are always written aside and then renamed, so that an interrupted
+# command can't leave them half-written. If true, the files written by a
+# command are also synced to disk at its end (with one fsync per file and
+# directory), so that they survive a system crash. With the 'sqlite' storage,
+# writes are transactions of the database.
+sync_writes = boolean(default=False)
+
+# How long (in seconds) to wait for another pubs process using the
+# repository: commands modifying it wait for all others to finish, and
+# commands only reading it wait for those modifying it.
+lock_timeout = float(default=30)
+
+# Which engine decodes bibtex data: 'bibtexparser', or 'fast' for pubs' own
+# tokenizer, several times faster, which produces the same entries.
+bibtex_decoder = option('bibtexparser', 'fast', default='bibtexparser')
+
 # Where the documents files are located (default: $(pubsdir)/doc/)
 docsdir = string(default="docsdir://")
 
@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
 
+import io
 import sys
 import os
+import mmap
 import shutil
+import hashlib
 
 from .p3 import urlparse, HTTPConnection, urlopen
 
@@ -83,6 +86,17 @@ def read_text_file(filepath, fail=True):
     return content
 
 
+def read_text_lines(filepath, fail=True):
+    """Yield the lines of a text file, read incrementally."""
+    check_file(filepath, fail=fail)
+    try:
+        with _open(filepath, 'r') as f:
+            for line in f:
+                yield line
+    except UnicodeDecodeError:
+        raise UnableToDecodeTextFile(filepath)
+
+
 def read_binary_file(filepath, fail=True):
     check_file(filepath, fail=fail)
     with _open(filepath, 'rb') as f:
@@ -90,6 +104,23 @@ def read_binary_file(filepath, fail=True):
     return content
 
 
+def map_binary_file(filepath, fail=True):
+    """Return the content of a file as a read-only memory map, or as bytes
+    if it can't be mapped (empty file, or file without an OS descriptor).
+
+    The map stays valid when the file is replaced by a rename, but not if
+    the file is modified in place.
+    """
+    check_file(filepath, fail=fail)
+    with _open(filepath, 'rb') as f:
+        if isinstance(f, io.BufferedReader) and os.name == 'posix':
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                pass
+        return f.read()
+
+
 def remove_file(filepath):
     check_file(filepath)
     os.remove(filepath)
@@ -100,14 +131,77 @@ def write_file(filepath, data, mode='w'):
 
     Data should be unicode except when binary mode is selected,
     in which case data is expected to be binary.
+    Unless appending, the file is not modified in place: data is written
+    to a temporary file, which then replaces it.
     """
     check_directory(os.path.dirname(filepath))
     if 'b' not in mode and sys.version_info < (3,):
         # _open returns in binary mode for python2
         # Data must be encoded
         data = data.encode('utf-8')
-    with _open(filepath, mode) as f:
-        f.write(data)
+    if 'a' in mode:
+        with _open(filepath, mode) as f:
+            f.write(data)
+    else:
+        _replace_file(filepath, data, mode)
+    if _unsynced is not None:
+        _unsynced.add(system_path(filepath))
+
+
+def _replace_file(filepath, data, mode):
+    # a symlink is kept, the file it points to being replaced
+    filepath = os.path.realpath(system_path(filepath))
+    directory, filename = os.path.split(filepath)
+    tmppath = os.path.join(directory, '.{}.{}.tmp'.format(filename, os.getpid()))
+    try:
+        with _open(tmppath, mode) as f:
+            f.write(data)
+        if os.path.exists(filepath):
+            shutil.copymode(filepath, tmppath)
+        os.replace(tmppath, filepath)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+# Files written since `defer_sync`, synced by `sync_written_files`.
+_unsynced = None
+
+
+def defer_sync():
+    """Record the files written from now on, to be synced to disk at once
+    by `sync_written_files`."""
+    global _unsynced
+    _unsynced = set()
+
+
+def sync_written_files():
+    """Sync the files written since `defer_sync` to disk, then their
+    directories (so that renames are durable too), once each."""
+    global _unsynced
+    if not _unsynced:
+        _unsynced = None
+        return
+    directories = set()
+    for path in _unsynced:
+        directories.add(os.path.dirname(path))
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:  # removed since
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    if os.name == 'posix':  # directories can't be opened on Windows
+        for directory in directories:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    _unsynced = None
 
 
 # dealing with formatless content
@@ -182,3 +276,36 @@ def copy_content(source, target, overwrite=False):
         _dump_byte_url_content(source, target)
     else:
         shutil.copy(source, target)
+
+
+def link_content(source, target, overwrite=False):
+    """Make target a hard link to source (same file, no copy), or a copy of
+    source if the file system has no hard links. An existing target is
+    replaced atomically."""
+    source = system_path(source)
+    target = system_path(target)
+    if source == target:
+        return
+    if not overwrite and os.path.exists(target):
+        raise IOError('{} file exists.'.format(target))
+    directory, filename = os.path.split(target)
+    tmppath = os.path.join(directory, '.{}.{}.tmp'.format(filename, os.getpid()))
+    try:
+        try:
+            os.link(source, tmppath)
+        except OSError:  # no hard links, or a stale temporary file
+            shutil.copy(source, tmppath)
+        os.replace(tmppath, target)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+def hash_content(path):
+    """Return the sha256 hexadecimal digest of a file."""
+    digest = hashlib.sha256()
+    with _open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,9 +1,75 @@
 from __future__ import unicode_literals
 
+import io
+
 from . import filebroker
+from . import cachefile
+from . import sqlitebroker
 from . import endecoder
+from . import timings
 from .p3 import pickle
-from . import __version__
+
+
+JOURNAL_EXT = '.journal'
+
+# Version of the structure of the caches, independent from the version of
+# pubs. To be increased when what is stored in the caches changes, along
+# with a migration from the previous version in CACHE_MIGRATIONS if possible.
+# Caches are also discarded when the decoders change (see
+# `endecoder.fingerprint`).
+CACHE_SCHEMA = 1
+
+# Migrations of the caches: CACHE_MIGRATIONS[n](name, data) converts the
+# data of the cache `name` from schema n to n + 1, or raises ValueError.
+# Caches saved before schemas were introduced have schema 0.
+CACHE_MIGRATIONS = {}
+
+
+def migrate_cache(name, data, schema):
+    """Convert the data of a cache to the current schema."""
+    if schema > CACHE_SCHEMA:
+        raise ValueError('Cache saved by a newer version of pubs.')
+    while schema < CACHE_SCHEMA:
+        if schema not in CACHE_MIGRATIONS:
+            raise ValueError('No migration of the cache from schema {}.'.format(schema))
+        data = CACHE_MIGRATIONS[schema](name, data)
+        schema += 1
+    return data
+
+# Backends storing the bib and meta content of the repository, and the caches.
+# See the `storage` option of the configuration.
+STORAGES = {'files': filebroker.FileBroker,
+            'sqlite': sqlitebroker.SQLiteBroker}
+
+
+def convert_storage(pubsdir, source, target):
+    """Copy the bib and meta content of a repository to another storage.
+
+    Content is copied as is, without decoding. The caches are not copied, as
+    they are rebuilt when needed. The source is left as is: it is to be
+    destroyed (see `destroy_storage`) once the configuration points to the
+    target. If the copy fails, the target is destroyed.
+    :param source, target:  keys of `STORAGES`.
+    """
+    source_broker = STORAGES[source](pubsdir)
+    target_broker = STORAGES[target](pubsdir, create=True)
+    try:
+        listing = source_broker.listing(filestats=False)
+        for citekey in listing['metafiles']:
+            target_broker.push_metafile(citekey, source_broker.pull_metafile(citekey))
+        for citekey in listing['bibfiles']:
+            target_broker.push_bibfile(citekey, source_broker.pull_bibfile(citekey))
+    except BaseException:
+        target_broker.destroy()
+        raise
+    finally:
+        source_broker.close()
+    target_broker.close()
+
+
+def destroy_storage(pubsdir, storage):
+    """Remove the bib and meta content of a repository from a storage."""
+    STORAGES[storage](pubsdir).destroy()
 
 
 class DataBroker(object):
@@ -13,8 +79,8 @@ class DataBroker(object):
         Requests are optimistically made, and exceptions are raised if something goes wrong.
     """
 
-    def __init__(self, pubsdir, docsdir, create=False):
-        self.filebroker = filebroker.FileBroker(pubsdir, create=create)
+    def __init__(self, pubsdir, docsdir, create=False, storage='files'):
+        self.filebroker = STORAGES[storage](pubsdir, create=create)
         self.endecoder  = endecoder.EnDecoder()
         self.docbroker  = filebroker.DocBroker(docsdir, scheme='docsdir', subdir='')
         self.notebroker = filebroker.DocBroker(pubsdir, scheme='notesdir', subdir='notes')
@@ -22,43 +88,108 @@ class DataBroker(object):
     # cache
 
     def close(self):
-        pass
+        self.filebroker.close()
+
+    def transaction(self):
+        """Context manager grouping writes, if the storage supports it."""
+        return self.filebroker.transaction()
 
     def pull_cache(self, name):
         """Load cache data from disk. Exceptions are handled by the caller."""
         data_raw = self.filebroker.pull_cachefile(name)
         cache = pickle.loads(data_raw)
-        if cache['version'] != __version__:
-            raise ValueError('Cache not matching code version.')
-        return cache['data']
+        if cache.get('fingerprint') != endecoder.fingerprint():
+            raise ValueError('Cache not matching the decoders.')
+        return migrate_cache(name, cache['data'], cache.get('schema', 0))
 
     def push_cache(self, name, data):
-        cache_content = {'version': __version__, 'data': data}
+        cache_content = {'schema': CACHE_SCHEMA,
+                         'fingerprint': endecoder.fingerprint(),
+                         'data': data}
         data_raw = pickle.dumps(cache_content)
         self.filebroker.push_cachefile(name, data_raw)
 
+    def pull_entries_cache(self, name):
+        """Load a cache of entries saved with `push_entries_cache`, as
+        `cachefile.IndexedEntries`, decoded when accessed. Exceptions are
+        handled by the caller."""
+        try:
+            header, entries = cachefile.decode(self.filebroker.map_cachefile(name))
+        except ValueError:  # saved by push_cache
+            return cachefile.IndexedEntries(self.pull_cache(name))
+        if header.get('fingerprint') != endecoder.fingerprint():
+            raise ValueError('Cache not matching the decoders.')
+        return migrate_cache(name, entries, header.get('schema', 0))
+
+    def push_entries_cache(self, name, entries):
+        """Save a dictionary of cache entries, in the indexed format of
+        `cachefile`."""
+        header = {'schema': CACHE_SCHEMA, 'fingerprint': endecoder.fingerprint()}
+        self.filebroker.push_cachefile(name, cachefile.encode(header, entries))
+
+    def pull_cache_journal(self, name):
+        """Load the records appended to the journal of a cache.
+
+        Records written with another schema or decoders are skipped (the
+        entries they changed are then found outdated), and reading stops at
+        the first record that can't be read (e.g. truncated by an
+        interrupted write).
+        """
+        try:
+            data_raw = self.filebroker.pull_cachefile(name + JOURNAL_EXT)
+        except IOError:  # no journal
+            return []
+        stream = io.BytesIO(data_raw)
+        records = []
+        while stream.tell() < len(data_raw):
+            try:
+                batch = pickle.load(stream)
+            except Exception:
+                break
+            if (batch.get('schema') == CACHE_SCHEMA and
+                    batch.get('fingerprint') == endecoder.fingerprint()):
+                records.extend(batch['records'])
+        return records
+
+    def push_cache_journal(self, name, records):
+        """Append records to the journal of a cache."""
+        batch = {'schema': CACHE_SCHEMA, 'fingerprint': endecoder.fingerprint(),
+                 'records': records}
+        self.filebroker.append_cachefile(name + JOURNAL_EXT, pickle.dumps(batch))
+
+    def remove_cache_journal(self, name):
+        self.filebroker.remove_cachefile(name + JOURNAL_EXT)
+
     # filebroker+endecoder
 
     def pull_metadata(self, citekey):
-        metadata_raw = self.filebroker.pull_metafile(citekey)
-        return self.endecoder.decode_metadata(metadata_raw)
+        with timings.phase('io'):
+            metadata_raw = self.filebroker.pull_metafile(citekey)
+        with timings.phase('decode'):
+            return self.endecoder.decode_metadata(metadata_raw)
 
     def pull_bibentry(self, citekey):
-        bibdata_raw = self.filebroker.pull_bibfile(citekey)
+        with timings.phase('io'):
+            bibdata_raw = self.filebroker.pull_bibfile(citekey)
         try:
-            return self.endecoder.decode_bibdata(bibdata_raw)
+            with timings.phase('decode'):
+                return self.endecoder.decode_bibdata(bibdata_raw)
         except self.endecoder.BibDecodingError as e:
             # QUESTION: do we really want to obscure a more precise error message here?
             e.args = "Unable to decode bibtex for paper {}.".format(citekey)
             raise e
 
     def push_metadata(self, citekey, metadata):
-        metadata_raw = self.endecoder.encode_metadata(metadata)
-        self.filebroker.push_metafile(citekey, metadata_raw)
+        with timings.phase('encode'):
+            metadata_raw = self.endecoder.encode_metadata(metadata)
+        with timings.phase('io'):
+            self.filebroker.push_metafile(citekey, metadata_raw)
 
     def push_bibentry(self, citekey, bibdata):
-        bibdata_raw = self.endecoder.encode_bibdata(bibdata)
-        self.filebroker.push_bibfile(citekey, bibdata_raw)
+        with timings.phase('encode'):
+            bibdata_raw = self.endecoder.encode_bibdata(bibdata)
+        with timings.phase('io'):
+            self.filebroker.push_bibfile(citekey, bibdata_raw)
 
     def push(self, citekey, metadata, bibdata):
         self.filebroker.push(citekey, metadata, bibdata)
@@ -78,7 +209,14 @@ class DataBroker(object):
         return set(listings['bibfiles'])
 
     def listing(self, filestats=True):
-        return self.filebroker.listing(filestats=filestats)
+        with timings.phase('io'):
+            return self.filebroker.listing(filestats=filestats)
+
+    def stamp(self):
+        return self.filebroker.stamp()
+
+    def metadata_stamp(self):
+        return self.filebroker.metadata_stamp()
 
     # docbroker
 
@@ -97,6 +235,12 @@ class DataBroker(object):
     def rename_doc(self, docpath, new_citekey):
         return self.docbroker.rename_doc(docpath, new_citekey)
 
+    def deduplicate_docs(self):
+        return self.docbroker.deduplicate()
+
+    def docs_usage(self):
+        return self.docbroker.usage()
+
     # notesbroker
 
     def _notepath(self, citekey, extension):
@@ -1,14 +1,181 @@
 import os
 import time
+import itertools
 
 from . import databroker
+from . import cachefile
+from . import endecoder
+from . import index
+from . import query
+from . import bibstruct
+from . import completion
+from . import timings
+from . import lock
+
+
+# The journal of a cache is compacted into a new snapshot when its number of
+# records exceeds this fraction of the number of entries (or this minimum).
+JOURNAL_RATIO = 0.1
+JOURNAL_MIN_SIZE = 100
+
+# Outdated entries are decoded in parallel (see `DataCache.rebuild`), by
+# chunks of this many entries, when they exceed this fraction of the
+# entries of the repository (and this minimum) at `check_cache`.
+REBUILD_CHUNK_SIZE = 500
+AUTO_REBUILD_RATIO = 0.5
+AUTO_REBUILD_MIN_SIZE = 2000
+# Caches, with the files they are decoded from.
+CACHES = (('metacache', 'metafiles'), ('bibcache', 'bibfiles'))
+
+# Maximum wait for the lock serializing the writes of the caches by
+# concurrent processes. Changes not saved are found again from the files.
+CACHE_LOCK_TIMEOUT = 10
+
+
+# When enabled by `keep_datacaches` (in `pubs server`), DataCache instances
+# are kept, by repository, and reused by successive commands.
+_kept = None
+
+
+def keep_datacaches():
+    global _kept
+    _kept = {}
+
+
+def get_datacache(pubsdir, docsdir, create=False, storage='files'):
+    """Return the DataCache of a repository, reused if kept."""
+    if _kept is None or create:
+        return DataCache(pubsdir, docsdir, create=create, storage=storage)
+    key = (pubsdir, docsdir, storage)
+    if key not in _kept:
+        _kept[key] = DataCache(pubsdir, docsdir, storage=storage)
+        _kept[key].kept = True
+    else:
+        _kept[key].refresh_listing()
+    return _kept[key]
+
+
+class CacheJournal(object):
+    """ Saves a cache as a snapshot and an append-only journal of changes.
+
+        Small changes to the cache are appended to the journal, and replayed
+        on load, instead of rewriting the whole snapshot. The journal is
+        compacted into a new snapshot once it is large enough, so that
+        saving changes costs O(1) on average.
+    """
+
+    def __init__(self, databroker, name, entries=False):
+        """:param entries:  whether the cache is a dictionary of cache
+            entries, saved in the indexed format of `cachefile`."""
+        self.databroker = databroker
+        self.name = name
+        self.size = 0
+        self.snapshot_ok = False
+        self.entries = entries
+
+    def pull(self):
+        """Load the cache.
+
+        :returns: (data, records), data being the snapshot of the cache, or
+                  None if it could not be loaded, and records the list
+                  of changes to apply to it.
+        """
+        with timings.phase('cache load'):
+            try:
+                if self.entries:
+                    data = self.databroker.pull_entries_cache(self.name)
+                else:
+                    data = self.databroker.pull_cache(self.name)
+            except Exception:  # take no prisonners; if something is wrong, no cache.
+                data = None
+            try:
+                records = self.databroker.pull_cache_journal(self.name)
+            except Exception:
+                records = []
+        self.snapshot_ok = data is not None
+        self.size = len(records)
+        return data, records
+
+    def push(self, data, entry_count, records, force=False):
+        """Save changes to the cache.
+
+        :param data:         the whole cache, as it should be saved in a snapshot.
+        :param entry_count:  the number of entries of the cache.
+        :param records:      the changes since the last push.
+        :param force:        compact into a new snapshot.
+        """
+        self.size += len(records)
+        if (force or not self.snapshot_ok or
+                self.size > max(JOURNAL_MIN_SIZE, JOURNAL_RATIO * entry_count)):
+            # If interrupted before the journal is removed, old changes are
+            # replayed over the new snapshot; they are then detected as
+            # outdated, as any other cache entry.
+            if self.entries:
+                data = self._merge(data, records)
+                self.databroker.push_entries_cache(self.name, data)
+            else:
+                self.databroker.push_cache(self.name, data)
+            self.databroker.remove_cache_journal(self.name)
+            self.snapshot_ok = True
+            self.size = 0
+        else:
+            self.databroker.push_cache_journal(self.name, records)
+
+
+    def _merge(self, data, records):
+        """Apply changes to the cache as saved, which other processes may
+        have changed since it was loaded. Entries saved by them are kept,
+        unless older than the changed ones."""
+        try:
+            saved = self.databroker.pull_entries_cache(self.name)
+            saved_records = self.databroker.pull_cache_journal(self.name)
+        except Exception:  # no valid saved cache: nothing to merge with
+            return data
+        for citekey, entry in saved_records:
+            if entry is None:
+                saved.discard(citekey)
+            else:
+                saved[citekey] = entry
+        for citekey, entry in records:
+            if entry is None:
+                saved.discard(citekey)
+            elif citekey not in saved or saved.timestamp(citekey) <= entry.timestamp:
+                saved[citekey] = entry
+        return saved
 
 
 class CacheEntry(object):
 
-    def __init__(self, data, timestamp):
+    normalized = None  # also for entries pickled before it was added
+
+    def __init__(self, data, timestamp, normalized=None):
         self.data = data
         self.timestamp = timestamp
+        # bibcache only: fields normalized for queries, computed when first
+        # needed (see `CacheEntrySet.pull_normalized`).
+        self.normalized = normalized
+
+
+def _normalize_bibentry(bibentry):
+    _, bibdata = bibstruct.get_entry(bibentry)
+    return query.normalize_fields(bibdata)
+
+
+def _decode_chunk(name, raws, decoder):
+    """Decode a list of (citekey, raw content) for the cache `name`.
+
+    Runs in the worker processes, if any. Entries that can't be decoded are
+    left out: the error is reported when a command pulls them.
+    """
+    coder = endecoder.EnDecoder(decoder=decoder)
+    decode = coder.decode_metadata if name == 'metacache' else coder.decode_bibdata
+    decoded = []
+    for citekey, raw in raws:
+        try:
+            decoded.append((citekey, decode(raw)))
+        except Exception:
+            pass
+    return decoded
 
 
 class CacheEntrySet(object):
@@ -20,13 +187,20 @@ class CacheEntrySet(object):
             self._pull_fun = databroker.pull_metadata
             self._push_fun = databroker.push_metadata
             self._mtime_fun = databroker.filebroker.mtime_metafile
+            self._pull_raw_fun = databroker.filebroker.pull_metafile
+            self._normalize_fun = None
         elif name == 'bibcache':
             self._pull_fun = databroker.pull_bibentry
             self._push_fun = databroker.push_bibentry
             self._mtime_fun = databroker.filebroker.mtime_bibfile
+            self._pull_raw_fun = databroker.filebroker.pull_bibfile
+            self._normalize_fun = _normalize_bibentry
         else:
             raise ValueError
+        self.journal = CacheJournal(databroker, name, entries=True)
         self._entries = None
+        self._changes = {}  # entries changed since last flush (None if removed)
+        self._mtimes = None  # modification times of the files, if checked in bulk
         self.modified = False
         # does the filesystem supports subsecond stat time?
         self.nsec_support = os.stat('.').st_mtime != int(os.stat('.').st_mtime)
@@ -39,17 +213,43 @@ class CacheEntrySet(object):
 
     def flush(self, force=False):
         if force or self.modified:
-            self.databroker.push_cache(self.name, self.entries)
+            self.journal.push(self.entries, len(self.entries),
+                              list(self._changes.items()), force=force)
+            self._changes = {}
             self.modified = False
 
+    @property
+    def changes(self):
+        """Entries changed since last flush (None for removed ones)."""
+        return self._changes
+
     def pull(self, citekey):
+        return self.pull_entry(citekey).data
+
+    def pull_entry(self, citekey):
         if self._is_outdated(citekey):
             # if we get here, we must update the cache.
             t = time.time()
             data = self._pull_fun(citekey)
-            self.entries[citekey] = CacheEntry(data, t)
-            self.modified = True
-        return self.entries[citekey].data
+            self._set_entry(citekey, CacheEntry(data, t))
+        return self.entries[citekey]
+
+    def pull_timestamp(self, citekey):
+        """Return the timestamp of an up to date entry, without decoding
+        it if it is cached."""
+        if self._is_outdated(citekey):
+            return self.pull_entry(citekey).timestamp
+        return self.entries.timestamp(citekey)
+
+    def pull_normalized(self, citekey):
+        """Return the normalized fields of an entry (bibcache only). They
+        are kept in the cache, until the entry changes."""
+        entry = self.pull_entry(citekey)
+        if entry.normalized is None:
+            entry = CacheEntry(entry.data, entry.timestamp,
+                               self._normalize_fun(entry.data))
+            self._set_entry(citekey, entry)
+        return entry.normalized
 
     def push(self, citekey, data):
         self._push_fun(citekey, data)
@@ -58,26 +258,79 @@ class CacheEntrySet(object):
     def push_to_cache(self, citekey, data):
         """Push to cash only."""
         mtime = self._mtime_fun(citekey)
-        self.entries[citekey] = CacheEntry(data, mtime)
-        self.modified = True
+        self._set_entry(citekey, CacheEntry(data, mtime))
+        if self._mtimes is not None:
+            self._mtimes[citekey] = mtime
 
     def remove_from_cache(self, citekey):
         """Removes from cache only."""
-        if citekey in self.entries:
-            self.entries.pop(citekey)
-            self.modified = True
+        self._remove_entry(citekey)
+        if self._mtimes is not None:
+            self._mtimes.pop(citekey, None)
+
+    def check_all(self, mtimes):
+        """Check all the entries against modification times obtained in bulk.
+
+        Entries of files that do not exist anymore are dropped. The
+        modification times are then used instead of querying the file
+        of each entry when it is pulled.
+
+        :param mtimes:  dictionary associating citekeys to modification times.
+        """
+        for citekey in set(self.entries).difference(mtimes):
+            self._remove_entry(citekey)
+        self._mtimes = mtimes
+
+    def outdated(self, citekeys):
+        """Return the citekeys whose entry is missing or outdated."""
+        return [citekey for citekey in citekeys if self._is_outdated(citekey)]
+
+    def pull_raw_chunks(self, citekeys):
+        """Yield (timestamp, [(citekey, raw content), ...]) for the given
+        citekeys, by chunks of `REBUILD_CHUNK_SIZE`, to be decoded and set
+        with `set_decoded`."""
+        for i in range(0, len(citekeys), REBUILD_CHUNK_SIZE):
+            t = time.time()
+            with timings.phase('io'):
+                raws = [(citekey, self._pull_raw_fun(citekey))
+                        for citekey in citekeys[i:i + REBUILD_CHUNK_SIZE]]
+            yield t, raws
+
+    def set_decoded(self, decoded, timestamp):
+        for citekey, data in decoded:
+            self._set_entry(citekey, CacheEntry(data, timestamp))
+
+    def _set_entry(self, citekey, entry):
+        self.entries[citekey] = entry
+        self._changes[citekey] = entry
+        self.modified = True
+
+    def _remove_entry(self, citekey):
+        self.entries.discard(citekey)
+        self._changes[citekey] = None
+        self.modified = True
 
     def _try_pull_cache(self):
-        try:
-            return self.databroker.pull_cache(self.name)
-        except Exception:  # take no prisonners; if something is wrong, no cache.
-            return {}
+        entries, records = self.journal.pull()
+        if entries is None:
+            entries = cachefile.IndexedEntries()
+        for citekey, entry in records:
+            if entry is None:
+                entries.discard(citekey)
+            else:
+                entries[citekey] = entry
+        return entries
+
+    def _mtime(self, citekey):
+        if self._mtimes is not None and citekey in self._mtimes:
+            return self._mtimes[citekey]
+        return self._mtime_fun(citekey)
 
     def _is_outdated(self, citekey):
         if citekey in self.entries:
-            mtime = self._mtime_fun(citekey)
+            mtime = self._mtime(citekey)
             boundary = mtime if self.nsec_support else mtime + 1
-            return self.entries[citekey].timestamp < boundary
+            return self.entries.timestamp(citekey) < boundary
         else:
             return True
 
@@ -92,23 +345,43 @@ class DataCache(object):
            when they are a lot of files. Update are also done only when required.
            Changes are detected using data modification timestamps.
     """
-    def __init__(self, pubsdir, docsdir, create=False):
+    def __init__(self, pubsdir, docsdir, create=False, storage='files'):
         self.pubsdir = pubsdir
         self.docsdir = docsdir
+        self.storage = storage
         self._databroker = None
         self._metacache = None
         self._bibcache = None
+        self._index = None
+        self._index_journal = None
+        self._listing = None
+        self._stamp = None  # of the storage, when listed
+        self._watcher = None
+        self.kept = False  # reused by the next commands
+        # stamp of the metadata before the changes made with this cache, and
+        # completion index to save (see `_update_completion`)
+        self._metadata_stamp = None
+        self._completion = None
         if create:
             self._create()
 
     def close(self):
+        """Flush the caches and close the storage, unless the cache is kept
+        for the next commands (see `get_datacache`)."""
         self.flush_cache()
+        if self._databroker is not None and not self.kept:
+            self._databroker.close()
+
+    def transaction(self):
+        return self.databroker.transaction()
 
     @property
     def databroker(self):
         if self._databroker is None:
             self._databroker = databroker.DataBroker(self.pubsdir, self.docsdir,
-                                                     create=False)
+                                                     create=False,
+                                                     storage=self.storage)
+            self._metadata_stamp = self._databroker.metadata_stamp()
         return self._databroker
 
     @property
@@ -123,14 +396,229 @@ class DataCache(object):
             self._bibcache = CacheEntrySet(self.databroker, 'bibcache')
         return self._bibcache
 
+    @property
+    def index(self):
+        """The search index, as last saved (see `search_index`)."""
+        if self._index is None:
+            self._index_journal = CacheJournal(self.databroker, 'searchindex')
+            data, records = self._index_journal.pull()
+            if data is not None and not index.SearchIndex.compatible(data):
+                data, records = None, []  # rebuilt from the caches
+            self._index = index.SearchIndex(data)
+            self._index.replay(records)
+        return self._index
+
+    def search_index(self, citekeys):
+        """Return the search index, up to date for the given citekeys."""
+        self.index.sync(citekeys, {index.META: self.metacache,
+                                   index.BIB: self.bibcache})
+        return self.index
+
+    def tag_index(self, citekeys):
+        """Return the search index, with tags up to date for the given
+        citekeys. Only metadata is read."""
+        self.index.sync(citekeys, {index.META: self.metacache})
+        return self.index
+
     def _create(self):
         self._databroker = databroker.DataBroker(self.pubsdir, self.docsdir,
-                                                 create=True)
+                                                 create=True,
+                                                 storage=self.storage)
+
+    def check_cache(self, auto_rebuild=True, caches=('metacache', 'bibcache')):
+        """Check all cache entries against the files of the repository.
+
+        The meta and bib directories are read once, rather than each file
+        being checked when its entry is pulled. Useful before pulling many
+        papers. If watched, the directories are only read the first time
+        and when written by another process (see `refresh_listing`).
+        If auto_rebuild is True and a large part of the entries of the
+        given caches (those the caller will use) is outdated, they are
+        decoded in parallel (see `rebuild`), or in this process in the
+        server (see `keep_datacaches`): its threads make forking unsafe.
+        """
+        if self._watcher is not None and self._listing is not None:
+            self.apply_watched_changes()
+            return
+        if self._watcher is not None:
+            self._watcher.pop_changes()  # seen in the listing
+            self._stamp = self.databroker.stamp()
+        self._listing = self.databroker.listing(filestats=True)
+        self.metacache.check_all(self._listing['metafiles'])
+        self.bibcache.check_all(self._listing['bibfiles'])
+        if not auto_rebuild:
+            return
+        outdated = self._outdated(caches=caches)
+        entry_count = sum(len(self._listing[kind]) for name, kind in CACHES
+                          if name in caches)
+        if (sum(len(citekeys) for _, citekeys in outdated) >
+                max(AUTO_REBUILD_MIN_SIZE, AUTO_REBUILD_RATIO * entry_count)):
+            self._rebuild(outdated, jobs=1 if _kept is not None else 0)
+
+    def _outdated(self, force=False, caches=('metacache', 'bibcache')):
+        """Return [(cache, citekeys)], the outdated entries of each of the
+        given caches, or all of them if force is True. Requires
+        `check_cache`."""
+        outdated = []
+        for name, kind in CACHES:
+            if name in caches:
+                cache = getattr(self, name)
+                citekeys = sorted(self._listing[kind])
+                outdated.append((cache, citekeys if force else cache.outdated(citekeys)))
+        return outdated
+
+    def rebuild(self, jobs=0, force=False):
+        """Decode the outdated entries of the caches in parallel.
+
+        :param jobs:   number of processes (0 for one per CPU, 1 to decode
+                       in this process).
+        :param force:  decode all entries, outdated or not.
+        :returns: the number of entries decoded.
+        """
+        self.check_cache(auto_rebuild=False)
+        return self._rebuild(self._outdated(force=force), jobs=jobs)
+
+    def _rebuild(self, outdated, jobs=0):
+        tasks = [(cache, t, raws) for cache, citekeys in outdated
+                 for t, raws in cache.pull_raw_chunks(citekeys)]
+        names = [cache.name for cache, _, _ in tasks]
+        raws = [raws for _, _, raws in tasks]
+        decoders = itertools.repeat(endecoder.get_decoder())
+        with timings.phase('decode'):
+            if jobs == 1 or len(tasks) <= 1:
+                decoded = list(map(_decode_chunk, names, raws, decoders))
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=jobs or None) as executor:
+                    decoded = list(executor.map(_decode_chunk, names, raws, decoders))
+        count = 0
+        for (cache, t, _), entries in zip(tasks, decoded):
+            cache.set_decoded(entries, t)
+            count += len(entries)
+        return count
+
+    @property
+    def checked_listing(self):
+        """The listing of the meta and bib files of the last `check_cache`."""
+        return self._listing
+
+    def watch(self, watcher):
+        """Rely on a watcher of the meta and bib files (see `server.Watcher`)
+        to keep the listing up to date, rather than reading the directories.
+        """
+        self._watcher = watcher
+
+    def refresh_listing(self):
+        """Bring the listing up to date, if watched, before a command.
+
+        The watcher only polls the files: if the storage was written since
+        the listing (e.g. by a command run by another pubs process), it is
+        read again by the next `check_cache`.
+        """
+        if self._listing is None:
+            return
+        if self._stamp != self.databroker.stamp():
+            self.stale_listing()
+            self._metadata_stamp = None  # the completion index may be outdated
+        else:
+            self.apply_watched_changes()
+
+    def stale_listing(self):
+        """Read the listing again at the next `check_cache` (e.g. when
+        notified of changes by another process, see `server.notify`)."""
+        self._listing = None
+
+    def apply_watched_changes(self):
+        """Report the changes found by the watcher in the listing."""
+        if self._watcher is None or self._listing is None:
+            return
+        for (kind, citekey), mtime in self._watcher.pop_changes().items():
+            cache = self.metacache if kind == 'metafiles' else self.bibcache
+            if mtime is None:
+                cache.remove_from_cache(citekey)
+                self._listing[kind].pop(citekey, None)
+            else:
+                self._listing[kind][citekey] = mtime
 
     def flush_cache(self, force=False):
-        """Write cache to disk"""
+        """Write cache to disk
+
+        Concurrent pubs processes write the caches one at a time. If the
+        lock can't be acquired in time, changes are not written.
+        """
+        cache_lock = lock.get_lock(self.pubsdir, lock.CACHE_LOCK)
+        with timings.phase('cache flush'):
+            if cache_lock is None:
+                self._flush_cache(force=force)
+                return
+            try:
+                cache_lock.acquire(timeout=CACHE_LOCK_TIMEOUT)
+            except lock.LockTimeout:
+                return
+            try:
+                self._flush_cache(force=force)
+            finally:
+                cache_lock.release()
+
+    def _flush_cache(self, force=False):
+        if self._completion is not None or (self._metacache is not None and
+                                            self._metacache.changes):
+            self._update_completion(self._metacache.changes)
         self.metacache.flush(force=force)
         self.bibcache.flush(force=force)
+        if self._index is not None and (force or self._index.modified):
+            self._index_journal.push(self._index.data, len(self._index.terms),
+                                     self._index.pop_changes(), force=force)
+
+    def _update_completion(self, changes):
+        """Report changes of the metadata cache in the completion index.
+
+        The index is built again from all metadata if missing, or if the
+        metadata was changed by others since it was written (its stamp is
+        not the one of the storage before the changes made with this
+        cache). Otherwise, as for other caches, metadata edited in place
+        outside of pubs is reported once pulled by a command.
+        """
+        filebroker = self.databroker.filebroker
+        stamp = filebroker.metadata_stamp()
+        try:
+            old_stamp, tags = completion.decode_index(
+                filebroker.pull_cachefile(completion.INDEX_NAME))
+        except Exception:
+            old_stamp, tags = None, None
+        if self._completion is not None:  # see `rebuild_completion`
+            new_tags = self._completion
+        elif tags is None or old_stamp != self._metadata_stamp:
+            new_tags = self._metadata_tags()
+        else:
+            new_tags = dict(tags)
+            for citekey, entry in changes.items():
+                if entry is None:
+                    new_tags.pop(citekey, None)
+                else:
+                    new_tags[citekey] = completion.paper_tags(entry.data)
+        if new_tags != tags or stamp != old_stamp:
+            filebroker.push_cachefile(completion.INDEX_NAME,
+                                      completion.encode_index(new_tags, stamp))
+        self._metadata_stamp = stamp
+        self._completion = None
+
+    def _metadata_tags(self):
+        tags = {}
+        for citekey in self.citekeys():
+            try:
+                tags[citekey] = completion.paper_tags(self.metacache.pull(citekey))
+            except IOError:  # no metadata
+                tags[citekey] = set()
+        return tags
+
+    def rebuild_completion(self):
+        """Build the completion index from all metadata, save it with the
+        caches, and return it."""
+        self.check_cache(caches=('metacache',))
+        tags = self._completion = self._metadata_tags()
+        self.flush_cache()
+        return tags
 
     def pull_metadata(self, citekey):
         return self.metacache.pull(citekey)
@@ -138,27 +626,47 @@ class DataCache(object):
     def pull_bibentry(self, citekey):
         return self.bibcache.pull(citekey)
 
+    def pull_normalized_fields(self, citekey):
+        return self.bibcache.pull_normalized(citekey)
+
     def push_metadata(self, citekey, metadata):
         self.metacache.push(citekey, metadata)
+        self._index_entry(index.META, self.metacache, citekey)
 
     def push_bibentry(self, citekey, bibdata):
         self.bibcache.push(citekey, bibdata)
+        self._index_entry(index.BIB, self.bibcache, citekey)
 
     def push(self, citekey, metadata, bibdata):
         self.databroker.push(citekey, metadata, bibdata)
         self.metacache.push_to_cache(citekey, metadata)
         self.bibcache.push_to_cache(citekey, bibdata)
+        self._index_entry(index.META, self.metacache, citekey)
+        self._index_entry(index.BIB, self.bibcache, citekey)
 
     def remove(self, citekey):
         self.databroker.remove(citekey)
         self.metacache.remove_from_cache(citekey)
         self.bibcache.remove_from_cache(citekey)
+        self.index.remove(citekey)
+
+    def _index_entry(self, part, cache, citekey):
+        """Update the index in place with a freshly pushed cache entry."""
+        self.index.update(part, citekey, cache.entries[citekey], force=True)
 
     def exists(self, citekey, meta_check=False):
-        return self.databroker.exists(citekey, meta_check=meta_check)
+        if self._listing is None:
+            return self.databroker.exists(citekey, meta_check=meta_check)
+        # The listing is kept up to date by the caches.
+        does_exists = citekey in self._listing['bibfiles']
+        if meta_check:
+            does_exists = does_exists and citekey in self._listing['metafiles']
+        return does_exists
 
     def citekeys(self):
-        return self.databroker.citekeys()
+        if self._listing is None:
+            return self.databroker.citekeys()
+        return set(self._listing['bibfiles'])
 
     def listing(self, filestats=True):
         return self.databroker.listing(filestats=filestats)
@@ -180,6 +688,12 @@ class DataCache(object):
     def rename_doc(self, docpath, new_citekey):
         return self.databroker.rename_doc(docpath, new_citekey)
 
+    def deduplicate_docs(self):
+        return self.databroker.deduplicate_docs()
+
+    def docs_usage(self):
+        return self.databroker.docs_usage()
+
     # notesbroker
 
     def real_notepath(self, citekey, extension):
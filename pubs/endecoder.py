@@ -1,23 +1,11 @@
 from __future__ import absolute_import, unicode_literals
 
+import os
+import re
 import copy
 import logging
 
-# both needed to intercept exceptions.
-import pyparsing
-import bibtexparser
-
-try:
-    import bibtexparser as bp
-    # don't let bibtexparser display stuff
-    bp.bparser.logger.setLevel(level=logging.CRITICAL)
-except ImportError:
-    print("error: you need to install bibterxparser; try running 'pip install "
-          "bibtexparser'.")
-    exit(-1)
-
-import yaml
-
+from . import bibdecoder
 from .bibstruct import TYPE_KEY
 
 """Important notice:
@@ -25,12 +13,79 @@ from .bibstruct import TYPE_KEY
 """
 
 
-if bp.__version__ > "0.6.0":
-    BP_ID_KEY = 'ID'
-    BP_ENTRYTYPE_KEY = 'ENTRYTYPE'
-else:
-    BP_ID_KEY = 'id'
-    BP_ENTRYTYPE_KEY = 'type'
+# bibtexparser (with pyparsing) and yaml are slow to import, and are not
+# needed when the content of the repository is read from the caches: they
+# are imported on first use.
+bp = None
+
+
+def _bibtexparser():
+    """Import bibtexparser, if not done yet, and return it."""
+    global bp
+    if bp is None:
+        try:
+            import bibtexparser
+        except ImportError:
+            print("error: you need to install bibterxparser; try running 'pip install "
+                  "bibtexparser'.")
+            exit(-1)
+        # don't let bibtexparser display stuff
+        bibtexparser.bparser.logger.setLevel(level=logging.CRITICAL)
+        bp = bibtexparser
+    return bp
+
+
+# Engines decoding bibtex data: bibtexparser, or the tokenizer of the
+# bibdecoder module ('fast'). Selected in the configuration (see set_decoder).
+DECODERS = ('bibtexparser', 'fast')
+_decoder = 'bibtexparser'
+
+
+def set_decoder(name):
+    """Set the engine used by default to decode bibtex data."""
+    global _decoder
+    if name not in DECODERS:
+        raise ValueError('unknown bibtex decoder: {}'.format(name))
+    _decoder = name
+
+
+def get_decoder():
+    return _decoder
+
+
+# Version of the decoded representation produced by pubs (customizations,
+# fast decoder...). To be increased when it changes, so that cached entries
+# are decoded again.
+DECODED_FORMAT = 1
+
+_fingerprints = {}
+
+
+def _module_stamp(name):
+    """Identify the installed version of a module without importing it,
+    by the size and modification time of its source file."""
+    import importlib.util
+    try:
+        st = os.stat(importlib.util.find_spec(name).origin)
+    except (ImportError, AttributeError, TypeError, ValueError, OSError):
+        return '{}:?'.format(name)
+    return '{}:{}:{}'.format(name, st.st_size, int(st.st_mtime))
+
+
+def fingerprint():
+    """Identify the engines decoding bibtex and metadata, as set with
+    `set_decoder`. Decoded data cached with another fingerprint may differ
+    from what the current engines produce."""
+    if _decoder not in _fingerprints:
+        engines = ['format:{}'.format(DECODED_FORMAT), _decoder, _module_stamp('yaml')]
+        if _decoder == 'bibtexparser':
+            engines.append(_module_stamp('bibtexparser'))
+        _fingerprints[_decoder] = ' '.join(engines)
+    return _fingerprints[_decoder]
+
+
+BP_ID_KEY = 'ID'
+BP_ENTRYTYPE_KEY = 'ENTRYTYPE'
 
 
 BIBFIELD_ORDER = ['author', 'title', 'journal', 'institution', 'publisher',
@@ -38,6 +93,62 @@ BIBFIELD_ORDER = ['author', 'title', 'journal', 'institution', 'publisher',
                   'doi', 'note', 'abstract']
 
 
+# candidate entry boundaries: '@' at the beginning of a line.
+_ENTRY_START_RE = re.compile(r'^[ \t]*@', re.MULTILINE)
+# entries defining strings or preambles, needed by the other entries.
+_DEFINITION_RE = re.compile(r'[ \t]*@[ \t]*(string|preamble)\b', re.IGNORECASE)
+
+
+# beginning of an entry, with its citekey: assumed to start a new entry even
+# inside braces, so that an unbalanced entry does not swallow the next ones.
+_CITEKEY_RE = re.compile(r'[ \t]*@[ \t]*\w+[ \t]*[{(][ \t\n]*([^,\s]+)')
+_COMMENT_RE = re.compile(r'[ \t]*@[ \t]*comment\b', re.IGNORECASE)
+
+# entries are decoded in batches of about this many characters.
+DECODE_BATCH_SIZE = 64 * 1024
+
+
+def split_bibtexts(lines):
+    """Split bibtex data, given as an iterable of lines, in the text of each
+    entry, preceded by the text found before the first entry, if any.
+
+    Entries start on the lines beginning with '@' that are outside of
+    braces, or that look like the beginning of an entry ('@type{citekey').
+    This is a generator: lines are read as needed.
+    """
+    text, depth = [], 0
+    for line in lines:
+        if ((depth <= 0 and _ENTRY_START_RE.match(line))
+                or _CITEKEY_RE.match(line)):
+            if text:
+                yield ''.join(text)
+            text, depth = [], 0
+        text.append(line)
+        depth += line.count('{') - line.count('}')
+    if text:
+        yield ''.join(text)
+
+
+def split_bibdata(bibstr, chunk_size):
+    """Split bibtex data in chunks of at most `chunk_size` entries, that can
+    be decoded independently.
+
+    String and preamble definitions, as well as the text before the first
+    entry, are repeated in every chunk.
+    """
+    entries = list(split_bibtexts(bibstr.splitlines(True)))
+    header = ''
+    if entries and not _ENTRY_START_RE.match(entries[0]):
+        header = entries.pop(0)
+    if len(entries) <= chunk_size:
+        return [bibstr]
+    definitions = header + ''.join(
+        e for e in entries if _DEFINITION_RE.match(e))
+    entries = [e for e in entries if not _DEFINITION_RE.match(e)]
+    return [definitions + ''.join(entries[i:i + chunk_size])
+            for i in range(0, len(entries), chunk_size)]
+
+
 def sanitize_citekey(record):
     record[BP_ID_KEY] = record[BP_ID_KEY].strip('\n')
     return record
@@ -50,6 +161,7 @@ def customizations(record):
         :returns: -- customized record
     """
 
+    bp = _bibtexparser()
     # record = bp.customization.convert_to_unicode(record) # transform \& into & ones, messing-up latex
     record = bp.customization.author(record)
     record = bp.customization.editor(record)
@@ -82,18 +194,35 @@ class EnDecoder(object):
             super(Exception, self).__init__(error_msg)  # make `str(self)` work.
             self.data = bibdata
 
-    bwriter = bp.bwriter.BibTexWriter()
-    bwriter.display_order = BIBFIELD_ORDER
+        def __reduce__(self):  # errors are sent back by worker processes.
+            return (self.__class__, (str(self), self.data))
+
+    def __init__(self, decoder=None):
+        """:param decoder: engine decoding bibtex data; by default the one
+            set with `set_decoder`."""
+        self.decoder = decoder
+
+    _bwriter = None
+
+    @property
+    def bwriter(self):
+        if EnDecoder._bwriter is None:
+            EnDecoder._bwriter = _bibtexparser().bwriter.BibTexWriter()
+            EnDecoder._bwriter.display_order = BIBFIELD_ORDER
+        return EnDecoder._bwriter
 
     def encode_metadata(self, metadata):
+        import yaml
         return yaml.safe_dump(metadata, allow_unicode=True,
                               encoding=None, indent=4)
 
     def decode_metadata(self, metadata_raw):
+        import yaml
         return yaml.safe_load(metadata_raw)
 
     def encode_bibdata(self, bibdata, ignore_fields=[]):
         """Encode bibdata """
+        bp = _bibtexparser()
         bpdata = bp.bibdatabase.BibDatabase()
         bpdata.entries = [self._entry_to_bp_entry(k, copy.copy(bibdata[k]),
                                                   ignore_fields=ignore_fields)
@@ -126,6 +255,19 @@ class EnDecoder(object):
         if len(bibstr) == 0:
             error_msg = 'parsing error: the provided string has length zero.'
             raise self.BibDecodingError(error_msg, bibstr)
+        if (self.decoder or _decoder) == 'fast':
+            entries = self._decode_fast(bibstr)
+        else:
+            entries = self._decode_bibtexparser(bibstr)
+        if len(entries) > 0:
+            return entries
+        else:
+            raise self.BibDecodingError(('no valid entry found in the provided data: '
+                                        ' {}').format(bibstr), bibstr)
+
+    def _decode_bibtexparser(self, bibstr):
+        bp = _bibtexparser()
+        import pyparsing  # needed to intercept exceptions.
         try:
             entries = bp.bparser.BibTexParser(
                 bibstr, common_strings=True, customization=customizations,
@@ -142,17 +284,66 @@ class EnDecoder(object):
                     entries[e]['editor'] = [
                         editor['name'] if isinstance(editor, dict) else editor
                         for editor in entries[e]['editor']]
-            if len(entries) > 0:
-                return entries
-            else:
-                raise self.BibDecodingError(('no valid entry found in the provided data: '
-                                            ' {}').format(bibstr), bibstr)
+            return entries
         except (pyparsing.ParseException, pyparsing.ParseSyntaxException) as e:
             error_msg = self._format_parsing_error(e)
             raise self.BibDecodingError(error_msg, bibstr)
-        except bibtexparser.bibdatabase.UndefinedString as e:
+        except bp.bibdatabase.UndefinedString as e:
+            error_msg = 'parsing error: undefined string in provided data: {}'.format(e)
+            raise self.BibDecodingError(error_msg, bibstr)
+
+    def _decode_fast(self, bibstr):
+        try:
+            entries = bibdecoder.decode(bibstr)
+        except bibdecoder.UndefinedString as e:
             error_msg = 'parsing error: undefined string in provided data: {}'.format(e)
             raise self.BibDecodingError(error_msg, bibstr)
+        for entry in entries.values():
+            entry.pop(BP_ID_KEY)
+            entry[TYPE_KEY] = entry.pop(BP_ENTRYTYPE_KEY)
+        return entries
+
+    def decode_bibentries(self, lines, batch_size=DECODE_BATCH_SIZE):
+        """Decodes bibdata incrementally from an iterable of lines, such as
+        an open file.
+
+        Yields (citekey, entry) pairs. Entries are decoded in batches of
+        about `batch_size` characters, so that memory use is bounded by the
+        largest entry, not by the data. If an entry cannot be decoded, a
+        BibDecodingError is yielded in place of the entry, along with its
+        citekey if found (None otherwise).
+        """
+        definitions, batch, size = '', [], 0
+        for text in split_bibtexts(lines):
+            if not _ENTRY_START_RE.match(text) or _COMMENT_RE.match(text):
+                continue
+            if _DEFINITION_RE.match(text):  # needed by the following entries
+                definitions += text
+                continue
+            batch.append(text)
+            size += len(text)
+            if size >= batch_size:
+                for pair in self._decode_batch(definitions, batch):
+                    yield pair
+                batch, size = [], 0
+        for pair in self._decode_batch(definitions, batch):
+            yield pair
+
+    def _decode_batch(self, definitions, texts):
+        """Decode the texts of some entries; in case of failure, decode
+        them one by one to find which ones are malformed."""
+        if not texts:
+            return []
+        try:
+            entries = self.decode_bibdata(definitions + ''.join(texts))
+            if len(texts) == 1 or len(entries) == len(texts):
+                return list(entries.items())
+        except self.BibDecodingError as e:
+            if len(texts) == 1:
+                m = _CITEKEY_RE.match(texts[0])
+                return [(m.group(1) if m else None, e)]
+        return [pair for text in texts
+                for pair in self._decode_batch(definitions, [text])]
 
     @classmethod
     def _format_parsing_error(cls, e):
@@ -91,6 +91,28 @@ class RenameEvent(PaperChangeEvent):
     def description(self):
         return self._format.format(citekey=self.citekey, old_citekey=self.old_citekey)
 
+# Used by repo.batch(): the changes of a batch, sent as one event to the
+# listeners of BatchEvent (and of its parents, e.g. the git plugin), and as
+# the events it groups to the listeners of their own classes
+class BatchEvent(PaperChangeEvent):
+
+    def __init__(self, events):
+        super(BatchEvent, self).__init__(None)
+        self.events = events
+
+    def send(self):
+        for cls, f, args in _listener:
+            if isinstance(self, cls):
+                f(self, *args)
+            else:
+                for event in self.events:
+                    if isinstance(event, cls):
+                        f(event, *args)
+
+    @property
+    def description(self):
+        return '\n'.join(event.description for event in self.events)
+
 # Used by commands.note_cmd.command()
 class NoteEvent(PaperChangeEvent):
     _format = "Modified note of {citekey}."
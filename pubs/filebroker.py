@@ -1,15 +1,19 @@
 import os
 import re
+import contextlib
 from .p3 import urlparse, u_maybe
 
 from .content import (check_file, check_directory, read_text_file, write_file,
-                      system_path, check_content, copy_content)
+                      system_path, check_content, copy_content, link_content,
+                      hash_content, content_type)
 
 from . import content
+from . import lock
 
 
 META_EXT = '.yaml'
 BIB_EXT  = '.bib'
+OBJECTS_DIR = 'objects'
 
 
 def filter_filename(filename, ext):
@@ -51,6 +55,32 @@ class FileBroker(object):
         if not check_directory(self.bibdir, fail=False):
             os.mkdir(system_path(self.bibdir))
 
+    def close(self):
+        pass
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Files are written one by one: nothing to group."""
+        yield
+
+    def destroy(self):
+        """Remove the meta and bib files, and the caches (not the locks,
+        which may be held).
+
+        Used when converting to another storage.
+        """
+        listing = self.listing(filestats=False)
+        for citekey in listing['metafiles']:
+            os.remove(system_path(self.meta_path(citekey)))
+        for citekey in listing['bibfiles']:
+            os.remove(system_path(self.bib_path(citekey)))
+        for filename in os.listdir(system_path(self.cachedir)):
+            if filename not in (lock.REPOSITORY_LOCK, lock.CACHE_LOCK):
+                os.remove(system_path(os.path.join(self.cachedir, filename)))
+        for directory in [self.metadir, self.bibdir, self.cachedir]:
+            if not os.listdir(system_path(directory)):
+                os.rmdir(system_path(directory))
+
     def bib_path(self, citekey):
         return os.path.join(self.bibdir, citekey + BIB_EXT)
 
@@ -61,10 +91,26 @@ class FileBroker(object):
         filepath = os.path.join(self.cachedir, filename)
         return content.read_binary_file(filepath)
 
+    def map_cachefile(self, filename):
+        """Same as pull_cachefile, but the file may be memory-mapped."""
+        filepath = os.path.join(self.cachedir, filename)
+        return content.map_binary_file(filepath)
+
     def push_cachefile(self, filename, data):
+        # Replaced, not modified in place (see `write_file`), so that mapped
+        # caches stay valid.
         filepath = os.path.join(self.cachedir, filename)
         write_file(filepath, data, mode='wb')
 
+    def append_cachefile(self, filename, data):
+        filepath = os.path.join(self.cachedir, filename)
+        write_file(filepath, data, mode='ab')
+
+    def remove_cachefile(self, filename):
+        filepath = os.path.join(self.cachedir, filename)
+        if check_file(filepath, fail=False):
+            os.remove(system_path(filepath))
+
     def mtime_metafile(self, citekey):
         try:
             filepath = self.meta_path(citekey)
@@ -118,27 +164,44 @@ class FileBroker(object):
         return does_exists
 
     def listing(self, filestats=True):
-        metafiles = []
-        for filename in os.listdir(system_path(self.metadir)):
-            citekey = filter_filename(filename, META_EXT)
-            if citekey is not None:
-                if filestats:
-                    stats = os.stat(system_path(os.path.join(self.metadir, filename)))
-                    metafiles.append(citekey, stats)
-                else:
-                    metafiles.append(citekey)
-
-        bibfiles = []
-        for filename in os.listdir(system_path(self.bibdir)):
-            citekey = filter_filename(filename, BIB_EXT)
-            if citekey is not None:
-                if filestats:
-                    stats = os.stat(system_path(os.path.join(self.bibdir, filename)))
-                    bibfiles.append(citekey, stats)
-                else:
-                    bibfiles.append(citekey)
-
-        return {'metafiles': metafiles, 'bibfiles': bibfiles}
+        """List the meta and bib files of the repository.
+
+        Each directory is read once.
+        :param filestats:  if True, citekeys are returned in dictionaries
+                           associating them to the modification time of
+                           their file, rather than in lists.
+        """
+        return {'metafiles': self._scan(self.metadir, META_EXT, filestats),
+                'bibfiles': self._scan(self.bibdir, BIB_EXT, filestats)}
+
+    def stamp(self):
+        """Return a value that changes when meta or bib files are added,
+        removed or written by pubs (files are replaced, see
+        `content.write_file`), without reading the directories."""
+        return tuple(os.stat(system_path(directory)).st_mtime_ns
+                     for directory in (self.metadir, self.bibdir))
+
+    def metadata_stamp(self):
+        """Return a string that changes when meta files are added, removed
+        or written by pubs, and is kept across processes (see
+        `completion.pull_index`)."""
+        return str(os.stat(system_path(self.metadir)).st_mtime_ns)
+
+    @staticmethod
+    def _scan(directory, ext, filestats):
+        found = {} if filestats else []
+        entries = os.scandir(system_path(directory))
+        try:
+            for entry in entries:
+                citekey = filter_filename(entry.name, ext)
+                if citekey is not None:
+                    if filestats:
+                        found[citekey] = entry.stat().st_mtime
+                    else:
+                        found.append(citekey)
+        finally:
+            entries.close()
+        return found
 
 
 class DocBroker(object):
@@ -150,14 +213,23 @@ class DocBroker(object):
         * docsdir:// correspond to /path/to/pubsdir/doc (configurable)
         * document outside of the repository will not be removed.
         * move_doc only applies from inside to inside the docsdir
+        * if the docsdir has an objects/ subdirectory (see `deduplicate`),
+          each content is stored once, in objects/{hash}.{ext}, and the
+          documents are hard links to them: a document edited in place
+          (e.g. annotated) changes all the documents with the same content.
     """
 
     def __init__(self, directory, scheme='docsdir', subdir='doc'):
         self.scheme = scheme
         self.docdir = os.path.expanduser(os.path.join(directory, subdir))
+        self.objdir = os.path.join(self.docdir, OBJECTS_DIR)
         if not check_directory(self.docdir, fail=False):
             os.mkdir(system_path(self.docdir))
 
+    @property
+    def deduplicated(self):
+        return check_directory(self.objdir, fail=False)
+
     def in_docsdir(self, docpath):
         try:
             parsed = urlparse(docpath)
@@ -186,15 +258,34 @@ class DocBroker(object):
 
             The document will be named {citekey}.{ext}.
             The location will be docsdir://{citekey}.{ext}.
+            If the docsdir is deduplicated, a document whose content is
+            already stored is not copied again.
             :param overwrite: will overwrite existing file.
             :return: the above location
         """
         full_source_path = self.real_docpath(source_path)
         check_content(full_source_path)
 
-        target_path = '{}://{}'.format(self.scheme, citekey + os.path.splitext(source_path)[-1])
+        ext = os.path.splitext(source_path)[-1]
+        target_path = '{}://{}'.format(self.scheme, citekey + ext)
         full_target_path = self.real_docpath(target_path)
-        copy_content(full_source_path, full_target_path, overwrite=overwrite)
+        if not self.deduplicated:
+            copy_content(full_source_path, full_target_path, overwrite=overwrite)
+            return target_path
+        if not overwrite and os.path.exists(system_path(full_target_path)):
+            raise IOError('{} file exists.'.format(full_target_path))
+        if content_type(full_source_path) == 'url':
+            tmppath = os.path.join(self.docdir, '.{}.{}.tmp'.format(citekey, os.getpid()))
+            copy_content(full_source_path, tmppath, overwrite=True)
+            try:
+                objpath = self._store(tmppath, ext, link=True)
+            finally:
+                os.remove(system_path(tmppath))
+        elif system_path(full_source_path) == system_path(full_target_path):
+            return target_path
+        else:
+            objpath = self._store(full_source_path, ext)
+        self._link_document(objpath, full_target_path)
         return target_path
 
     def remove_doc(self, docpath, silent=True):
@@ -209,11 +300,17 @@ class DocBroker(object):
             return
         filepath = self.real_docpath(docpath)
         if check_file(filepath):
+            objpath = self._object_of(filepath)
             os.remove(system_path(filepath))
+            if objpath is not None and os.stat(system_path(objpath)).st_nlink == 1:
+                self._remove_object(objpath)  # no other document uses it
 
     def rename_doc(self, docpath, new_citekey):
         """ Move a document inside the docsdir
 
+            The file is linked under its new name, not copied (unless the
+            file system has no hard links).
+
             :raise IOError: if docpath doesn't point to a file
                             if new_citekey doc exists already.
             :raise ValueError: if docpath is not in docsdir().
@@ -223,7 +320,105 @@ class DocBroker(object):
         if not self.in_docsdir(docpath):
             raise ValueError('cannot rename an external file ({}).'.format(docpath))
 
-        new_docpath = self.add_doc(new_citekey, docpath)
-        self.remove_doc(docpath)
+        filepath = self.real_docpath(docpath)
+        check_file(filepath)
+        new_docpath = '{}://{}'.format(self.scheme, new_citekey + os.path.splitext(docpath)[-1])
+        link_content(filepath, self.real_docpath(new_docpath))
+        os.remove(system_path(filepath))
 
         return new_docpath
+
+    # deduplicated docsdir
+
+    def _object_path(self, digest, ext):
+        return os.path.join(self.objdir, digest[:2], digest[2:] + ext)
+
+    def _store(self, path, ext, link=False):
+        """Store a file in objects/, if its content is not there already.
+
+        :param link:  if True, the object is a hard link to path, rather
+                      than a copy (for a file of the docsdir).
+        :return:  the path of the object.
+        """
+        objpath = self._object_path(hash_content(path), ext)
+        if not check_file(objpath, fail=False):
+            directory = system_path(os.path.dirname(objpath))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            if link:
+                link_content(path, objpath)
+            else:  # the object appears only once complete
+                tmppath = '{}.{}.tmp'.format(objpath, os.getpid())
+                copy_content(path, tmppath, overwrite=True)
+                os.replace(system_path(tmppath), system_path(objpath))
+        return objpath
+
+    def _object_of(self, filepath):
+        """Return the object of which a document is a hard link, or None.
+
+        The object is found from the hash of the document, as stored. A
+        document edited in place no longer matches the name of its object:
+        it is not found, and is removed, once unused, by `deduplicate`.
+        """
+        if os.stat(system_path(filepath)).st_nlink < 2 or not self.deduplicated:
+            return None
+        objpath = self._object_path(hash_content(filepath), os.path.splitext(filepath)[-1])
+        if (check_file(objpath, fail=False) and
+                os.path.samefile(system_path(objpath), system_path(filepath))):
+            return objpath
+        return None
+
+    def _remove_object(self, objpath):
+        os.remove(system_path(objpath))
+        try:
+            os.rmdir(system_path(os.path.dirname(objpath)))
+        except OSError:  # other objects in the directory
+            pass
+
+    def _link_document(self, objpath, filepath):
+        """Make a document a link to an object, replacing it atomically,
+        then release the object it was a link to, if any."""
+        old_objpath = None
+        if os.path.exists(system_path(filepath)):
+            if os.path.samefile(system_path(objpath), system_path(filepath)):
+                return
+            old_objpath = self._object_of(filepath)
+        link_content(objpath, filepath, overwrite=True)
+        if old_objpath is not None and os.stat(system_path(old_objpath)).st_nlink == 1:
+            self._remove_object(old_objpath)
+
+    def _deduplicate_file(self, filepath):
+        objpath = self._store(filepath, os.path.splitext(filepath)[-1], link=True)
+        self._link_document(objpath, filepath)
+
+    def _documents(self):
+        """Return the paths of the documents (files of the docsdir)."""
+        return [os.path.join(self.docdir, name)
+                for name in sorted(os.listdir(system_path(self.docdir)))
+                if not name.startswith('.') and
+                check_file(os.path.join(self.docdir, name), fail=False)]
+
+    def deduplicate(self):
+        """Store each document content once, in objects/, the documents
+        being hard links to them. This is also the layout of the documents
+        added from then on. Objects no longer used are removed."""
+        if not self.deduplicated:
+            os.mkdir(system_path(self.objdir))
+        for filepath in self._documents():
+            self._deduplicate_file(filepath)
+        for directory, _, filenames in os.walk(system_path(self.objdir)):
+            for filename in filenames:
+                objpath = os.path.join(directory, filename)
+                if os.stat(objpath).st_nlink == 1:
+                    self._remove_object(objpath)
+
+    def usage(self):
+        """Return the number of documents, their total size, and the space
+        they use on disk, each file being counted once."""
+        documents = self._documents()
+        size, inodes = 0, {}
+        for filepath in documents:
+            stat = os.stat(system_path(filepath))
+            size += stat.st_size
+            inodes[(stat.st_dev, stat.st_ino)] = stat.st_size
+        return len(documents), size, sum(inodes.values())
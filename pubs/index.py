@@ -0,0 +1,188 @@
+"""Inverted index of the repository, used to answer queries without
+testing every paper.
+
+The index maps, for a few fields, normalized (see `query.normalize_text`)
+and lowercased terms to the set of citekeys of the papers containing them:
+    - 'author': last names of the authors,
+    - 'title': words of the title,
+    - 'year': year, as an integer,
+    - 'tag': tags,
+    - 'rawtag': tags, as written (not normalized nor lowercased), used to
+      answer tag listings and tag expressions from metadata only.
+
+It is kept next to the caches (with a journal of changes, as they are),
+and derived from their entries: for each paper and each part ('bib' or
+'meta'), the timestamp of the cache entry that was indexed is recorded,
+so that entries changed outside of the index (for instance, edited by
+hand and reloaded by the cache) are detected and indexed again.
+"""
+
+from . import bibstruct
+from .query import normalize_text, tokenize
+
+
+BIB = 'bib'
+META = 'meta'
+
+FIELDS = {BIB: ('author', 'title', 'year'),
+          META: ('tag', 'rawtag')}
+
+
+def _normalize(s):
+    return normalize_text(s).lower()
+
+
+def bib_terms(bibentry):
+    """Extract the indexed terms from a bibentry."""
+    _, bibdata = bibstruct.get_entry(bibentry)
+    terms = {'author': set(), 'title': set(), 'year': set()}
+    for author in bibdata.get('author', []):
+        terms['author'].add(_normalize(bibstruct.author_last(author)))
+    if 'title' in bibdata:
+        terms['title'].update(tokenize(_normalize(bibdata['title'])))
+    try:
+        terms['year'].add(int(bibdata['year']))
+    except (KeyError, ValueError):
+        pass
+    return terms
+
+
+def meta_terms(metadata):
+    """Extract the indexed terms from metadata."""
+    tags = (metadata or {}).get('tags') or []
+    return {'tag': set(_normalize(tag) for tag in tags),
+            'rawtag': set(tags)}
+
+
+_TERMS_FUN = {BIB: bib_terms, META: meta_terms}
+_ALL_FIELDS = set(field for part in FIELDS for field in FIELDS[part])
+
+
+class SearchIndex(object):
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {'postings': {field: {} for part in FIELDS
+                                 for field in FIELDS[part]},
+                    'terms': {},
+                    'stamps': {}}
+        self.postings = data['postings']  # field -> term -> set of citekeys
+        self.terms = data['terms']        # citekey -> field -> set of terms
+        self.stamps = data['stamps']      # citekey -> part -> entry timestamp
+        self.changes = set()  # citekeys changed since last saved
+        self.modified = False
+
+    @staticmethod
+    def compatible(data):
+        """Whether saved index data has the current fields."""
+        return set(data['postings']) == _ALL_FIELDS
+
+    @property
+    def data(self):
+        return {'postings': self.postings, 'terms': self.terms,
+                'stamps': self.stamps}
+
+    def __contains__(self, citekey):
+        return citekey in self.terms
+
+    def update(self, part, citekey, entry, force=False):
+        """Index the data of a cache entry, unless it is already indexed.
+
+        :param part:   BIB or META, for bibcache or metacache entries.
+        :param entry:  a `datacache.CacheEntry`.
+        :param force:  index the entry even if its timestamp is unchanged.
+        """
+        stamps = self.stamps.setdefault(citekey, {})
+        if not force and stamps.get(part) == entry.timestamp:
+            return
+        self._set_terms(citekey, _TERMS_FUN[part](entry.data))
+        stamps[part] = entry.timestamp
+        self.changes.add(citekey)
+        self.modified = True
+
+    def remove(self, citekey):
+        """Remove a paper from the index. Is silent if it is not indexed."""
+        self._remove_terms(citekey)
+        self.stamps.pop(citekey, None)
+        self.changes.add(citekey)
+        self.modified = True
+
+    def pop_changes(self):
+        """Return the journal records of the changes since last call."""
+        records = [(citekey, self.terms.get(citekey), self.stamps.get(citekey))
+                   for citekey in self.changes]
+        self.changes = set()
+        self.modified = False
+        return records
+
+    def replay(self, records):
+        """Apply journal records from `pop_changes`."""
+        for citekey, terms, stamps in records:
+            if terms is None:
+                self._remove_terms(citekey)
+                self.stamps.pop(citekey, None)
+            else:
+                self._set_terms(citekey, terms)
+                self.stamps[citekey] = stamps
+
+    def _set_terms(self, citekey, terms):
+        paper_terms = self.terms.setdefault(citekey, {})
+        for field, new_terms in terms.items():
+            old_terms = paper_terms.get(field, set())
+            for term in old_terms - new_terms:
+                self._remove_posting(field, term, citekey)
+            for term in new_terms - old_terms:
+                self.postings[field].setdefault(term, set()).add(citekey)
+            paper_terms[field] = new_terms
+
+    def _remove_terms(self, citekey):
+        for field, terms in self.terms.pop(citekey, {}).items():
+            for term in terms:
+                self._remove_posting(field, term, citekey)
+
+    def _remove_posting(self, field, term, citekey):
+        posting = self.postings[field].get(term)
+        if posting is not None:
+            posting.discard(citekey)
+            if not posting:
+                del self.postings[field][term]
+
+    def sync(self, citekeys, caches):
+        """Bring the index up to date with the caches.
+
+        :param citekeys:  citekeys of the papers in the repository.
+        :param caches:    dictionary associating to each part to update the
+                          corresponding `datacache.CacheEntrySet`.
+        """
+        for citekey in set(self.terms).difference(citekeys):
+            self.remove(citekey)
+        for part, cache in caches.items():
+            for citekey in citekeys:
+                # entries already indexed are not decoded from the cache
+                stamp = cache.pull_timestamp(citekey)
+                if self.stamps.get(citekey, {}).get(part) != stamp:
+                    self.update(part, citekey, cache.pull_entry(citekey))
+
+    def tagged(self, included=(), excluded=(), citekeys=None):
+        """Return the citekeys of the papers with all the `included` tags
+        and none of the `excluded` ones (as written).
+
+        :param citekeys:  papers to select from, needed if `included` is empty.
+        """
+        postings = self.postings['rawtag']
+        if included:
+            found = set.intersection(*[postings.get(tag, set()) for tag in included])
+        else:
+            found = set(citekeys)
+        for tag in excluded:
+            found.difference_update(postings.get(tag, ()))
+        return found
+
+    def lookup(self, field, predicate):
+        """Return the citekeys of the papers with at least one term of
+        `field` verifying `predicate`."""
+        found = set()
+        for term, citekeys in self.postings[field].items():
+            if predicate(term):
+                found.update(citekeys)
+        return found
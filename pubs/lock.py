@@ -0,0 +1,152 @@
+"""Locks of a repository, shared between the pubs processes using it.
+
+Commands only reading the repository hold its lock in shared mode, and
+commands modifying it in exclusive mode (see `repo.Repository`), so that
+they don't see or write partial changes of each other. Locks are files of
+the cache directory, locked with flock. Without flock (e.g. on Windows),
+locks do nothing.
+
+Within a process, a lock is reentrant: the same `FileLock` is returned for
+a given path, and counts how many times it is held. A command run by
+`pubs_cmd` holds its locks until it ends (see `defer_release`), so that the
+changes it makes are committed by the git plugin before another process
+sees them.
+"""
+
+import os
+import time
+import errno
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+POLL_INTERVAL = 0.05
+
+# Lock of the repository, and lock serializing the writes of its caches.
+REPOSITORY_LOCK = 'lock'
+CACHE_LOCK = 'cache.lock'
+
+_locks = {}  # path -> FileLock
+_deferred = False
+
+
+class LockTimeout(Exception):
+
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return ('The repository is locked by another pubs process '
+                '(timeout waiting for {}).'.format(self.path))
+
+
+class FileLock(object):
+    """A lock on a file, held in shared or exclusive mode."""
+
+    def __init__(self, path, deferrable=False):
+        self.path = path
+        self.deferrable = deferrable  # see `defer_release`
+        self._fd = None
+        self._count = 0
+        self._shared = False
+
+    @property
+    def held(self):
+        return self._count > 0
+
+    def acquire(self, shared=False, timeout=None):
+        """Acquire the lock, waiting for at most `timeout` seconds (forever
+        if None).
+
+        If already held in shared mode, it is upgraded to exclusive mode if
+        needed: the shared lock is released first (two processes upgrading
+        at once would otherwise wait for each other), so others may modify
+        the repository in between. Commands modifying the repository hold
+        its lock in exclusive mode from the start. If the upgrade times out,
+        the lock is held in shared mode again.
+
+        :raises LockTimeout:  if the lock could not be acquired in time.
+        """
+        if self._count > 0 and (shared or not self._shared):
+            self._count += 1
+            return
+        if fcntl is not None:
+            upgrade = self._count > 0 and self._fd is not None
+            if upgrade:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            try:
+                self._lock(fcntl.LOCK_SH if shared else fcntl.LOCK_EX, timeout)
+            except LockTimeout:
+                if upgrade:  # still held, as before
+                    fcntl.flock(self._fd, fcntl.LOCK_SH)
+                raise
+        self._shared = shared
+        self._count += 1
+
+    def _lock(self, operation, timeout):
+        if self._fd is None:
+            try:
+                if not os.path.isdir(os.path.dirname(self.path)):
+                    os.makedirs(os.path.dirname(self.path))
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:  # read-only repository: no one can modify it
+                return
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+                return
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+            if deadline is not None and time.time() >= deadline:
+                if self._count == 0:
+                    self._close()
+                raise LockTimeout(self.path)
+            time.sleep(POLL_INTERVAL)
+
+    def release(self):
+        """Release the lock, once released as many times as acquired.
+        Does nothing after `defer_release`, if the lock is deferrable."""
+        if self._count == 0 or (_deferred and self.deferrable):
+            return
+        self._count -= 1
+        if self._count == 0 and self._fd is not None:
+            self._close()  # releases the flock
+
+    def _close(self):
+        try:
+            os.close(self._fd)
+        except OSError:  # e.g. lock file removed with the repository
+            pass
+        self._fd = None
+
+
+def get_lock(pubsdir, name=REPOSITORY_LOCK):
+    """Return a lock of the repository, or None if pubsdir does not exist
+    (nothing to lock yet)."""
+    pubsdir = os.path.abspath(os.path.expanduser(pubsdir))
+    if not os.path.isdir(pubsdir):
+        return None
+    path = os.path.join(pubsdir, '.cache', name)
+    if path not in _locks:
+        _locks[path] = FileLock(path, deferrable=(name == REPOSITORY_LOCK))
+    return _locks[path]
+
+
+def defer_release():
+    """Keep the deferrable locks (of repositories) held until `release_all`."""
+    global _deferred
+    _deferred = True
+
+
+def release_all():
+    """Release the locks held by this process (at the end of a command)."""
+    global _deferred
+    _deferred = False
+    for lock in _locks.values():
+        while lock.held:
+            lock.release()
@@ -66,8 +66,16 @@ else:
     ustr = str
     uchr = chr
     from urllib.parse import urlparse, quote_plus
-    from urllib.request import urlopen
-    from http.client import HTTPConnection
+
+    # urllib.request and http.client are slow to import, and only needed to
+    # download documents: they are imported on first use.
+    def urlopen(*args, **kwargs):
+        from urllib.request import urlopen
+        return urlopen(*args, **kwargs)
+
+    def HTTPConnection(*args, **kwargs):
+        from http.client import HTTPConnection
+        return HTTPConnection(*args, **kwargs)
 
     # The following has to be a function so that it can be mocked
     # for test_usecase.
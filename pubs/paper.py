@@ -1,7 +1,4 @@
 import copy
-from dateutil.parser import parse as datetime_parse
-
-from bibtexparser.customization import convert_to_unicode
 
 from . import bibstruct
 from .p3 import ustr
@@ -15,6 +12,7 @@ def _clean_metadata(metadata):
     meta.update(metadata or {})  # handles None metadata
     meta['tags'] = set(meta.get('tags', []))  # tags should be a set
     if 'added' in meta and isinstance(meta['added'], ustr):
+        from dateutil.parser import parse as datetime_parse
         meta['added'] = datetime_parse(meta['added'])
     return meta
 
@@ -34,6 +32,7 @@ class Paper(object):
         self.citekey = citekey
         self.metadata = _clean_metadata(metadata)
         self.bibdata = bibdata
+        self._normalized_fields = None
         bibstruct.check_citekey(self.citekey)
 
     def __eq__(self, other):
@@ -61,6 +60,20 @@ class Paper(object):
 
         # docpath
 
+    @property
+    def normalized_fields(self):
+        """Fields of the bibdata normalized for queries (see
+        `query.normalize_fields`). Computed when first needed, unless
+        given by the repository from its cache."""
+        if self._normalized_fields is None:
+            from .query import normalize_fields
+            self._normalized_fields = normalize_fields(self.bibdata)
+        return self._normalized_fields
+
+    @normalized_fields.setter
+    def normalized_fields(self, fields):
+        self._normalized_fields = fields
+
     @property
     def bibentry(self):
         return {self.citekey: self.bibdata}
@@ -106,6 +119,7 @@ class Paper(object):
 
     def get_unicode_bibdata(self):
         """Converts latex in bibdata fields to unicode."""
+        from bibtexparser.customization import convert_to_unicode
         return convert_to_unicode(self.bibdata)
 
     @staticmethod
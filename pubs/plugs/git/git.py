@@ -5,6 +5,8 @@ from subprocess import Popen, PIPE, STDOUT
 from pipes import quote as shell_quote
 
 from ... import uis
+from ... import lock
+from ... import timings
 from ...plugins import PapersPlugin
 from ...events import PaperChangeEvent, PostCommandEvent
 
@@ -34,6 +36,7 @@ class GitPlugin(PapersPlugin):
         self.manual = conf['plugins'].get('git', {}).get('manual', False)
         self.force_color = conf['plugins'].get('git', {}).get('force_color', True)
         self.quiet = conf['plugins'].get('git', {}).get('quiet', True)
+        self.lock_timeout = conf['main']['lock_timeout']
         self.list_of_changes = []
         self._gitinit()
 
@@ -115,7 +118,19 @@ def git_commit(event):
                     title = ' '.join(sys.argv) + '\n'
                     message = '\n'.join([title] + git.list_of_changes)
 
-                    git.shell('add .')
-                    git.shell('commit -F-', message.encode('utf-8'))
+                    # with the lock of the repository, so that no change of
+                    # another process is committed half-done
+                    repo_lock = lock.get_lock(git.pubsdir)
+                    if repo_lock is not None:
+                        repo_lock.acquire(timeout=git.lock_timeout)
+                    try:
+                        with timings.phase('git commit'):
+                            git.shell('add .')
+                            git.shell('commit -F-', message.encode('utf-8'))
+                    finally:
+                        if repo_lock is not None:
+                            repo_lock.release()
         except RuntimeError as exc:
             uis.get_ui().warning(exc.args[0])
+        except lock.LockTimeout as exc:
+            uis.get_ui().warning(str(exc))
@@ -1,45 +1,87 @@
 # PYTHON_ARGCOMPLETE_OK
 
+import os
 import sys
 import argparse
+import importlib
 import collections
 
 from . import uis
 from . import p3
 from . import config
 from . import events
-from . import commands
 from . import update
 from . import plugins
+from . import timings
+from . import lock
 from .__init__ import __version__
 from .completion import autocomplete
 
 
+# Modules of the core commands, in pubs.commands. They are imported only
+# when needed (see `execute`), to keep startup short.
 CORE_CMDS = collections.OrderedDict([
-    ('init', commands.init_cmd),
-    ('conf', commands.conf_cmd),
+    ('init', 'init_cmd'),
+    ('conf', 'conf_cmd'),
+    ('storage', 'storage_cmd'),
+    ('cache', 'cache_cmd'),
 
-    ('add', commands.add_cmd),
-    ('rename', commands.rename_cmd),
-    ('remove', commands.remove_cmd),
-    ('list', commands.list_cmd),
-    ('edit', commands.edit_cmd),
-    ('tag', commands.tag_cmd),
-    ('statistics', commands.statistics_cmd),
+    ('add', 'add_cmd'),
+    ('rename', 'rename_cmd'),
+    ('remove', 'remove_cmd'),
+    ('list', 'list_cmd'),
+    ('edit', 'edit_cmd'),
+    ('tag', 'tag_cmd'),
+    ('statistics', 'statistics_cmd'),
 
-    ('doc', commands.doc_cmd),
-    ('note', commands.note_cmd),
+    ('doc', 'doc_cmd'),
+    ('note', 'note_cmd'),
 
-    ('export', commands.export_cmd),
-    ('import', commands.import_cmd),
+    ('export', 'export_cmd'),
+    ('import', 'import_cmd'),
 
-    ('websearch', commands.websearch_cmd),
-    ('url', commands.url_cmd),
+    ('websearch', 'websearch_cmd'),
+    ('url', 'url_cmd'),
+
+    ('server', 'server_cmd'),
 ])
 
 
+def load_command(name):
+    """Import and return the module of a core command."""
+    return importlib.import_module('.commands.' + CORE_CMDS[name],
+                                   package=__package__)
+
+
+def commands_to_load(args):
+    """Return the names of the core commands whose parser must be built.
+
+    When running or completing a core command, the modules of the other
+    ones are not imported: they only get an empty parser, enough for argparse
+    to recognize them. Help and plugin commands need every parser.
+    """
+    if '_ARGCOMPLETE' in os.environ:
+        # The word being completed is ignored: while completing the name of
+        # the command, no parser is needed.
+        line = os.environ.get('COMP_LINE', '')
+        line = line[:int(os.environ.get('COMP_POINT', len(line)))]
+        args = line.split()[1:]
+        if args and not line[-1:].isspace():
+            args.pop()
+        while args and args[0].startswith('-'):
+            if args.pop(0) in ('-c', '--config'):
+                args = args[1:]
+        if not args:
+            return set()
+    if args and args[0] in CORE_CMDS:
+        return {args[0]}
+    return set(CORE_CMDS)
+
+
 def execute(raw_args=sys.argv):
 
+    profiler = None
+    sync_writes = False
     try:
         desc = 'Pubs: your bibliography on the command line.\nVisit https://github.com/pubs/pubs for more information.'
         parser = p3.ArgumentParser(prog="pubs", add_help=False, description=desc)
@@ -48,21 +90,48 @@ def execute(raw_args=sys.argv):
         parser.add_argument('--force-colors', dest='force_colors',
                             action='store_true', default=False,
                             help='colors are not disabled when piping to a file or other commands')
+        parser.add_argument('--timings', action='store_true', default=False,
+                            help='show the time spent in each phase of the command')
+        parser.add_argument('--profile', metavar='FILE', default=None,
+                            help='profile the command, and save the statistics '
+                                 'to FILE, as JSON if it ends with .json, in '
+                                 'pstats format otherwise')
         #parser.add_argument("-u", "--update", help="update config if needed",
         #                    default=False, action='store_true')
         top_args, remaining_args = parser.parse_known_args(raw_args[1:])
+        if top_args.timings or top_args.profile:
+            timings.enable()
+        if top_args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
 
         if top_args.config:
             conf_path = top_args.config
         else:
             conf_path = config.get_confpath(verify=False)  # will be checked on load
 
+        # Run by the server, if it is running (and not timed)
+        code = None
+        if remaining_args and not timings.enabled():
+            from . import server
+            code = server.forward(conf_path, remaining_args,
+                                  force_colors=top_args.force_colors or sys.stdout.isatty())
+        if code is not None:
+            if code != 0:
+                sys.exit(code)
+            return
+
         # Loading config
         try:
-            conf = config.load_conf(path=conf_path)
-            if update.update_check(conf, path=conf.filename):
-                # an update happened, reload conf.
+            with timings.phase('config'):
                 conf = config.load_conf(path=conf_path)
+            with timings.phase('update check'):
+                updated = update.update_check(conf, path=conf.filename)
+            if updated:
+                # an update happened, reload conf.
+                with timings.phase('config'):
+                    conf = config.load_conf(path=conf_path)
         except config.ConfigurationNotFound:
             if (len(remaining_args) == 0 or remaining_args[0] == 'init'
                 or all(arg[0] == '-' for arg in remaining_args)):  # only optional arguments
@@ -72,6 +141,17 @@ def execute(raw_args=sys.argv):
                 raise
 
         uis.init_ui(conf, force_colors=top_args.force_colors)
+        # the decoder is imported by the commands decoding bibtex, with the
+        # default engine set
+        decoder = conf['main']['bibtex_decoder']
+        if decoder != 'bibtexparser' or 'pubs.endecoder' in sys.modules:
+            from . import endecoder
+            endecoder.set_decoder(decoder)
+        sync_writes = conf['main']['sync_writes']
+        if sync_writes:
+            from . import content
+            content.defer_sync()
+        lock.defer_release()
         ui = uis.get_ui()
 
         parser.add_argument('-v', '--version', action='version', version=__version__)
@@ -80,31 +160,54 @@ def execute(raw_args=sys.argv):
         subparsers = parser.add_subparsers(title="commands", dest="command")
 
         # Populate the parser with core commands
-        for cmd_name, cmd_mod in CORE_CMDS.items():
-            cmd_parser = cmd_mod.parser(subparsers, conf)
-            cmd_parser.set_defaults(func=cmd_mod.command)
+        with timings.phase('parser'):
+            loaded_cmds = commands_to_load(remaining_args)
+            for cmd_name in CORE_CMDS:
+                if cmd_name not in loaded_cmds:
+                    subparsers.add_parser(cmd_name)
+                    continue
+                cmd_mod = load_command(cmd_name)
+                cmd_parser = cmd_mod.parser(subparsers, conf)
+                cmd_parser.set_defaults(func=cmd_mod.command)
 
         # Extend with plugin commands
-        plugins.load_plugins(conf, ui)
-        for p in plugins.get_plugins().values():
-            p.update_parser(subparsers, conf)
-
-        # Eventually autocomplete
-        autocomplete(parser)
-
-        # Parse and run appropriate command
-        # if no command, print help and exit peacefully (as '--help' does)
-        args = parser.parse_args(remaining_args)
+        with timings.phase('plugins'):
+            plugins.load_plugins(conf, ui)
+        with timings.phase('parser'):
+            for p in plugins.get_plugins().values():
+                p.update_parser(subparsers, conf)
+
+            # Eventually autocomplete
+            autocomplete(parser)
+
+            # Parse and run appropriate command
+            # if no command, print help and exit peacefully (as '--help' does)
+            args = parser.parse_args(remaining_args)
         if not args.command:
             parser.print_help(file=sys.stderr)
             sys.exit(2)
 
         events.PreCommandEvent().send()
         args.prog = "pubs"  # FIXME?
-        args.func(conf, args)
+        with timings.phase('command'):
+            args.func(conf, args)
 
+    except lock.LockTimeout as e:
+        uis.get_ui().error(str(e))
+        uis.get_ui().exit()
     except Exception as e:
         if not uis.get_ui().handle_exception(e):
             raise
     finally:
         events.PostCommandEvent().send()
+        if sync_writes:
+            with timings.phase('sync'):
+                content.sync_written_files()
+        lock.release_all()
+        if profiler is not None:
+            profiler.disable()
+            timings.save_profile(profiler, top_args.profile)
+        if timings.enabled():
+            if top_args.timings:
+                print(timings.format_results(timings.results()), file=sys.stderr)
+            timings.disable()
@@ -1,8 +1,8 @@
+import re
 import unicodedata
 
-from bibtexparser.latexenc import latex_to_unicode
-
 from . import bibstruct
+from .p3 import ustr
 
 
 QUERY_HELP = ('Paper query ("author:Einstein", "title:learning",'
@@ -20,10 +20,44 @@ FIELD_ALIASES = {
 }
 
 
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
 class InvalidQuery(ValueError):
     pass
 
 
+def tokenize(s):
+    """Split a string into words."""
+    return WORD_RE.findall(s)
+
+
+def normalize_text(s):
+    """Interpret latex commands and normalize unicode (NFC) in a string."""
+    # imported here, as bibtexparser is slow to import and not needed otherwise.
+    from bibtexparser.latexenc import latex_to_unicode
+    # Note: in theory latex_to_unicode also normalizes
+    return unicodedata.normalize('NFC', latex_to_unicode(s))
+
+
+def normalize_fields(bibdata):
+    """Normalize (see `normalize_text`) the fields of a bibtex entry that
+    queries look into: the last names of the authors, as a list, and the
+    other text fields.
+
+    Computed once for each entry of the bibcache (see
+    `datacache.CacheEntrySet.pull_normalized`), rather than for each query.
+    """
+    fields = {}
+    for field, value in bibdata.items():
+        if field == 'author':
+            fields[field] = [normalize_text(bibstruct.author_last(author))
+                             for author in value]
+        elif isinstance(value, ustr):
+            fields[field] = normalize_text(value)
+    return fields
+
+
 class QueryFilter(object):
     """Filter function for papers built from a given query.
 
@@ -34,6 +68,12 @@ class QueryFilter(object):
         (Overrides the case_sensitive parameter.)
     """
 
+    # Field of the search index used to preselect candidate papers,
+    # or None if the filter can not use the index.
+    index_field = None
+    # Whether the filter looks into `Paper.normalized_fields`.
+    uses_normalized_fields = False
+
     def __init__(self, query, case_sensitive=None, strict=False):
         if case_sensitive is None:
             case_sensitive = not query.islower()
@@ -44,15 +84,28 @@ class QueryFilter(object):
     def __call__(self, paper):
         raise NotImplementedError
 
+    def candidates(self, index):
+        """Return a superset of the citekeys of the matching papers.
+
+        Candidates are selected from the terms of `self.index_field` in the
+        search index (see `pubs.index.SearchIndex`) that contain the query.
+        """
+        query = self.query.lower()
+        return index.lookup(self.index_field, lambda term: query in term)
+
     def _is_query_in(self, field_value):
         return self.query in self._normalize(field_value)
 
+    def _is_query_in_normalized(self, field_value):
+        """Same as `_is_query_in`, for a value already normalized by
+        `normalize_fields` (but not lowercased)."""
+        return self.query in (field_value if self.case else field_value.lower())
+
     def _normalize(self, s):
         if self.strict:
             return s
         else:
-            s = unicodedata.normalize('NFC', latex_to_unicode(s))
-            # Note: in theory latex_to_unicode also normalizes
+            s = normalize_text(s)
             return s if self.case else s.lower()
 
 
@@ -63,18 +116,48 @@ class FieldFilter(QueryFilter):
         super(FieldFilter, self).__init__(query, case_sensitive=case_sensitive,
                                           strict=strict)
         self.field = field
+        self.uses_normalized_fields = not strict
+        if field == 'title' and not strict:
+            self.index_field = 'title'
 
     def __call__(self, paper):
-        return (self.field in paper.bibdata and
-                self._is_query_in(paper.bibdata[self.field]))
+        if self.field not in paper.bibdata:
+            return False
+        if not self.strict:
+            value = paper.normalized_fields.get(self.field)
+            if value is not None:
+                return self._is_query_in_normalized(value)
+        return self._is_query_in(paper.bibdata[self.field])
+
+    def candidates(self, index):
+        """The title is indexed by words: each word of the query must
+        be contained in a word of the title."""
+        words = tokenize(self.query.lower())
+        if not words:
+            return None
+        candidates = None
+        for word in words:
+            found = index.lookup(self.index_field, lambda term: word in term)
+            candidates = found if candidates is None else candidates & found
+        return candidates
 
 
 class AuthorFilter(QueryFilter):
 
+    def __init__(self, query, case_sensitive=None, strict=False):
+        super(AuthorFilter, self).__init__(query, case_sensitive=case_sensitive,
+                                           strict=strict)
+        if not strict:
+            self.index_field = 'author'
+            self.uses_normalized_fields = True
+
     def __call__(self, paper):
         """Only checks within last names."""
         if 'author' not in paper.bibdata:
             return False
+        elif not self.strict:
+            return any(self._is_query_in_normalized(last)
+                       for last in paper.normalized_fields['author'])
         else:
             return any([self._is_query_in(bibstruct.author_last(author))
                         for author in paper.bibdata['author']])
@@ -88,6 +171,12 @@ class CitekeyFilter(QueryFilter):
 
 class TagFilter(QueryFilter):
 
+    def __init__(self, query, case_sensitive=None, strict=False):
+        super(TagFilter, self).__init__(query, case_sensitive=case_sensitive,
+                                        strict=strict)
+        if not strict:
+            self.index_field = 'tag'
+
     def __call__(self, paper):
         return any([self._is_query_in(t) for t in paper.tags])
 
@@ -97,6 +186,8 @@ class YearFilter(QueryFilter):
        whose year field is set and can be converted to an int.
     """
 
+    index_field = 'year'
+
     def __init__(self, query):
         split = query.split('-')
         self.start = self._str_to_year(split[0])
@@ -116,12 +207,17 @@ class YearFilter(QueryFilter):
             return False
         else:
             try:
-                year = int(paper.bibdata['year'])
-                return ((self.start is None or year >= self.start) and
-                        (self.end is None or year <= self.end))
+                return self._in_range(int(paper.bibdata['year']))
             except ValueError:
                 return False
 
+    def candidates(self, index):
+        return index.lookup(self.index_field, self._in_range)
+
+    def _in_range(self, year):
+        return ((self.start is None or year >= self.start) and
+                (self.end is None or year <= self.end))
+
     @staticmethod
     def _str_to_year(s):
         try:
@@ -130,6 +226,42 @@ class YearFilter(QueryFilter):
             raise ValueError('Invalid year "{}"'.format(s))
 
 
+class PaperFilter(object):
+    """Conjunction of query filters.
+
+    Calling the filter on a paper tells if it matches all the query blocks.
+    When `indexed` is True, `candidates` can be used to restrict the papers
+    to test to a subset given by the search index.
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+
+    def __call__(self, paper):
+        return all([f(paper) for f in self.filters])
+
+    @property
+    def indexed(self):
+        return any(f.index_field is not None for f in self.filters)
+
+    @property
+    def uses_normalized_fields(self):
+        return any(f.uses_normalized_fields for f in self.filters)
+
+    def candidates(self, index):
+        """Intersection of the candidates of each indexed filter.
+
+        :returns: a set of citekeys, or None if no filter uses the index.
+        """
+        candidates = None
+        for f in self.filters:
+            if f.index_field is not None:
+                found = f.candidates(index)
+                if found is not None:
+                    candidates = found if candidates is None else candidates & found
+        return candidates
+
+
 def _get_field_value(query_block):
     split_block = query_block.split(':')
     if len(split_block) != 2:
@@ -169,4 +301,4 @@ def get_paper_filter(query, case_sensitive=None, strict=False):
                                       case_sensitive=case_sensitive,
                                       strict=strict)
                for query_block in query]
-    return lambda paper: all([f(paper) for f in filters])
+    return PaperFilter(filters)
@@ -1,9 +1,14 @@
+import bisect
 import itertools
+import functools
+import contextlib
 from datetime import datetime
 
 from . import bibstruct
 from . import events
-from .datacache import DataCache
+from . import lock
+from . import server
+from . import timings
 from .paper import Paper
 from .content import system_path
 
@@ -12,6 +17,59 @@ def _base27(n):
     return _base27((n - 1) // 26) + chr(ord('a') + ((n - 1) % 26)) if n else ''
 
 
+def _from_base27(s):
+    """Inverse of `_base27`, or None if s is not made of lowercase letters."""
+    n = 0
+    for c in s:
+        if not 'a' <= c <= 'z':
+            return None
+        n = 26 * n + ord(c) - ord('a') + 1
+    return n
+
+
+class SortedCitekeys(object):
+    """Citekeys as a sorted array, to find those beginning with a prefix
+    in O(log N + k)."""
+
+    def __init__(self, citekeys=()):
+        self.keys = sorted(citekeys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, citekey):
+        i = bisect.bisect_left(self.keys, citekey)
+        return i < len(self.keys) and self.keys[i] == citekey
+
+    def add(self, citekey):
+        i = bisect.bisect_left(self.keys, citekey)
+        if i == len(self.keys) or self.keys[i] != citekey:
+            self.keys.insert(i, citekey)
+
+    def discard(self, citekey):
+        i = bisect.bisect_left(self.keys, citekey)
+        if i < len(self.keys) and self.keys[i] == citekey:
+            del self.keys[i]
+
+    def with_prefix(self, prefix):
+        """Return the citekeys beginning with prefix, in order."""
+        i = bisect.bisect_left(self.keys, prefix)
+        found = []
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            found.append(self.keys[i])
+            i += 1
+        return tuple(found)
+
+    def first_free(self, base_key):
+        """Return the first of base_key, base_key + 'a', ..., base_key +
+        'z', base_key + 'aa'... (see `_base27`) that is not a citekey."""
+        used = set(_from_base27(citekey[len(base_key):])
+                   for citekey in self.with_prefix(base_key))
+        for n in itertools.count():
+            if n not in used:
+                return base_key + _base27(n)
+
+
 class CiteKeyError(Exception):
 
     default_message = "Wrong citekey: {}."
@@ -34,16 +92,49 @@ class CiteKeyNotFound(CiteKeyError):
     default_message = "No entry found for citekey: {}."
 
 
+class _Batch(object):
+    """Changes staged by `Repository.batch`."""
+
+    def __init__(self):
+        self.papers = {}     # citekey -> Paper to write, or None to remove
+        self.metadata_only = set()  # citekeys of papers whose bibtex is unchanged
+        self.existed = {}    # citekey -> whether it was in the repository
+        self.deferred = []   # removals of files, done on commit
+        self.undo = []       # undo the moves of files already done
+        self.events = []
+
+
 class Repository(object):
 
-    def __init__(self, conf, create=False):
+    def __init__(self, conf, create=False, shared=False):
+        """
+        :param shared:  if True, the repository is only read: the lock of
+                        the repository is held in shared mode, rather than
+                        in exclusive mode, until `close`.
+        """
         self.conf = conf
         self._citekeys = None
-        self.databroker = DataCache(self.conf['main']['pubsdir'],
-                                    self.conf['main']['docsdir'], create=create)
+        self._sorted_citekeys = None  # built when first needed
+        self._batch = None
+        self._shared = shared
+        # imported here, so that the commands (e.g. parsers built for
+        # completion) can import this module without the caches
+        from .datacache import get_datacache
+        self.databroker = get_datacache(self.conf['main']['pubsdir'],
+                                        self.conf['main']['docsdir'],
+                                        create=create,
+                                        storage=self.conf['main']['storage'])
+        self._lock = lock.get_lock(self.conf['main']['pubsdir'])
+        if self._lock is not None:
+            self._lock.acquire(shared=shared, timeout=self.conf['main']['lock_timeout'])
 
     def close(self):
         self.databroker.close()
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+        if not self._shared and getattr(self.conf, 'filename', None):
+            server.notify(self.conf.filename)
 
     @property
     def citekeys(self):
@@ -57,6 +148,8 @@ class Repository(object):
         The convention is that the paper is in the repository
         if and only if a bibfile is in the repository.
         """
+        if self._batch is not None and citekey in self._batch.papers:
+            return self._batch.papers[citekey] is not None
         return self.databroker.exists(citekey)
 
     def __len__(self):
@@ -64,17 +157,53 @@ class Repository(object):
         return len(self.citekeys)
 
     # papers
-    def all_papers(self):
-        for key in self.citekeys:
+    def all_papers(self, sort=False):
+        """Yield the papers, in the order of their citekeys if sort is True."""
+        self.databroker.check_cache()
+        for key in (self.sorted_citekeys.keys if sort else self.citekeys):
             yield self.pull_paper(key)
 
+    def filter_papers(self, paper_filter):
+        """Yield the papers matching a filter (see `query.get_paper_filter`).
+
+        If the filter can use it, the search index restricts the papers
+        that are loaded and tested to a set of candidates.
+        """
+        self.databroker.check_cache()
+        citekeys = self.citekeys
+        if paper_filter.indexed:
+            index = self.databroker.search_index(self.citekeys)
+            with timings.phase('filter'):
+                candidates = paper_filter.candidates(index)
+                if candidates is not None:
+                    citekeys = self.citekeys.intersection(candidates)
+        normalized = paper_filter.uses_normalized_fields
+        for key in citekeys:
+            paper = self.pull_paper(key)
+            if normalized:
+                paper.normalized_fields = self.databroker.pull_normalized_fields(key)
+            with timings.phase('filter'):
+                match = paper_filter(paper)
+            if match:
+                yield paper
+
+    @property
+    def sorted_citekeys(self):
+        if self._sorted_citekeys is None:
+            self._sorted_citekeys = SortedCitekeys(self.citekeys)
+        return self._sorted_citekeys
+
     def citekeys_from_prefix(self, prefix):
         """Return all citekey beginning with prefix."""
-        return tuple(citekey for citekey in self.citekeys
-                     if citekey.startswith(prefix))
+        return self.sorted_citekeys.with_prefix(prefix)
 
     def pull_paper(self, citekey):
         """Load a paper by its citekey from disk, if necessary."""
+        if self._batch is not None and citekey in self._batch.papers:
+            paper = self._batch.papers[citekey]
+            if paper is None:
+                raise CiteKeyNotFound(citekey)
+            return paper.deepcopy()
         if citekey in self:
             return Paper.from_bibentry(
                 self.databroker.pull_bibentry(citekey),
@@ -83,6 +212,11 @@ class Repository(object):
         else:
             raise CiteKeyNotFound(citekey)
 
+    def _pull_metadata(self, citekey):
+        if self._batch is not None and self._batch.papers.get(citekey) is not None:
+            return self._batch.papers[citekey].metadata
+        return self.databroker.pull_metadata(citekey)
+
     def push_paper(self, paper, overwrite=False, event=True):
         """ Push a paper to disk
 
@@ -94,18 +228,60 @@ class Repository(object):
             raise CiteKeyCollision(paper.citekey)
         if not paper.added:
             paper.added = datetime.now()
-        self.databroker.push_bibentry(paper.citekey, paper.bibentry)
-        self.databroker.push_metadata(paper.citekey, paper.metadata)
+        if self._batch is not None:
+            self._stage(paper.citekey, paper.deepcopy())
+        else:
+            self.databroker.push_bibentry(paper.citekey, paper.bibentry)
+            self.databroker.push_metadata(paper.citekey, paper.metadata)
         self.citekeys.add(paper.citekey)
+        if self._sorted_citekeys is not None:
+            self._sorted_citekeys.add(paper.citekey)
+        if event:
+            self.send_event(events.AddEvent(paper.citekey))
+
+    def push_metadata(self, paper, event=True):
+        """Push the metadata of a paper of the repository, its bibtex
+        being unchanged (only the metadata file is written)."""
+        if paper.citekey not in self:
+            raise CiteKeyNotFound(paper.citekey)
+        if self._batch is not None:
+            self._stage(paper.citekey, paper.deepcopy(), metadata_only=True)
+        else:
+            self.databroker.push_metadata(paper.citekey, paper.metadata)
         if event:
-            events.AddEvent(paper.citekey).send()
+            self.send_event(events.ModifyEvent(paper.citekey, 'metadata'))
+
+    def push_papers(self, papers, overwrite=False):
+        """Push several papers to disk, as a batch (see `batch`).
+
+        :returns:  the papers not pushed because their citekey is already in
+                   the repository (if overwrite is False).
+        """
+        collisions = []
+        with self.batch():
+            for paper in papers:
+                try:
+                    self.push_paper(paper, overwrite=overwrite)
+                except CiteKeyCollision:
+                    collisions.append(paper)
+        return collisions
 
     def remove_paper(self, citekey, remove_doc=True, event=True):
         """ Remove a paper. Is silent if nothing needs to be done."""
         if event:
-            events.RemoveEvent(citekey).send()
+            self.send_event(events.RemoveEvent(citekey))
         if remove_doc:
             self.remove_doc(citekey, detach_only=True)
+        self._defer(self._remove_note, citekey)
+        self.citekeys.remove(citekey)
+        if self._sorted_citekeys is not None:
+            self._sorted_citekeys.discard(citekey)
+        if self._batch is not None:
+            self._stage(citekey, None)
+        else:
+            self.databroker.remove(citekey)
+
+    def _remove_note(self, citekey):
         try:
             self.databroker.remove_note(citekey, self.conf['main']['note_extension'],
                                         silent=True)
@@ -113,25 +289,28 @@ class Repository(object):
             # FIXME: if IOError is about being unable to
             # remove the file, we need to issue an error.
             pass
-        self.citekeys.remove(citekey)
-        self.databroker.remove(citekey)
 
     def remove_doc(self, citekey, detach_only=False):
         """ Remove a doc. Is silent if nothing needs to be done."""
         try:
-            metadata = self.databroker.pull_metadata(citekey)
-            docpath = metadata.get('docfile')
-            self.databroker.remove_doc(docpath, silent=True)
+            metadata = self._pull_metadata(citekey)
+            self._defer(self._remove_doc, metadata.get('docfile'))
             if not detach_only:
                 p = self.pull_paper(citekey)
                 p.docpath = None
                 self.push_paper(p, overwrite=True, event=False)
-                events.DocRemoveEvent(citekey).send()
+                self.send_event(events.DocRemoveEvent(citekey))
         except IOError:
             # FIXME: if IOError is about being unable to
             # remove the file, we need to issue an error.I
             pass
 
+    def _remove_doc(self, docpath):
+        try:
+            self.databroker.remove_doc(docpath, silent=True)
+        except IOError:
+            pass
+
     def pull_docpath(self, citekey):
         try:
             p = self.pull_paper(citekey)
@@ -164,22 +343,29 @@ class Repository(object):
                 msg = "Can't rename paper to {}, citekey already exists.".format(new_citekey)
                 raise CiteKeyCollision(new_citekey, message=msg)
 
-            # move doc file if necessary
-            if self.databroker.in_docsdir(paper.docpath):
-                paper.docpath = self.databroker.rename_doc(paper.docpath, new_citekey)
-
-            # move note file if necessary
-            try:
-                self.databroker.rename_note(old_citekey, new_citekey,
-                                            self.conf['main']['note_extension'])
-            except IOError:
-                pass
-
-            self.push_paper(paper, event=False)
-            # remove_paper of old_citekey
-            self.remove_paper(old_citekey, event=False)
-            # send event
-            events.RenameEvent(paper, old_citekey).send()
+            with self.batch():
+                # move doc file if necessary
+                if self.databroker.in_docsdir(paper.docpath):
+                    old_docpath = paper.docpath
+                    paper.docpath = self.databroker.rename_doc(old_docpath, new_citekey)
+                    self._batch.undo.append(lambda docpath=paper.docpath:
+                                            self.databroker.rename_doc(docpath, old_citekey))
+
+                # move note file if necessary
+                extension = self.conf['main']['note_extension']
+                try:
+                    self.databroker.rename_note(old_citekey, new_citekey, extension)
+                    self._batch.undo.append(lambda:
+                                            self.databroker.rename_note(new_citekey, old_citekey,
+                                                                        extension))
+                except IOError:
+                    pass
+
+                self.push_paper(paper, event=False)
+                # remove_paper of old_citekey (its doc has been moved)
+                self.remove_paper(old_citekey, remove_doc=False, event=False)
+                # send event
+                self.send_event(events.RenameEvent(paper, old_citekey))
             return True
 
 
@@ -193,11 +379,128 @@ class Repository(object):
             copy = self.conf['main']['doc_add'] in ('copy', 'move')
         if copy:
             docfile = self.databroker.add_doc(paper.citekey, docfile)
+            if self._batch is not None:
+                self._batch.undo.append(lambda: self._remove_doc(docfile))
         else:
             docfile = system_path(docfile)
         paper.docpath = docfile
         self.push_paper(paper, overwrite=True, event=False)
-        events.DocAddEvent(paper.citekey).send()
+        self.send_event(events.DocAddEvent(paper.citekey))
+
+    # batches
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group changes of the repository, for many papers at once.
+
+            with repo.batch():
+                for paper in papers:
+                    repo.push_paper(paper, overwrite=True)
+
+        Papers pushed and removed are staged in memory (and seen as such by
+        the repository), and written together on exit, as a single
+        transaction of the storage when supported; removals of docs and
+        notes are also done then. On exception, including while writing,
+        the papers already written are restored, moves of docs and notes
+        are undone, and the exception is raised again. Events are then sent,
+        as a single `events.BatchEvent` (one commit of the git plugin; the
+        listeners of the grouped events still get each of them), and the
+        cache is saved once.
+
+        Nested batches are part of the outermost one.
+        """
+        if self._batch is not None:
+            yield
+            return
+        batch = self._batch = _Batch()
+        try:
+            yield
+            self._write(batch)
+        except BaseException:
+            self._rollback(batch)
+            raise
+        finally:
+            self._batch = None
+        if len(batch.events) == 1:
+            batch.events[0].send()
+        elif batch.events:
+            events.BatchEvent(batch.events).send()
+        if batch.papers:
+            self.databroker.flush_cache()
+
+    def send_event(self, event):
+        """Send an event, or keep it for the end of the current batch."""
+        if self._batch is not None:
+            self._batch.events.append(event)
+        else:
+            event.send()
+
+    def _stage(self, citekey, paper, metadata_only=False):
+        if citekey not in self._batch.existed:
+            self._batch.existed[citekey] = self.databroker.exists(citekey)
+        if not metadata_only:
+            self._batch.metadata_only.discard(citekey)
+        elif citekey not in self._batch.papers:  # else, its bibtex is written too
+            self._batch.metadata_only.add(citekey)
+        self._batch.papers[citekey] = paper
+
+    def _defer(self, action, *args):
+        if self._batch is not None:
+            self._batch.deferred.append((action, args))
+        else:
+            action(*args)
+
+    def _write(self, batch):
+        with self.databroker.transaction():
+            for citekey, paper in batch.papers.items():
+                # the storage may not have transactions: keep what is
+                # needed to restore the paper if a write fails
+                if citekey in batch.metadata_only:
+                    batch.undo.append(functools.partial(
+                        self.databroker.push_metadata, citekey,
+                        self.databroker.pull_metadata(citekey)))
+                    self.databroker.push_metadata(citekey, paper.metadata)
+                    continue
+                if batch.existed[citekey]:
+                    batch.undo.append(functools.partial(
+                        self._restore, citekey, self.databroker.pull_bibentry(citekey),
+                        self.databroker.pull_metadata(citekey)))
+                else:
+                    batch.undo.append(functools.partial(self._restore, citekey))
+                if paper is None:
+                    if batch.existed[citekey]:
+                        self.databroker.remove(citekey)
+                else:
+                    self.databroker.push_bibentry(citekey, paper.bibentry)
+                    self.databroker.push_metadata(citekey, paper.metadata)
+            for action, args in batch.deferred:
+                action(*args)
+
+    def _restore(self, citekey, bibentry=None, metadata=None):
+        """Write a paper back as it was before a batch (None if it was not
+        in the repository)."""
+        if bibentry is None:
+            if self.databroker.exists(citekey):
+                self.databroker.remove(citekey)
+        else:
+            self.databroker.push_bibentry(citekey, bibentry)
+            self.databroker.push_metadata(citekey, metadata)
+
+    def _rollback(self, batch):
+        for undo in reversed(batch.undo):
+            try:
+                undo()
+            except (IOError, OSError, ValueError):
+                pass
+        for citekey, existed in batch.existed.items():
+            if existed:
+                self.citekeys.add(citekey)
+                if self._sorted_citekeys is not None:
+                    self._sorted_citekeys.add(citekey)
+            else:
+                self.citekeys.discard(citekey)
+                if self._sorted_citekeys is not None:
+                    self._sorted_citekeys.discard(citekey)
 
     def unique_citekey(self, base_key, bibentry):
         """Create a unique citekey for a given base key.
@@ -207,13 +510,25 @@ class Repository(object):
         """
         if not bibstruct.valid_citekey(base_key):
             base_key = bibstruct.generate_citekey(bibentry)
-        for n in itertools.count():
-            if not base_key + _base27(n) in self.citekeys:
-                return base_key + _base27(n)
+        if base_key not in self.citekeys:
+            return base_key
+        return self.sorted_citekeys.first_free(base_key)
+
+    def _tag_index(self):
+        self.databroker.check_cache(caches=('metacache',))  # no bibtex decoded
+        return self.databroker.tag_index(self.citekeys)
 
     def get_tags(self):
-        """FIXME: bibdata doesn't need to be read."""
-        tags = set()
-        for p in self.all_papers():
-            tags = tags.union(p.tags)
-        return tags
+        """Return the tags of the papers. Only metadata is read."""
+        return set(self._tag_index().postings['rawtag'])
+
+    def tag_counts(self):
+        """Return a dictionary associating each tag to its number of papers."""
+        return {tag: len(citekeys)
+                for tag, citekeys in self._tag_index().postings['rawtag'].items()}
+
+    def tagged_citekeys(self, included=(), excluded=()):
+        """Return the citekeys of the papers with all the `included` tags
+        and none of the `excluded` ones. Only metadata is read."""
+        return self._tag_index().tagged(included, excluded,
+                                        citekeys=self.citekeys)
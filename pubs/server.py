@@ -0,0 +1,292 @@
+"""Server keeping a repository loaded between commands (see `pubs server`).
+
+The server runs, in a single process, the commands forwarded by the pubs
+executable through a Unix socket: modules are imported, and the caches and
+index of the repository loaded, only once. A watcher polls the meta and bib
+files of the repository, so that changes made outside of pubs are seen
+without reading the directories for each command. Changes made by other
+pubs processes are seen by the next command: they notify the server (see
+`notify`), and the directories are read again if modified since.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import sys
+import json
+import socket
+import hashlib
+import tempfile
+import threading
+import traceback
+
+from . import p3
+from . import uis
+
+
+# Commands forwarded to the server, when it runs. The others, which may be
+# interactive, are always run by the pubs executable.
+SERVED_CMDS = ('list', 'tag', 'statistics', 'export')
+
+# Delay, in seconds, between two checks of the files of the repository.
+POLL_INTERVAL = 1.
+
+_serving = False  # in the server process, commands are not forwarded
+
+
+def socket_path(conf_path):
+    """Path of the socket of the server using a configuration file."""
+    conf_path = os.path.abspath(os.path.expanduser(conf_path))
+    digest = hashlib.sha1(conf_path.encode('utf-8')).hexdigest()[:16]
+    rundir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(rundir, 'pubs-{}-{}.sock'.format(os.getuid(), digest))
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _receive(sock):
+    with sock.makefile('rb') as f:
+        line = f.readline()
+    if not line:
+        raise IOError('pubs server closed the connection.')
+    return json.loads(line.decode('utf-8'))
+
+
+def _connect(conf_path):
+    """Return a socket connected to the server, or None if it is not running."""
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except (AttributeError, OSError):  # no Unix sockets
+        return None
+    try:
+        sock.connect(socket_path(conf_path))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def is_running(conf_path):
+    sock = _connect(conf_path)
+    if sock is None:
+        return False
+    with sock:
+        _send(sock, {'ping': True})
+        _receive(sock)
+    return True
+
+
+def stop(conf_path):
+    """Stop the server; return False if it was not running."""
+    sock = _connect(conf_path)
+    if sock is None:
+        return False
+    with sock:
+        _send(sock, {'stop': True})
+        _receive(sock)
+    return True
+
+
+def notify(conf_path):
+    """Tell the server, if it is running, that the repository was modified
+    by another process (the changes are then seen by the next command it
+    runs, rather than once its watcher polls the files)."""
+    if _serving:
+        return
+    sock = _connect(conf_path)
+    if sock is None:
+        return
+    with sock:
+        _send(sock, {'changed': True})
+
+
+def forward(conf_path, args, force_colors=False):
+    """Run a command in the server, if it is running and serves it.
+
+    The output of the command is written to the standard outputs.
+    :returns: the exit code of the command, or None if it was not run.
+    """
+    if _serving or not args or args[0] not in SERVED_CMDS:
+        return None
+    sock = _connect(conf_path)
+    if sock is None:
+        return None
+    with sock:
+        _send(sock, {'args': args, 'cwd': os.getcwd(),
+                     'force_colors': force_colors})
+        reply = _receive(sock)
+    for out, get_raw in ((reply['stdout'], p3._get_raw_stdout),
+                         (reply['stderr'], p3._get_raw_stderr)):
+        if out:
+            raw = get_raw()
+            raw.write(out.encode('utf-8', 'surrogateescape'))
+            raw.flush()
+    return reply['code']
+
+
+class Watcher(threading.Thread):
+    """Polls the meta and bib files of a repository, and records their
+    changes (see `datacache.DataCache.watch`)."""
+
+    def __init__(self, pubsdir, storage='files', interval=POLL_INTERVAL):
+        super(Watcher, self).__init__()
+        self.daemon = True
+        self.pubsdir = pubsdir
+        self.storage = storage
+        self.interval = interval
+        self._changes = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._baseline = None
+
+    def start(self, listing=None):
+        """Start polling. Changes are found against `listing` (the one the
+        caches were checked against), or else the listing when started."""
+        if listing is not None:
+            self._baseline = {kind: dict(listing[kind])
+                              for kind in ('metafiles', 'bibfiles')}
+        super(Watcher, self).start()
+
+    def run(self):
+        # The broker is used by this thread only (sqlite connections can't
+        # be shared between threads).
+        from . import databroker
+        broker = databroker.STORAGES[self.storage](self.pubsdir)
+        try:
+            previous = self._baseline or broker.listing(filestats=True)
+            while not self._stopped.wait(self.interval):
+                try:
+                    listing = broker.listing(filestats=True)
+                except (IOError, OSError):
+                    continue
+                changes = {}
+                for kind in ('metafiles', 'bibfiles'):
+                    old, new = previous[kind], listing[kind]
+                    for citekey, mtime in new.items():
+                        if old.get(citekey) != mtime:
+                            changes[kind, citekey] = mtime
+                    for citekey in set(old).difference(new):
+                        changes[kind, citekey] = None
+                if changes:
+                    with self._lock:
+                        self._changes.update(changes)
+                previous = listing
+        finally:
+            broker.close()
+
+    def pop_changes(self):
+        """Return the changes since the last call, as a dictionary
+        associating (kind, citekey) to the new modification time of the
+        file (None if removed), kind being 'metafiles' or 'bibfiles'."""
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        return changes
+
+    def stop(self):
+        self._stopped.set()
+
+
+class Server(object):
+
+    def __init__(self, conf, conf_path, interval=POLL_INTERVAL):
+        self.conf = conf
+        self.conf_path = os.path.abspath(conf_path)
+        self.interval = interval
+        self.running = False
+        self.cache = None
+
+    def serve(self, ui):
+        """Serve commands until stopped (see `stop`)."""
+        global _serving
+        _serving = True
+        path = socket_path(self.conf_path)
+        if is_running(self.conf_path):
+            ui.error('A pubs server is already running on {}.'.format(path))
+            ui.exit()
+        if os.path.exists(path):  # left by a server that was killed
+            os.remove(path)
+
+        from . import datacache
+        main = self.conf['main']
+        datacache.keep_datacaches()
+        watcher = Watcher(main['pubsdir'], storage=main['storage'],
+                          interval=self.interval)
+        cache = datacache.get_datacache(main['pubsdir'], main['docsdir'],
+                                        storage=main['storage'])
+        cache.watch(watcher)
+        self.cache = cache
+        cache.check_cache()  # load the caches and the listing
+        # changes made since the listing are found by the watcher
+        watcher.start(listing=cache.checked_listing)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # only the user can connect
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+        sock.listen(5)
+        ui.info('pubs server listening on {}.'.format(path))
+        self.running = True
+        try:
+            while self.running:
+                conn, _ = sock.accept()
+                with conn:
+                    self._handle(conn)
+        finally:
+            watcher.stop()
+            cache.kept = False
+            cache.close()
+            sock.close()
+            os.remove(path)
+
+    def _handle(self, conn):
+        try:
+            request = _receive(conn)
+        except (IOError, ValueError):
+            return
+        if request.get('stop'):
+            self.running = False
+        if request.get('changed'):
+            self.cache.stale_listing()
+            return  # no reply expected
+        if 'args' in request:
+            reply = self.run(request['args'], request['cwd'],
+                             force_colors=request.get('force_colors', False))
+        else:
+            reply = {'code': 0, 'stdout': '', 'stderr': ''}
+        try:
+            _send(conn, reply)
+        except OSError:  # client went away
+            pass
+
+    def run(self, args, cwd, force_colors=False):
+        """Run a command as the pubs executable would, capturing its output."""
+        from . import pubs_cmd
+        saved = (sys.stdout, sys.stderr, sys.stdin, sys.argv, os.getcwd(),
+                 uis._ui)
+        sys.stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8',
+                                      write_through=True)
+        sys.stderr = io.TextIOWrapper(io.BytesIO(), encoding='utf-8',
+                                      write_through=True)
+        sys.stdin = io.StringIO()  # no user input
+        sys.argv = ['pubs'] + args
+        code = 0
+        try:
+            os.chdir(cwd)
+            pubs_cmd.execute(['pubs', '-c', self.conf_path] +
+                             (['--force-colors'] if force_colors else []) + args)
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else int(exc.code is not None)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            outputs = [out.detach().getvalue().decode('utf-8', 'surrogateescape')
+                       for out in (sys.stdout, sys.stderr)]
+            sys.stdout, sys.stderr, sys.stdin, sys.argv, cwd, uis._ui = saved
+            os.chdir(cwd)
+        return {'code': code, 'stdout': outputs[0], 'stderr': outputs[1]}
@@ -0,0 +1,172 @@
+import os
+import time
+import contextlib
+
+from .content import check_directory, check_file, system_path
+
+
+DB_NAME = 'pubs.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metafiles (
+    citekey TEXT PRIMARY KEY, content TEXT NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS bibfiles (
+    citekey TEXT PRIMARY KEY, content TEXT NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS cachefiles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS cachefiles_name ON cachefiles (name);
+"""
+
+
+class SQLiteBroker(object):
+    """ Stores the meta and bib content of the repository, as well as the
+        caches, in a single SQLite database.
+
+        Provides the same interface as `filebroker.FileBroker`: content is
+        stored as text, without any encoding/decoding, and modification
+        times are recorded for each entry, so that caches can be validated
+        the same way as with files. Cache files are stored as chunks of
+        data, so that appending to them does not rewrite them.
+    """
+
+    def __init__(self, directory, create=False):
+        self.directory = os.path.expanduser(directory)
+        self.dbpath = os.path.join(self.directory, DB_NAME)
+        if create and not check_directory(self.directory, fail=False):
+            os.mkdir(system_path(self.directory))
+        check_directory(self.directory)
+        if not create:
+            check_file(self.dbpath)
+        import sqlite3  # only when the repository is stored in a database
+        self.connection = sqlite3.connect(system_path(self.dbpath))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self._in_transaction = False
+
+    def close(self):
+        self.connection.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group the writes in a single transaction, committed at the end
+        (or rolled back on exception)."""
+        if self._in_transaction:  # nested
+            yield
+            return
+        self._in_transaction = True
+        try:
+            with self.connection:
+                yield
+        finally:
+            self._in_transaction = False
+
+    def _write(self, *statements):
+        with self.transaction():
+            for statement in statements:
+                self.connection.execute(*statement)
+
+    def _pull(self, table, column, citekey):
+        row = self.connection.execute(
+            'SELECT {} FROM {} WHERE citekey = ?'.format(column, table),
+            (citekey,)).fetchone()
+        if row is None:
+            raise IOError("'{}' not found in {}.".format(citekey, table))
+        return row[0]
+
+    @staticmethod
+    def _push(table, citekey, content):
+        return ('INSERT OR REPLACE INTO {} (citekey, content, mtime) '
+                'VALUES (?, ?, ?)'.format(table), (citekey, content, time.time()))
+
+    def pull_cachefile(self, filename):
+        rows = self.connection.execute(
+            'SELECT data FROM cachefiles WHERE name = ? ORDER BY id',
+            (filename,)).fetchall()
+        if not rows:
+            raise IOError("cache '{}' not found.".format(filename))
+        return b''.join(bytes(row[0]) for row in rows)
+
+    def map_cachefile(self, filename):
+        return self.pull_cachefile(filename)
+
+    def push_cachefile(self, filename, data):
+        self._write(('DELETE FROM cachefiles WHERE name = ?', (filename,)),
+                    ('INSERT INTO cachefiles (name, data) VALUES (?, ?)',
+                     (filename, memoryview(data))))
+
+    def append_cachefile(self, filename, data):
+        self._write(('INSERT INTO cachefiles (name, data) VALUES (?, ?)',
+                     (filename, memoryview(data))))
+
+    def remove_cachefile(self, filename):
+        self._write(('DELETE FROM cachefiles WHERE name = ?', (filename,)))
+
+    def mtime_metafile(self, citekey):
+        return self._pull('metafiles', 'mtime', citekey)
+
+    def mtime_bibfile(self, citekey):
+        return self._pull('bibfiles', 'mtime', citekey)
+
+    def pull_metafile(self, citekey):
+        return self._pull('metafiles', 'content', citekey)
+
+    def pull_bibfile(self, citekey):
+        return self._pull('bibfiles', 'content', citekey)
+
+    def push_metafile(self, citekey, metadata):
+        self._write(self._push('metafiles', citekey, metadata))
+
+    def push_bibfile(self, citekey, bibdata):
+        self._write(self._push('bibfiles', citekey, bibdata))
+
+    def push(self, citekey, metadata, bibdata):
+        self._write(self._push('metafiles', citekey, metadata),
+                    self._push('bibfiles', citekey, bibdata))
+
+    def remove(self, citekey):
+        self._write(('DELETE FROM metafiles WHERE citekey = ?', (citekey,)),
+                    ('DELETE FROM bibfiles WHERE citekey = ?', (citekey,)))
+
+    def exists(self, citekey, meta_check=False):
+        """ Checks wether the bibtex of a citekey exists.
+
+            :param meta_check:  if True, will return if both the bibtex and the meta file exists.
+        """
+        tables = ['bibfiles', 'metafiles'] if meta_check else ['bibfiles']
+        for table in tables:
+            row = self.connection.execute(
+                'SELECT 1 FROM {} WHERE citekey = ?'.format(table),
+                (citekey,)).fetchone()
+            if row is None:
+                return False
+        return True
+
+    def listing(self, filestats=True):
+        listing = {}
+        for key, table in [('metafiles', 'metafiles'), ('bibfiles', 'bibfiles')]:
+            rows = self.connection.execute(
+                'SELECT citekey, mtime FROM {}'.format(table)).fetchall()
+            if filestats:
+                listing[key] = dict(rows)
+            else:
+                listing[key] = [citekey for citekey, _ in rows]
+        return listing
+
+    def stamp(self):
+        """Return a value that changes when the database is written by
+        another connection (see `filebroker.FileBroker.stamp`)."""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def metadata_stamp(self):
+        """See `filebroker.FileBroker.metadata_stamp`."""
+        count, mtime = self.connection.execute(
+            'SELECT count(*), max(mtime) FROM metafiles').fetchone()
+        return '{}:{!r}'.format(count, mtime)
+
+    def destroy(self):
+        """Remove the database. Used when converting to another storage."""
+        self.close()
+        for suffix in ['', '-wal', '-shm']:
+            if check_file(self.dbpath + suffix, fail=False):
+                os.remove(system_path(self.dbpath + suffix))
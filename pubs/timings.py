@@ -0,0 +1,100 @@
+"""Timing of the phases of a command (see the --timings and --profile options).
+
+Code run in a phase is enclosed in `with timings.phase(name):`. Phases can
+be nested: the time of the inner one is not counted in the outer one. When
+timings are not enabled, phases cost a single test.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import time
+import collections
+
+
+_timings = None  # phase name -> [seconds, calls], when enabled
+_stack = []  # [name, start, time spent in inner phases] of running phases
+_start = None
+
+
+def enable():
+    global _timings, _start
+    _timings = collections.OrderedDict()
+    del _stack[:]
+    _start = time.perf_counter()
+
+
+def disable():
+    global _timings
+    _timings = None
+
+
+def enabled():
+    return _timings is not None
+
+
+class phase(object):
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _timings is not None:
+            _stack.append([self.name, time.perf_counter(), 0.])
+
+    def __exit__(self, *exc):
+        if _timings is not None and _stack:
+            name, start, inner = _stack.pop()
+            elapsed = time.perf_counter() - start
+            timing = _timings.setdefault(name, [0., 0])
+            timing[0] += elapsed - inner
+            timing[1] += 1
+            if _stack:
+                _stack[-1][2] += elapsed
+
+
+def results():
+    """Return the timings since `enable`, as a dictionary with the total
+    time, and the time and number of calls of each phase, in seconds."""
+    total = time.perf_counter() - _start
+    phases = collections.OrderedDict(
+        (name, {'time': t, 'calls': calls}) for name, (t, calls) in _timings.items())
+    return {'total': total, 'phases': phases}
+
+
+def format_results(res):
+    lines = ['{:<14} {:>9} {:>8}'.format('phase', 'time', 'calls')]
+    for name, t in res['phases'].items():
+        lines.append('{:<14} {:8.3f}s {:8d}'.format(name, t['time'], t['calls']))
+    other = res['total'] - sum(t['time'] for t in res['phases'].values())
+    lines.append('{:<14} {:8.3f}s'.format('other', other))
+    lines.append('{:<14} {:8.3f}s'.format('total', res['total']))
+    return '\n'.join(lines)
+
+
+def profile_stats(profiler):
+    """Return the statistics of a cProfile profiler, as a list of
+    dictionaries, by decreasing cumulative time."""
+    import pstats
+    stats = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in \
+            pstats.Stats(profiler).stats.items():
+        stats.append({'function': function, 'file': filename, 'line': line,
+                      'calls': calls, 'tottime': tottime, 'cumtime': cumtime})
+    stats.sort(key=lambda s: -s['cumtime'])
+    return stats
+
+
+def save_profile(profiler, path):
+    """Save the statistics of a profiler, as JSON, with the timings of the
+    phases, if path ends with '.json', and in pstats format otherwise."""
+    if path.endswith('.json'):
+        data = {'functions': profile_stats(profiler)}
+        if enabled():
+            data['timings'] = results()
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    else:
+        profiler.dump_stats(path)
@@ -75,6 +75,29 @@ class PrintUI(object):
         kwargs['file'] = self._stdout
         print(*messages, **kwargs)
 
+    def message_lines(self, lines):
+        """Print messages, one per line, as they are produced.
+
+        Output is buffered, except for the first message, shown at once.
+        If the output is closed (e.g. when piped to `head`), the remaining
+        messages are not produced.
+        """
+        try:
+            for i, line in enumerate(lines):
+                print(line, file=self._stdout)
+                if i == 0:
+                    self._stdout.flush()
+            self._stdout.flush()
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                raise
+            # Later writes, including the flush on exit, go to devnull.
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, self._stdout.fileno())
+            except (AttributeError, ValueError, OSError):
+                pass
+
     def info(self, message, **kwargs):
         kwargs['file'] = self._stdout
         print('{}: {}'.format(color.dye_out('info', 'ok'), message), **kwargs)
@@ -12,6 +12,8 @@ def resolve_citekey(repo, conf, citekey, ui=None, exit_on_fail=True):
         :returns found citekey
     """
     # FIXME. Make me optionally non ui interactive/exiting
+    if citekey in repo.citekeys:  # exact citekeys are never ambiguous
+        return citekey
     citekeys = repo.citekeys_from_prefix(citekey)
     if len(citekeys) == 0:
         if ui is not None:
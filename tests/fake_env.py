@@ -10,7 +10,7 @@ import dotdot
 from pyfakefs import fake_filesystem, fake_filesystem_unittest
 
 from pubs.p3 import input
-from pubs import content, filebroker, uis
+from pubs import content, filebroker, uis, lock
 
 # code for fake fs
 
@@ -93,6 +93,7 @@ class TestFakeFs(fake_filesystem_unittest.TestCase):
         self.rootpath = os.path.abspath(os.path.dirname(__file__))
         self.homepath = os.path.expanduser('~')
         self.setUpPyfakefs()
+        lock._locks.clear()  # held on the files of previous fake filesystems
         self.reset_fs()
 
     def reset_fs(self):
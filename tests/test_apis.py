@@ -17,7 +17,7 @@ import mock_requests
 
 class APITests(unittest.TestCase):
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_readme(self, reqget):
         apis.doi2bibtex('10.1007/s00422-012-0514-6')
         # apis.isbn2bibtex('978-0822324669')  # FIXME: uncomment when ISBNs work again
@@ -25,13 +25,13 @@ class APITests(unittest.TestCase):
 
 class TestDOI2Bibtex(APITests):
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_unicode(self, reqget):
         bib = apis.doi2bibtex('10.1007/BF01700692')
         self.assertIsInstance(bib, ustr)
         self.assertIn('Kurt Gödel', bib)
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_parses_to_bibtex(self, reqget):
         bib = apis.get_bibentry_from_api('10.1007/BF01700692', 'DOI')
         self.assertEqual(len(bib), 1)
@@ -41,7 +41,7 @@ class TestDOI2Bibtex(APITests):
                          'Über formal unentscheidbare Sätze der Principia '
                          'Mathematica und verwandter Systeme I')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_retrieve_fails_on_incorrect_DOI(self, reqget):
         with self.assertRaises(apis.ReferenceNotFoundError):
             apis.get_bibentry_from_api('999999', 'doi')
@@ -50,14 +50,14 @@ class TestDOI2Bibtex(APITests):
 class TestISBN2Bibtex(APITests):
 
     # try to avoid triggering 403 status during tests.
-    # @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    # @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     # def test_unicode(self, reqget):
     #     bib = apis.isbn2bibtex('9782081336742')
     #     self.assertIsInstance(bib, ustr)
     #     self.assertIn('Poincaré, Henri', bib)
 
     @pytest.mark.skip(reason="isbn is not working anymore, see https://github.com/pubs/pubs/issues/276")
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_parses_to_bibtex(self, reqget):
         bib = apis.get_bibentry_from_api('9782081336742', 'ISBN')
         self.assertEqual(len(bib), 1)
@@ -65,7 +65,7 @@ class TestISBN2Bibtex(APITests):
         self.assertEqual(entry['author'][0], 'Poincaré, Henri')
         self.assertEqual(entry['title'], 'La science et l\'hypothèse')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_retrieve_fails_on_incorrect_ISBN(self, reqget):
         with self.assertRaises(apis.ReferenceNotFoundError):
             apis.get_bibentry_from_api('9' * 13, 'isbn')
@@ -73,7 +73,7 @@ class TestISBN2Bibtex(APITests):
 
 class TestArxiv2Bibtex(APITests):
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_new_style(self, reqget):
         bib = apis.get_bibentry_from_api('astro-ph/9812133', 'arXiv')
         self.assertEqual(len(bib), 1)
@@ -81,7 +81,7 @@ class TestArxiv2Bibtex(APITests):
         self.assertEqual(entry['author'][0], 'Perlmutter, S.')
         self.assertEqual(entry['year'], '1999')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_parses_to_bibtex_with_doi(self, reqget):
         bib = apis.get_bibentry_from_api('astro-ph/9812133', 'arxiv')
         self.assertEqual(len(bib), 1)
@@ -89,7 +89,7 @@ class TestArxiv2Bibtex(APITests):
         self.assertEqual(entry['author'][0], 'Perlmutter, S.')
         self.assertEqual(entry['year'], '1999')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_parses_to_bibtex_without_doi(self, reqget):
         bib = apis.get_bibentry_from_api('math/0211159', 'ARXIV')
         self.assertEqual(len(bib), 1)
@@ -100,18 +100,18 @@ class TestArxiv2Bibtex(APITests):
                 entry['title'],
                 'The entropy formula for the Ricci flow and its geometric applications')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_arxiv_wrong_id(self, reqget):
         with self.assertRaises(apis.ReferenceNotFoundError):
             bib = apis.get_bibentry_from_api('INVALIDID', 'arxiv')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_arxiv_wrong_doi(self, reqget):
         bib = apis.get_bibentry_from_api('1312.2021', 'arXiv')
         entry = bib[list(bib)[0]]
         self.assertEqual(entry['arxiv_doi'], '10.1103/INVALIDDOI.89.084044')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_arxiv_good_doi(self, reqget):
         """Get the DOI bibtex instead of the arXiv one if possible"""
         bib = apis.get_bibentry_from_api('1710.08557', 'arXiv')
@@ -120,7 +120,7 @@ class TestArxiv2Bibtex(APITests):
         self.assertEqual(entry['doi'], '10.1186/s12984-017-0305-3')
         self.assertEqual(entry['title'].lower(), 'on neuromechanical approaches for the study of biological and robotic grasp and manipulation')
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_arxiv_good_doi_force_arxiv(self, reqget):
         bib = apis.get_bibentry_from_api('1710.08557', 'arXiv', try_doi=False)
         entry = bib[list(bib)[0]]
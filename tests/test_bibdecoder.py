@@ -0,0 +1,109 @@
+from __future__ import unicode_literals
+
+import os
+import unittest
+
+import dotdot
+from pubs import endecoder
+import str_fixtures
+
+
+BIBEXAMPLES = os.path.join(os.path.dirname(__file__), 'bibexamples')
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+# corner cases of the bibtex grammar used by bibtexparser
+CORNER_CASES = [
+    '@article(A, title={x})',
+    '@ article {A , title = {x} # "y" # jan , }',
+    '@article{A, Title={x}, title={z}}',
+    '@article{A, link={b}, url={a}}',
+    '@article{A, title={  x\n    y  \n  }}',
+    '@article{A, title="x {"} y"}',
+    '@article{A,title={x}}\r\n@article{B,title={y\r\n\tz}}',
+    '@string{X = "a" # {b}}@article{A, title=x # X}',
+    '@STRING(x = "y")\n@article{A, title=x # "z", month=Jan}',
+    '@misc{A, note = {}, title={{}}, n-o.t+e(1) = 12}',
+    '\ufeff@preamble{"x"}\n@comment{@article{A, title={x}}}\n@article{B, title={y}}',
+    '@article{A, title={x}}\n@article{A, title={y}}',
+    '@article{A, title={x}}} @article{B, title={y}}',
+    '@article{A, title={x}, year=2020a}\n junk\n @article{B, title={y}}',
+    '@article{A B, title={x}}\n@article{C,}\n@article{D, title={x},, year={1}}\n'
+    '@article{E, title={z}}',
+    '@article{A, author={van der Berg, J and Jean de la Fontaine AND\n'
+    'John Smith jr and {Barnes and Noble} and Mesut {\\"O}zil}, editor={A B and C, D},'
+    ' keywords={a;b, c}, pages={1--2}}',
+    '@article{A, author={}, editor = {}, keywords={}, pages={1–2}}',
+]
+
+MALFORMED = [
+    '@article{A, title={x}',
+    '@article{A, title={x})',
+    '@article{A B, title={x}}',
+    'not bibtex',
+    str_fixtures.not_bibtex,
+    str_fixtures.bibtex_no_citekey,
+]
+
+
+class TestFastDecoder(unittest.TestCase):
+    """The fast decoder produces the same entries as bibtexparser."""
+
+    def setUp(self):
+        self.fast = endecoder.EnDecoder(decoder='fast')
+        self.reference = endecoder.EnDecoder(decoder='bibtexparser')
+
+    def assertSameDecoding(self, bibstr):
+        self.assertEqual(self.fast.decode_bibdata(bibstr),
+                         self.reference.decode_bibdata(bibstr))
+
+    def test_bibexamples(self):
+        for directory in (BIBEXAMPLES, DATA):
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith('.bib'):
+                    with open(os.path.join(directory, filename)) as f:
+                        bibstr = f.read()
+                    with self.subTest(filename=filename):
+                        self.assertSameDecoding(bibstr)
+
+    def test_fixtures(self):
+        for bibstr in (str_fixtures.bibtex_raw0, str_fixtures.turing_bib,
+                       str_fixtures.bibtex_month, str_fixtures.bibtex_with_latex,
+                       str_fixtures.bibtex_external0, str_fixtures.bibtex_external_alt):
+            self.assertSameDecoding(bibstr)
+
+    def test_corner_cases(self):
+        for bibstr in CORNER_CASES:
+            with self.subTest(bibstr=bibstr):
+                self.assertSameDecoding(bibstr)
+
+    def test_malformed(self):
+        for bibstr in MALFORMED:
+            with self.subTest(bibstr=bibstr):
+                with self.assertRaises(self.reference.BibDecodingError):
+                    self.reference.decode_bibdata(bibstr)
+                with self.assertRaises(self.fast.BibDecodingError):
+                    self.fast.decode_bibdata(bibstr)
+
+    def test_undefined_string(self):
+        bibstr = '@string{x = "y"}\n@article{A, title=x # undefined}'
+        messages = []
+        for decoder in (self.fast, self.reference):
+            with self.assertRaises(decoder.BibDecodingError) as cm:
+                decoder.decode_bibdata(bibstr)
+            messages.append(str(cm.exception))
+        self.assertEqual(messages[0], messages[1])
+
+    def test_default_decoder(self):
+        self.assertEqual(endecoder.get_decoder(), 'bibtexparser')
+        try:
+            endecoder.set_decoder('fast')
+            self.assertEqual(endecoder.EnDecoder().decode_bibdata('@misc{A, title={x}}'),
+                             {'A': {'title': 'x', 'ENTRYTYPE': 'misc'}})
+        finally:
+            endecoder.set_decoder('bibtexparser')
+        with self.assertRaises(ValueError):
+            endecoder.set_decoder('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import mock
+import unittest
+
+import dotdot
+import sand_env
+
+from pubs import datacache
+
+
+class TestCacheRebuild(sand_env.SandboxedCommandTestCase):
+
+    def setUp(self):
+        super(TestCacheRebuild, self).setUp()
+        self.execute_cmds([('pubs init',),
+                           ('pubs import data/three_articles.bib',)])
+        self.expected = self.execute_cmds([('pubs list',)])[0]
+
+    def remove_caches(self):
+        for name in ('metacache', 'bibcache', 'searchindex'):
+            path = os.path.join(self.default_pubs_dir, '.cache', name)
+            for p in (path, path + '.journal'):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    @mock.patch.object(datacache, 'REBUILD_CHUNK_SIZE', 2)
+    def test_rebuild_in_parallel(self):
+        self.remove_caches()
+        out = self.execute_cmds([('pubs cache rebuild -j 2',)])[0]
+        self.assertIn('6 cache entries rebuilt in', out)
+        self.assertIn('entries/s', out)
+        out = self.execute_cmds([('pubs cache rebuild',)])[0]
+        self.assertIn('0 cache entries rebuilt in', out)
+        self.assertEqual(self.execute_cmds([('pubs list',)])[0], self.expected)
+
+    def test_rebuild_all(self):
+        out = self.execute_cmds([('pubs cache rebuild --all',)])[0]
+        self.assertIn('6 cache entries rebuilt in', out)
+
+    def test_negative_jobs(self):
+        for cmd in ('pubs cache rebuild -j -1', 'pubs import -j -2 data/three_articles.bib'):
+            with self.assertRaises(sand_env.FakeSystemExit) as cm:
+                self.execute_cmds([(cmd,)])
+            self.assertEqual(cm.exception.code, 2)
+
+    @mock.patch.object(datacache, 'AUTO_REBUILD_MIN_SIZE', 1)
+    def test_automatic_rebuild(self):
+        self.remove_caches()
+        self.assertEqual(self.execute_cmds([('pubs list',)])[0], self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
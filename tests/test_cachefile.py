@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import dotdot
+
+from pubs import cachefile
+from pubs.datacache import CacheEntry
+
+
+class TestIndexedEntries(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = {'a': CacheEntry({'title': 'A'}, 1.),
+                        'b': CacheEntry({'title': 'B'}, 2.)}
+        self.header, self.loaded = cachefile.decode(
+            cachefile.encode({'schema': 1}, self.entries))
+
+    def test_decode(self):
+        self.assertEqual(self.header, {'schema': 1})
+        self.assertEqual(sorted(self.loaded), ['a', 'b'])
+        self.assertEqual(len(self.loaded), 2)
+        self.assertEqual(self.loaded['b'].data, {'title': 'B'})
+        self.assertEqual(self.loaded['b'].timestamp, 2.)
+
+    def test_entries_are_decoded_when_accessed(self):
+        self.assertEqual(self.loaded._decoded, {})
+        self.assertIn('a', self.loaded)
+        self.assertEqual(self.loaded.timestamp('a'), 1.)
+        self.assertEqual(self.loaded._decoded, {})
+        self.loaded['a']
+        self.assertEqual(list(self.loaded._decoded), ['a'])
+
+    def test_changes(self):
+        self.loaded['c'] = CacheEntry({'title': 'C'}, 3.)
+        self.loaded['a'] = CacheEntry({'title': 'A2'}, 4.)
+        self.loaded.discard('b')
+        self.loaded.discard('d')
+        self.assertNotIn('b', self.loaded)
+        with self.assertRaises(KeyError):
+            del self.loaded['b']
+        _, reloaded = cachefile.decode(cachefile.encode({}, self.loaded))
+        self.assertEqual(sorted(reloaded), ['a', 'c'])
+        self.assertEqual(reloaded['a'].data, {'title': 'A2'})
+        self.assertEqual(reloaded.timestamp('c'), 3.)
+
+    def test_items_and_values(self):
+        self.assertEqual(sorted((citekey, entry.data) for citekey, entry in self.loaded.items()),
+                         [('a', {'title': 'A'}), ('b', {'title': 'B'})])
+        self.assertEqual(sorted(entry.timestamp for entry in self.loaded.values()), [1., 2.])
+        self.assertEqual(sorted(self.loaded), ['a', 'b'])
+
+    def test_pop(self):
+        self.assertEqual(self.loaded.pop('a').data, {'title': 'A'})  # decoded
+        self.assertEqual(self.loaded.pop('a', None), None)
+        with self.assertRaises(KeyError):
+            self.loaded.pop('a')
+        self.loaded['b']
+        self.assertEqual(self.loaded.pop('b').timestamp, 2.)
+        self.assertEqual(len(self.loaded), 0)
+
+    def test_not_indexed(self):
+        with self.assertRaises(ValueError):
+            cachefile.decode(b'not a cache')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import unittest
+
+import mock
+
+import dotdot
+import sand_env
+
+from pubs import config, completion
+from pubs.pubs_cmd import commands_to_load, CORE_CMDS
+
+
+class TestCompletionIndex(sand_env.SandboxedCommandTestCase):
+
+    def setUp(self):
+        super(TestCompletionIndex, self).setUp()
+        self.execute_cmds([('pubs init',),
+                           ('pubs add data/pagerank.bib',),
+                           ('pubs tag Page99 network+search',)])
+        self.conf = config.load_conf(path=self.default_conf_path)
+
+    def test_index_follows_changes(self):
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'Page99': {'network', 'search'}})
+        self.execute_cmds([('pubs add data/turing1950.bib',),
+                           ('pubs rename Page99 Page1999',),
+                           ('pubs tag Page1999 :network',)])
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'Page1999': {'search'}, 'turing1950computing': set()})
+        self.execute_cmds([('pubs remove Page1999', ['y'])])
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'turing1950computing': set()})
+
+    def test_completers(self):
+        self.assertEqual(completion.CiteKeyCompletion(self.conf)(prefix=''),
+                         {'Page99'})
+        self.assertEqual(completion.CiteKeyOrTagCompletion(self.conf)(prefix=''),
+                         {'Page99', 'network', 'search'})
+        self.assertEqual(completion.TagModifierCompletion(self.conf)(prefix='math+n'),
+                         ['math+network'])
+
+    def test_outdated_index(self):
+        # metadata changed outside of pubs (e.g. by a git pull)
+        metapath = os.path.join(self.default_pubs_dir, 'meta', 'Page99.yaml')
+        with open(metapath) as f:
+            metadata = f.read()
+        with open(metapath + '.new', 'w') as f:
+            f.write(metadata.replace('network', 'graphs'))
+        os.replace(metapath + '.new', metapath)
+        with self.assertRaises(IOError):
+            completion.pull_index(self.conf)
+        self.assertEqual(completion.CiteKeyOrTagCompletion(self.conf)(prefix=''),
+                         {'Page99', 'graphs', 'search'})
+        # rebuilt
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'Page99': {'graphs', 'search'}})
+
+    def test_outdated_index_then_change(self):
+        os.remove(os.path.join(self.default_pubs_dir, 'meta', 'Page99.yaml'))
+        os.remove(os.path.join(self.default_pubs_dir, 'bib', 'Page99.bib'))
+        self.execute_cmds([('pubs add data/turing1950.bib',)])
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'turing1950computing': set()})
+
+    def test_missing_index(self):
+        os.remove(os.path.join(self.default_pubs_dir, '.cache', completion.INDEX_NAME))
+        self.assertEqual(completion.CiteKeyOrTagCompletion(self.conf)(prefix=''),
+                         {'Page99', 'network', 'search'})
+        self.execute_cmds([('pubs add data/turing1950.bib',)])
+        self.assertEqual(completion.pull_index(self.conf),
+                         {'Page99': {'network', 'search'}, 'turing1950computing': set()})
+
+
+class TestCommandsToLoad(unittest.TestCase):
+
+    def completing(self, line):
+        env = {'_ARGCOMPLETE': '1', 'COMP_LINE': line, 'COMP_POINT': str(len(line))}
+        with mock.patch.dict(os.environ, env):
+            return commands_to_load([])
+
+    def test_run(self):
+        self.assertEqual(commands_to_load(['tag', 'Page99']), {'tag'})
+        self.assertEqual(commands_to_load(['-h']), set(CORE_CMDS))
+        self.assertEqual(commands_to_load([]), set(CORE_CMDS))
+
+    def test_completion(self):
+        self.assertEqual(self.completing('pubs ta'), set())
+        self.assertEqual(self.completing('pubs tag '), {'tag'})
+        self.assertEqual(self.completing('pubs -c pubsrc tag Pa'), {'tag'})
+        self.assertEqual(self.completing('pubs myalias '), set(CORE_CMDS))
+
+
+if __name__ == '__main__':
+    unittest.main()
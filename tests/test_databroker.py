@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import mock
 
 import dotdot
 import fake_env
@@ -76,18 +77,36 @@ class TestDataBroker(fake_env.TestFakeFs):
         data_out = db.pull_cache('meta')
         self.assertEqual(data_in, data_out)
 
-    def test_pull_cache_fails_on_version_mismatch(self):
+    def test_pull_cache_survives_version_change(self):
         db = databroker.DataBroker('tmp', 'tmp/doc', create=True)
-        data_in = {'a': 1}
-        db.push_cache('meta', data_in)
-        ver = databroker.__version__
-        databroker.__version__ = '0.0.0'
-        try:
+        db.push_cache('meta', {'a': 1})
+        with mock.patch('pubs.__version__', '0.0.0'):
+            self.assertEqual(db.pull_cache('meta'), {'a': 1})
+
+    def test_pull_cache_fails_on_decoder_change(self):
+        db = databroker.DataBroker('tmp', 'tmp/doc', create=True)
+        db.push_cache('meta', {'a': 1})
+        db.push_cache_journal('meta', [('a', 2)])
+        with mock.patch.object(endecoder, 'DECODED_FORMAT', 0), \
+                mock.patch.object(endecoder, '_fingerprints', {}):
             with self.assertRaises(ValueError):
                 db.pull_cache('meta')
-        finally:
-            databroker.__version__ = ver
+            self.assertEqual(db.pull_cache_journal('meta'), [])
+        self.assertEqual(db.pull_cache_journal('meta'), [('a', 2)])
 
+    def test_pull_cache_migrates_schema(self):
+        db = databroker.DataBroker('tmp', 'tmp/doc', create=True)
+        db.push_cache('meta', {'a': 1})
+        migrations = {databroker.CACHE_SCHEMA: lambda name, data: dict(data, name=name)}
+        with mock.patch.object(databroker, 'CACHE_SCHEMA', databroker.CACHE_SCHEMA + 1), \
+                mock.patch.object(databroker, 'CACHE_MIGRATIONS', migrations):
+            self.assertEqual(db.pull_cache('meta'), {'a': 1, 'name': 'meta'})
+        with mock.patch.object(databroker, 'CACHE_SCHEMA', databroker.CACHE_SCHEMA + 1):
+            with self.assertRaises(ValueError):  # no migration
+                db.pull_cache('meta')
+        with mock.patch.object(databroker, 'CACHE_SCHEMA', databroker.CACHE_SCHEMA - 1):
+            with self.assertRaises(ValueError):  # newer cache
+                db.pull_cache('meta')
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
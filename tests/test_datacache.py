@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+import os
 import unittest
 import time
 
+import mock
+
 import dotdot
+import fake_env
+import fixtures
 
-from pubs.datacache import CacheEntrySet
+from pubs import datacache, cachefile
+from pubs.datacache import CacheEntrySet, DataCache
 
 
 class FakeFileBrokerMeta(object):
@@ -14,6 +20,9 @@ class FakeFileBrokerMeta(object):
     def mtime_metafile(self, key):
         return self.mtime
 
+    def pull_metafile(self, key):
+        raise IOError
+
 
 class FakeFileBrokerBib(object):
 
@@ -22,6 +31,9 @@ class FakeFileBrokerBib(object):
     def mtime_bibfile(self, key):
         return self.mtime
 
+    def pull_bibfile(self, key):
+        raise IOError
+
 
 class FakeDataBrokerMeta(object):
 
@@ -141,6 +153,153 @@ class TestCacheEntrySet(unittest.TestCase):
         self.databroker_meta.filebroker.mtime = time.time() - 1.1
         self.assertFalse(self.metacache._is_outdated('a'))
 
+    def test_check_all_uses_given_mtimes(self):
+        self.databroker_meta.filebroker.mtime = time.time()
+        self.metacache.push_to_cache('a', 'b')
+        self.metacache.push_to_cache('c', 'd')
+        self.databroker_meta.filebroker.mtime = None  # would fail comparisons
+        self.metacache.check_all({'a': time.time() - 1.1})
+        self.assertFalse(self.metacache._is_outdated('a'))
+        self.assertNotIn('c', self.metacache.entries)
+
+
+class TestDataCacheCheck(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestDataCacheCheck, self).setUp()
+        self.dc = DataCache('tmp', 'tmp/doc', create=True)
+        self.dc.push_bibentry('Doe2013', fixtures.doe_bibentry)
+        self.dc.push_metadata('Doe2013', fixtures.dummy_metadata)
+        self.dc.flush_cache()
+        self.dc = DataCache('tmp', 'tmp/doc')
+
+    def test_check_cache_does_not_stat_each_file(self):
+        def fail(citekey):
+            raise AssertionError('unexpected stat of {}'.format(citekey))
+        self.dc.databroker.filebroker.mtime_metafile = fail
+        self.dc.databroker.filebroker.mtime_bibfile = fail
+        self.dc.check_cache()
+        self.assertEqual(self.dc.citekeys(), {'Doe2013'})
+        self.assertTrue(self.dc.exists('Doe2013', meta_check=True))
+        self.assertEqual(self.dc.pull_bibentry('Doe2013'), fixtures.doe_bibentry)
+        self.assertEqual(self.dc.pull_metadata('Doe2013'), fixtures.dummy_metadata)
+
+    def test_normalized_fields_are_cached(self):
+        fields = self.dc.pull_normalized_fields('Doe2013')
+        self.assertEqual(fields['author'], ['Doe'])
+        self.assertEqual(fields['title'], 'Nice Title')
+        self.dc.flush_cache()
+        dc = DataCache('tmp', 'tmp/doc')
+        self.assertEqual(dc.bibcache.entries['Doe2013'].normalized, fields)
+        self.assertIs(dc.pull_normalized_fields('Doe2013'),
+                      dc.bibcache.entries['Doe2013'].normalized)
+        dc.push_bibentry('Doe2013', fixtures.doe_bibentry)  # changed entry
+        self.assertIsNone(dc.bibcache.entries['Doe2013'].normalized)
+
+    def test_check_cache_listing_follows_changes(self):
+        self.dc.check_cache()
+        self.dc.push_bibentry('Doe2014', fixtures.doe_bibentry)
+        self.assertTrue(self.dc.exists('Doe2014'))
+        self.dc.remove('Doe2013')
+        self.assertEqual(self.dc.citekeys(), {'Doe2014'})
+
+    def test_entries_are_decoded_when_accessed(self):
+        self.dc.check_cache()
+        entries = self.dc.bibcache.entries
+        self.assertIsInstance(entries, cachefile.IndexedEntries)
+        self.assertEqual(entries._decoded, {})
+        self.assertEqual(self.dc.pull_bibentry('Doe2013'), fixtures.doe_bibentry)
+        self.assertEqual(list(entries._decoded), ['Doe2013'])
+
+    def test_pickled_cache_is_read(self):
+        broker = self.dc.databroker
+        broker.push_cache('bibcache', dict(broker.pull_entries_cache('bibcache')))
+        dc = DataCache('tmp', 'tmp/doc')
+        self.assertIn('Doe2013', dc.bibcache.entries)
+
+    def test_rebuild(self):
+        self.dc.databroker.pull_bibentry = self.dc.databroker.pull_metadata = None
+        self.assertEqual(self.dc.rebuild(jobs=1), 0)  # up to date
+        self.assertEqual(self.dc.rebuild(jobs=1, force=True), 2)
+        self.assertEqual(self.dc.pull_bibentry('Doe2013'), fixtures.doe_bibentry)
+        self.assertEqual(self.dc.pull_metadata('Doe2013'), fixtures.dummy_metadata)
+
+    def test_check_cache_rebuilds_outdated_entries(self):
+        for name in ('metacache', 'bibcache'):
+            self.dc.databroker.filebroker.remove_cachefile(name)
+        rebuilt = []
+        self.dc._rebuild = lambda outdated, jobs=0: rebuilt.extend(
+            (cache.name, citekeys, jobs) for cache, citekeys in outdated)
+        self.dc.check_cache()
+        self.assertEqual(rebuilt, [])  # below the minimum size
+        with mock.patch.object(datacache, 'AUTO_REBUILD_MIN_SIZE', 0):
+            self.dc._listing = None
+            self.dc.check_cache(caches=('metacache',))
+            self.assertEqual(rebuilt, [('metacache', ['Doe2013'], 0)])
+            del rebuilt[:]
+            self.dc._listing = None
+            self.dc.check_cache()
+        self.assertEqual(rebuilt, [('metacache', ['Doe2013'], 0),
+                                   ('bibcache', ['Doe2013'], 0)])
+
+    @mock.patch.object(datacache, 'AUTO_REBUILD_MIN_SIZE', 0)
+    @mock.patch.object(datacache, '_kept', {})  # in the server
+    def test_check_cache_rebuilds_serially_in_server(self):
+        for name in ('metacache', 'bibcache'):
+            self.dc.databroker.filebroker.remove_cachefile(name)
+        self.dc._listing = None
+        with mock.patch('concurrent.futures.ProcessPoolExecutor') as pool:
+            self.dc.check_cache()
+        pool.assert_not_called()
+        self.dc.databroker.pull_bibentry = self.dc.databroker.pull_metadata = None
+        self.assertEqual(self.dc.pull_bibentry('Doe2013'), fixtures.doe_bibentry)
+        self.assertEqual(self.dc.pull_metadata('Doe2013'), fixtures.dummy_metadata)
+
+
+class TestCacheJournal(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestCacheJournal, self).setUp()
+        dc = DataCache('tmp', 'tmp/doc', create=True)
+        for i in range(10):
+            dc.push_metadata('key{}'.format(i), {'tags': set()})
+        dc.flush_cache()
+        self.cachedir = os.path.join('tmp', '.cache')
+
+    def test_small_change_goes_to_journal(self):
+        snapshot = os.path.join(self.cachedir, 'metacache')
+        snapshot_mtime = os.path.getmtime(snapshot)
+        dc = DataCache('tmp', 'tmp/doc')
+        dc.push_metadata('key1', {'tags': {'a'}})
+        dc.metacache.remove_from_cache('key2')
+        dc.flush_cache()
+        self.assertEqual(os.path.getmtime(snapshot), snapshot_mtime)
+        self.assertTrue(os.path.exists(snapshot + '.journal'))
+        entries = DataCache('tmp', 'tmp/doc').metacache.entries
+        self.assertEqual(entries['key1'].data, {'tags': {'a'}})
+        self.assertNotIn('key2', entries)
+        self.assertEqual(len(entries), 9)
+
+    def test_journal_is_compacted(self):
+        snapshot = os.path.join(self.cachedir, 'metacache')
+        for i in range(datacache.JOURNAL_MIN_SIZE + 1):
+            dc = DataCache('tmp', 'tmp/doc')
+            dc.push_metadata('key1', {'tags': {str(i)}})
+            dc.flush_cache()
+        self.assertFalse(os.path.exists(snapshot + '.journal'))
+        entries = DataCache('tmp', 'tmp/doc').metacache.entries
+        self.assertEqual(entries['key1'].data,
+                         {'tags': {str(datacache.JOURNAL_MIN_SIZE)}})
+
+    def test_truncated_journal_is_ignored(self):
+        dc = DataCache('tmp', 'tmp/doc')
+        dc.push_metadata('key1', {'tags': {'a'}})
+        dc.flush_cache()
+        with open(os.path.join(self.cachedir, 'metacache.journal'), 'ab') as f:
+            f.write(b'\x80\x04truncated')
+        entries = DataCache('tmp', 'tmp/doc').metacache.entries
+        self.assertEqual(entries['key1'].data, {'tags': {'a'}})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -186,5 +186,74 @@ class TestEnDecode(unittest.TestCase):
             decoder.decode_bibdata("@misc{I am not a correct bibtex{{}")
 
 
+class TestSplitBibdata(unittest.TestCase):
+
+    bibstr = ('% header\n'
+              '@string{jmlr = "Journal of Machine Learning Research"}\n'
+              '@article{A, title = {First}, journal = jmlr}\n'
+              '@article{B, title = {Second}, abstract = {Lines starting\n'
+              '@ are not always entries}}\n'
+              '@article{C, title = {Third}, journal = jmlr}\n')
+
+    def test_small_data_not_split(self):
+        self.assertEqual(endecoder.split_bibdata(self.bibstr, 3), [self.bibstr])
+
+    def test_split(self):
+        chunks = endecoder.split_bibdata(self.bibstr, 1)
+        self.assertEqual(len(chunks), 3)
+        decoder = endecoder.EnDecoder()
+        entries = {}
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith('% header\n@string{jmlr'))
+            entries.update(decoder.decode_bibdata(chunk))
+        self.assertEqual(entries, decoder.decode_bibdata(self.bibstr))
+        self.assertEqual(entries['C']['journal'],
+                         'Journal of Machine Learning Research')
+
+
+
+class TestDecodeBibentries(unittest.TestCase):
+
+    bibstr = ('@string{jmlr = "Journal of Machine Learning Research"}\n'
+              '@comment{jabref-meta: databaseType:bibtex;}\n'
+              '@article{A, title = {First}, journal = jmlr}\n'
+              '@article{B, title = {Unbalanced}, journal = jmlr,\n'
+              '@article{C, title = {Third}, journal = undefined}\n'
+              '@article{D title = {No comma}}\n'
+              '@article{E, title = {Fifth}, abstract = {Lines starting\n'
+              '@ are not always entries}}\n')
+
+    def test_decode_lines(self):
+        decoder = endecoder.EnDecoder()
+        for batch_size in (1, 100, 10000):
+            entries = list(decoder.decode_bibentries(
+                turing_bib.splitlines(True), batch_size=batch_size))
+            self.assertEqual(dict(entries), decoder.decode_bibdata(turing_bib))
+
+    def test_errors_per_entry(self):
+        decoder = endecoder.EnDecoder()
+        entries = list(decoder.decode_bibentries(self.bibstr.splitlines(True)))
+        self.assertEqual([k for k, _ in entries], ['A', 'B', 'C', 'D', 'E'])
+        entries = dict(entries)
+        self.assertEqual(entries['A']['journal'],
+                         'Journal of Machine Learning Research')
+        self.assertEqual(entries['E']['abstract'],
+                         'Lines starting\n@ are not always entries')
+        for k in ('B', 'C', 'D'):
+            self.assertIsInstance(entries[k], decoder.BibDecodingError)
+
+    def test_lines_read_lazily(self):
+        decoder = endecoder.EnDecoder()
+        read = []
+
+        def lines():
+            for line in self.bibstr.splitlines(True):
+                read.append(line)
+                yield line
+
+        entries = decoder.decode_bibentries(lines(), batch_size=1)
+        self.assertEqual(next(entries)[0], 'A')
+        self.assertEqual(len(read), 4)
+
 if __name__ == '__main__':
     unittest.main()
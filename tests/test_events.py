@@ -1,6 +1,9 @@
 import unittest
 
 import dotdot
+import sand_env
+
+from pubs import events
 from pubs.events import Event
 
 
@@ -90,5 +93,32 @@ class TestEvents(unittest.TestCase):
         self.assertEqual(_output, correct)
 
 
+class TestBatchEvents(sand_env.SandboxedCommandTestCase):
+
+    def setUp(self):
+        super(TestBatchEvents, self).setUp()
+        self.sent = []
+        count = len(events._listener)
+
+        @events.AddEvent.listen()
+        def added(event):
+            self.sent.append(('add', event.citekey))
+
+        @events.PaperChangeEvent.listen()
+        def changed(event):
+            self.sent.append(('change', type(event).__name__))
+
+        self.addCleanup(events._listener.__delitem__, slice(count, None))
+
+    def test_listeners_of_grouped_events(self):
+        self.execute_cmds([('pubs init',),
+                           ('pubs import data/three_articles.bib',)])
+        self.assertEqual(sorted(citekey for kind, citekey in self.sent if kind == 'add'),
+                         ['Bell_1964', 'Einstein_1935', 'Schrodinger_1935'])
+        # listeners of all changes get the batch, once
+        self.assertEqual([name for kind, name in self.sent if kind == 'change'],
+                         ['BatchEvent'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import mock
 
 import dotdot
 import fake_env
@@ -68,6 +69,67 @@ class TestFileBroker(fake_env.TestFakeFs):
             self.assertEqual(fb.pull_metafile('citekey1'), 'defg')
         self.assertFalse(fb.exists('citekey1'))
 
+    def test_listing(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_metafile('citekey1', 'defg')
+        fb.push_bibfile('citekey2', 'abc')
+
+        listing = fb.listing(filestats=False)
+        self.assertEqual(set(listing['bibfiles']), {'citekey1', 'citekey2'})
+        self.assertEqual(listing['metafiles'], ['citekey1'])
+
+        listing = fb.listing(filestats=True)
+        self.assertEqual(set(listing['bibfiles']), {'citekey1', 'citekey2'})
+        self.assertEqual(listing['metafiles']['citekey1'], fb.mtime_metafile('citekey1'))
+
+
+    def test_interrupted_write_keeps_file(self):
+        fb = filebroker.FileBroker('testrepo', create=True)
+        fb.push_bibfile('citekey1', 'abc')
+        real_open = content._open
+
+        def interrupted_open(path, mode):
+            with real_open(path, mode) as f:
+                f.write('de')
+            raise KeyboardInterrupt
+
+        with mock.patch.object(content, '_open', interrupted_open):
+            with self.assertRaises(KeyboardInterrupt):
+                fb.push_bibfile('citekey1', 'defg')
+        self.assertEqual(fb.pull_bibfile('citekey1'), 'abc')
+        self.assertEqual(os.listdir(fb.bibdir), ['citekey1.bib'])
+
+    def test_write_keeps_mode_and_symlink(self):
+        fb = filebroker.FileBroker('testrepo', create=True)
+        fb.push_bibfile('citekey1', 'abc')
+        bibpath = fb.bib_path('citekey1')
+        os.chmod(bibpath, 0o600)
+        fb.push_bibfile('citekey1', 'defg')
+        self.assertEqual(os.stat(bibpath).st_mode & 0o777, 0o600)
+
+        os.rename(bibpath, 'elsewhere.bib')
+        os.symlink(os.path.abspath('elsewhere.bib'), bibpath)
+        fb.push_bibfile('citekey1', 'hij')
+        self.assertTrue(os.path.islink(bibpath))
+        self.assertEqual(content.read_text_file('elsewhere.bib'), 'hij')
+
+    def test_sync_written_files(self):
+        fb = filebroker.FileBroker('testrepo', create=True)
+        content.defer_sync()
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_bibfile('citekey2', 'abc')
+        fb.push_metafile('citekey1', 'abc')
+        fb.push_bibfile('citekey1', 'defg')
+        with mock.patch.object(content.os, 'fsync') as fsync:
+            content.sync_written_files()
+        # three files, two directories
+        self.assertEqual(fsync.call_count, 5)
+        with mock.patch.object(content.os, 'fsync') as fsync:
+            fb.push_bibfile('citekey1', 'abc')
+            content.sync_written_files()
+        self.assertEqual(fsync.call_count, 0)  # not deferred anymore
 
 class TestDocBroker(fake_env.TestFakeFs):
 
@@ -99,6 +161,85 @@ class TestDocBroker(fake_env.TestFakeFs):
         with self.assertRaises(IOError):
             self.assertFalse(content.check_file(os.path.join('testrepo', 'doc/Page99.pdf'), fail=True))
 
+    def test_rename_doc(self):
+        self.fs.add_real_directory(os.path.join(self.rootpath, 'data'), read_only=False)
+        filebroker.FileBroker('testrepo', create=True)
+        docb = filebroker.DocBroker('testrepo')
+        docb.add_doc('Page99', 'data/pagerank.pdf')
+        docb.add_doc('Other', 'data/pagerank.pdf')
+        with self.assertRaises(IOError):
+            docb.rename_doc('docsdir://Page99.pdf', 'Other')
+        self.assertEqual(docb.rename_doc('docsdir://Page99.pdf', 'Page'), 'docsdir://Page.pdf')
+        self.assertEqual(sorted(os.listdir('testrepo/doc')), ['Other.pdf', 'Page.pdf'])
+
+    def test_deduplicated_docs(self):
+        self.fs.add_real_directory(os.path.join(self.rootpath, 'data'), read_only=False)
+        filebroker.FileBroker('testrepo', create=True)
+        docb = filebroker.DocBroker('testrepo')
+        docb.add_doc('Page99', 'data/pagerank.pdf')
+        docb.add_doc('Preprint', 'data/pagerank.pdf')
+        size = os.path.getsize('data/pagerank.pdf')
+        self.assertEqual(docb.usage(), (2, 2 * size, 2 * size))
+
+        docb.deduplicate()
+        self.assertEqual(docb.usage(), (2, 2 * size, size))
+        objpath = docb._object_path(content.hash_content('data/pagerank.pdf'), '.pdf')
+        self.assertTrue(os.path.samefile(objpath, 'testrepo/doc/Page99.pdf'))
+        self.assertTrue(os.path.samefile(objpath, 'testrepo/doc/Preprint.pdf'))
+
+        # added and renamed as links to the stored content
+        docb.add_doc('Again', 'data/pagerank.pdf')
+        docb.rename_doc('docsdir://Preprint.pdf', 'Published')
+        self.assertTrue(os.path.samefile(objpath, 'testrepo/doc/Again.pdf'))
+        self.assertTrue(os.path.samefile(objpath, 'testrepo/doc/Published.pdf'))
+        self.assertEqual(docb.usage(), (3, 3 * size, size))
+
+        # the content is removed with its last document
+        for citekey in ('Page99', 'Again', 'Published'):
+            self.assertTrue(os.path.exists(objpath))
+            docb.remove_doc('docsdir://{}.pdf'.format(citekey))
+        self.assertFalse(os.path.exists(objpath))
+        self.assertEqual(docb.usage(), (0, 0, 0))
+
+    def test_deduplicated_overwrite(self):
+        self.fs.add_real_directory(os.path.join(self.rootpath, 'data'), read_only=False)
+        filebroker.FileBroker('testrepo', create=True)
+        docb = filebroker.DocBroker('testrepo')
+        docb.deduplicate()
+        docb.add_doc('K1', 'data/pagerank.pdf')
+        objpath = docb._object_path(content.hash_content('data/pagerank.pdf'), '.pdf')
+        # same content: the object is kept
+        docb.add_doc('K1', 'data/pagerank.pdf', overwrite=True)
+        self.assertTrue(os.path.samefile(objpath, 'testrepo/doc/K1.pdf'))
+        # other content: the object of the replaced document is released
+        content.write_file('other.pdf', 'other')
+        docb.add_doc('K1', 'other.pdf', overwrite=True)
+        self.assertFalse(os.path.exists(objpath))
+        self.assertEqual(content.get_content('testrepo/doc/K1.pdf'), 'other')
+        self.assertEqual(docb.usage(), (1, 5, 5))
+
+    def test_deduplicated_edited_in_place(self):
+        self.fs.add_real_directory(os.path.join(self.rootpath, 'data'), read_only=False)
+        filebroker.FileBroker('testrepo', create=True)
+        docb = filebroker.DocBroker('testrepo')
+        docb.deduplicate()
+        docb.add_doc('K1', 'data/pagerank.pdf')
+        docb.add_doc('K2', 'data/pagerank.pdf')
+        objpath = docb._object_path(content.hash_content('data/pagerank.pdf'), '.pdf')
+        # the documents share their content
+        with open('testrepo/doc/K1.pdf', 'ab') as f:
+            f.write(b'annotation')
+        with open('testrepo/doc/K2.pdf', 'rb') as f:
+            self.assertTrue(f.read().endswith(b'annotation'))
+        # the object no longer matches its hash: it is left, unused, by
+        # the removal of the documents, and removed by deduplicate
+        docb.remove_doc('docsdir://K1.pdf')
+        docb.remove_doc('docsdir://K2.pdf')
+        self.assertTrue(os.path.exists(objpath))
+        docb.deduplicate()
+        self.assertFalse(os.path.exists(objpath))
+        self.assertEqual(os.listdir('testrepo/doc/objects'), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -81,6 +81,28 @@ class TestGitPlugin(sand_env.SandboxedCommandTestCase):
         #
         # self.assertEqual(hash_i, hash_j)
 
+    def test_bulk_tag(self):
+        self.execute_cmds([('pubs import data/three_articles.bib',),
+                           ('pubs tag Bell_1964 war',)])
+        hash_a = git_hash(self.default_pubs_dir)
+
+        self.execute_cmds([('pubs tag --query year:1900-2000 math-war',)])
+        hash_b = git_hash(self.default_pubs_dir)
+        log = subprocess.check_output(('git', '-C', self.default_pubs_dir,
+                                       'log', '--format=%B', '-n', '1'))
+        self.assertEqual(sorted(line for line in log.decode('utf-8').splitlines()
+                                if line.startswith('Updated')),
+                         ['Updated tags for Bell_1964.',
+                          'Updated tags for Einstein_1935.',
+                          'Updated tags for Schrodinger_1935.'])
+
+        # nothing changes: nothing is written nor committed
+        self.execute_cmds([('pubs tag Bell_1964 Einstein_1935 math',)])
+        hash_c = git_hash(self.default_pubs_dir)
+
+        self.assertNotEqual(hash_a, hash_b)
+        self.assertEqual(hash_b, hash_c)
+
     def test_manual(self):
         print(self.default_pubs_dir)
         conf = config.load_conf(path=self.default_conf_path)
@@ -0,0 +1,46 @@
+import os
+import mock
+import unittest
+
+import dotdot
+import sand_env
+
+from pubs.commands import import_cmd
+
+
+class TestBatchedImport(sand_env.SandboxedCommandTestCase):
+
+    @mock.patch.object(import_cmd, 'CHUNK_SIZE', 1)
+    @mock.patch.object(import_cmd, 'BATCH_SIZE', 2)
+    def test_import_in_parallel(self):
+        outs = self.execute_cmds([('pubs init',),
+                                  ('pubs import -j 2 data/three_articles.bib',),
+                                  ('pubs list -k',)])
+        self.assertIn('3 papers imported in', outs[1])
+        self.assertEqual(len(outs[2].splitlines()), 3)
+
+    @mock.patch.object(import_cmd, 'BATCH_SIZE', 2)
+    def test_import_collisions(self):
+        outs = self.execute_cmds([('pubs init',),
+                                  ('pubs import data/three_articles.bib',),
+                                  ('pubs import data/',)])
+        self.assertIn('5 papers imported in', outs[2])
+        self.assertEqual(len(self.execute_cmds([('pubs list -k',)])[0].splitlines()), 8)
+
+    def test_ignore_malformed_entry(self):
+        bibpath = os.path.join(self.temp_dir, 'malformed.bib')
+        with open('data/three_articles.bib') as f:
+            bibstr = f.read()
+        with open(bibpath, 'w') as f:
+            f.write(bibstr.replace('},', '}', 1))  # breaks the first entry
+        self.execute_cmds([('pubs init',)])
+        with self.assertRaises(sand_env.FakeSystemExit):
+            self.execute_cmds([('pubs import {}'.format(bibpath),)])
+        outs = self.execute_cmds([('pubs import -i {}'.format(bibpath),),
+                                  ('pubs list -k',)])
+        self.assertIn('2 papers imported in', outs[0])
+        self.assertEqual(len(outs[1].splitlines()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
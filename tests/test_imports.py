@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+import dotdot
+import sand_env
+
+from pubs.pubs_cmd import CORE_CMDS
+
+
+HEAVY_MODULES = ['requests', 'feedparser', 'bs4', 'bibtexparser', 'pyparsing',
+                 'yaml', 'dateutil']
+
+# Runs a pubs command and prints, as json, the list of the imported modules.
+SCRIPT = """
+import sys, json
+from pubs import pubs_cmd
+try:
+    pubs_cmd.execute(['pubs', '-c', sys.argv[1]] + sys.argv[2:])
+except SystemExit:  # e.g. help
+    pass
+sys.stdout.flush()
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class TestLazyImports(sand_env.SandboxedCommandTestCase):
+    """Check that commands don't import heavy modules they don't need.
+
+    Commands run in a separate interpreter, as modules are already imported
+    in this one.
+    """
+
+    def setUp(self):
+        super(TestLazyImports, self).setUp()
+        self.execute_cmds([('pubs init',),
+                           ('pubs add data/pagerank.bib',),
+                           ('pubs list',)])  # cache is up to date
+
+    def imported(self, cmd, modules=HEAVY_MODULES, script=SCRIPT, env=None):
+        """Return which of `modules` are imported when running `cmd`."""
+        env = dict(os.environ, **(env or {}))
+        env['PYTHONPATH'] = os.path.abspath(os.path.join(__file__, '../..'))
+        out = subprocess.check_output(
+            [sys.executable, '-c', script, self.default_conf_path] + cmd.split(),
+            env=env)
+        imported = json.loads(out.decode('utf-8').splitlines()[-1])
+        return set(modules).intersection(imported)
+
+    def test_list_citekeys(self):
+        self.assertEqual(self.imported('list -k'), set())
+
+    def test_list(self):
+        self.assertEqual(self.imported('list'), {'bibtexparser', 'pyparsing'})
+
+    def test_statistics(self):
+        self.assertEqual(self.imported('statistics'), set())
+
+    def test_tag(self):
+        self.assertFalse(self.imported('tag Page99 +network') &
+                         {'requests', 'feedparser', 'bs4'})
+
+    def test_startup(self):
+        # all the parsers are built, for the help
+        modules = HEAVY_MODULES + ['sqlite3', 'multiprocessing', 'concurrent.futures.process']
+        self.assertEqual(self.imported('', modules=modules), set())
+        self.assertEqual(self.imported('--help', modules=modules), set())
+
+    def test_completion(self):
+        # parsers built to complete the arguments of a command (argcomplete
+        # itself is disabled, as it exits the interpreter)
+        script = SCRIPT.replace('from pubs import pubs_cmd',
+                                'from pubs import pubs_cmd; '
+                                'pubs_cmd.autocomplete = lambda parser: None')
+        modules = ['pubs.endecoder', 'pubs.datacache', 'bibtexparser', 'yaml']
+        for line in ('pubs ta', 'pubs tag ', 'pubs tag Page99 ', 'pubs list '):
+            env = dict(_ARGCOMPLETE='1', COMP_LINE=line, COMP_POINT=str(len(line)))
+            self.assertEqual(self.imported('', modules=modules, script=script, env=env),
+                             set(), line)
+
+    def test_other_commands_not_imported(self):
+        modules = ['pubs.commands.' + mod for mod in CORE_CMDS.values()]
+        self.assertEqual(self.imported('storage', modules=modules),
+                         {'pubs.commands.storage_cmd'})
+
+
+if __name__ == '__main__':
+    unittest.main()
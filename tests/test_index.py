@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+import dotdot
+import fake_env
+import fixtures
+
+from pubs import config
+from pubs.index import SearchIndex, BIB, META
+from pubs.datacache import CacheEntry
+from pubs.paper import Paper
+from pubs.query import get_paper_filter
+from pubs.repo import Repository
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.update(BIB, 'Page99', CacheEntry(fixtures.page_bibentry, 1))
+        self.index.update(BIB, 'Doe2013', CacheEntry(fixtures.doe_bibentry, 1))
+        self.index.update(META, 'Doe2013', CacheEntry({'tags': ['AI', 'math']}, 1))
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('author', lambda t: 'motwani' in t),
+                         {'Page99'})
+        self.assertEqual(self.index.lookup('title', lambda t: t == 'nice'),
+                         {'Doe2013'})
+        self.assertEqual(self.index.lookup('year', lambda y: y < 2000),
+                         {'Page99'})
+        self.assertEqual(self.index.lookup('tag', lambda t: t == 'ai'),
+                         {'Doe2013'})
+
+    def test_update_replaces_terms(self):
+        self.index.update(META, 'Doe2013', CacheEntry({'tags': ['math']}, 2))
+        self.assertEqual(self.index.lookup('tag', lambda t: t == 'ai'), set())
+        self.assertEqual(self.index.lookup('tag', lambda t: t == 'math'),
+                         {'Doe2013'})
+
+    def test_update_skips_same_timestamp(self):
+        self.index.modified = False
+        self.index.update(META, 'Doe2013', CacheEntry({'tags': []}, 1))
+        self.assertFalse(self.index.modified)
+        self.assertEqual(self.index.lookup('tag', lambda t: t == 'ai'),
+                         {'Doe2013'})
+
+    def test_remove(self):
+        self.index.remove('Doe2013')
+        self.assertNotIn('Doe2013', self.index)
+        self.assertEqual(self.index.lookup('tag', lambda t: True), set())
+        self.assertNotIn('doe', self.index.postings['author'])
+
+    def test_tagged(self):
+        self.index.update(META, 'Page99', CacheEntry({'tags': ['math']}, 1))
+        self.assertEqual(self.index.tagged(['math']), {'Doe2013', 'Page99'})
+        self.assertEqual(self.index.tagged(['math'], ['AI']), {'Page99'})
+        self.assertEqual(self.index.tagged(['ai']), set())
+        self.assertEqual(self.index.tagged([], ['math'], citekeys={'Page99', 'Knuth'}),
+                         {'Knuth'})
+
+    def test_filter_candidates(self):
+        self.assertEqual(get_paper_filter(['author:page']).candidates(self.index),
+                         {'Page99'})
+        self.assertEqual(get_paper_filter(['title:ice tit']).candidates(self.index),
+                         {'Doe2013'})
+        self.assertEqual(get_paper_filter(['year:2000-', 'tag:Ai']).candidates(self.index),
+                         {'Doe2013'})
+        self.assertIsNone(get_paper_filter(['citekey:Doe']).candidates(self.index))
+        self.assertFalse(get_paper_filter(['author:Doe'], strict=True).indexed)
+
+
+class TestRepoFilter(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestRepoFilter, self).setUp()
+        self.repo = Repository(config.load_default_conf(), create=True)
+        self.repo.push_paper(Paper.from_bibentry(fixtures.turing_bibentry,
+                                                 metadata=fixtures.turing_metadata))
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        self.repo.push_paper(Paper.from_bibentry(fixtures.page_bibentry))
+
+    def keys(self, query):
+        return set(p.citekey for p in
+                   self.repo.filter_papers(get_paper_filter(query)))
+
+    def test_filter(self):
+        self.assertEqual(self.keys(['author:doe']), {'Doe2013'})
+        self.assertEqual(self.keys(['tag:computer']), {'turing1950computing'})
+        self.assertEqual(self.keys(['year:-2000']), {'turing1950computing', 'Page99'})
+        self.assertEqual(self.keys(['title:the']), {'Page99'})
+
+    def test_index_follows_changes(self):
+        self.keys(['author:doe'])
+        paper = self.repo.pull_paper('Doe2013')
+        paper.add_tag('new')
+        self.repo.push_paper(paper, overwrite=True)
+        self.assertEqual(self.keys(['tag:new']), {'Doe2013'})
+        self.repo.rename_paper(paper, 'Doe2014')
+        self.assertEqual(self.keys(['author:doe']), {'Doe2014'})
+        self.repo.remove_paper('Doe2014')
+        self.assertEqual(self.keys(['author:doe']), set())
+
+    def test_tags_from_metadata_only(self):
+        def no_bib(citekey):
+            raise AssertionError('bibtex read')
+        self.repo.databroker.pull_bibentry = no_bib
+        self.assertEqual(self.repo.get_tags(), {'computer', 'AI'})
+        self.assertEqual(self.repo.tag_counts(), {'computer': 1, 'AI': 1})
+        self.assertEqual(self.repo.tagged_citekeys(['AI']), {'turing1950computing'})
+        self.assertEqual(self.repo.tagged_citekeys([], ['AI']), {'Doe2013', 'Page99'})
+
+    def test_index_is_persisted(self):
+        self.keys(['author:doe'])
+        self.repo.close()
+        repo = Repository(config.load_default_conf())
+        self.assertIn('Doe2013', repo.databroker.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import shutil
+import threading
+import tempfile
+import unittest
+import subprocess
+
+import dotdot
+import sand_env
+
+from pubs import config, lock
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipIf(lock.fcntl is None, 'no flock')
+class TestFileLock(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, 'lock')
+        # two locks on the same file, as held by two processes
+        self.lock_a = lock.FileLock(path)
+        self.lock_b = lock.FileLock(path)
+
+    def tearDown(self):
+        self.lock_a.release()
+        self.lock_b.release()
+        shutil.rmtree(self.temp_dir)
+
+    def test_shared(self):
+        self.lock_a.acquire(shared=True)
+        self.lock_b.acquire(shared=True, timeout=0)
+        self.assertTrue(self.lock_b.held)
+
+    def test_exclusive(self):
+        self.lock_a.acquire(shared=True)
+        start = time.time()
+        with self.assertRaises(lock.LockTimeout):
+            self.lock_b.acquire(timeout=0.2)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertFalse(self.lock_b.held)
+        self.lock_a.release()
+        self.lock_b.acquire(timeout=0)
+        with self.assertRaises(lock.LockTimeout):
+            self.lock_a.acquire(shared=True, timeout=0)
+
+    def test_reentrant(self):
+        self.lock_a.acquire()
+        self.lock_a.acquire(shared=True)
+        self.lock_a.release()
+        with self.assertRaises(lock.LockTimeout):
+            self.lock_b.acquire(shared=True, timeout=0)
+        self.lock_a.release()
+        self.lock_b.acquire(shared=True, timeout=0)
+
+    def test_concurrent_upgrades(self):
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def upgrade(file_lock):
+            try:
+                file_lock.acquire(shared=True)
+                barrier.wait()
+                file_lock.acquire(timeout=5)
+                time.sleep(0.1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                file_lock.release()
+                file_lock.release()
+
+        start = time.time()
+        threads = [threading.Thread(target=upgrade, args=(file_lock,))
+                   for file_lock in (self.lock_a, self.lock_b)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLess(time.time() - start, 2)
+
+    def test_timed_out_upgrade(self):
+        self.lock_a.acquire(shared=True)
+        self.lock_b.acquire(shared=True)
+        with self.assertRaises(lock.LockTimeout):
+            self.lock_a.acquire(timeout=0.1)
+        # still held in shared mode
+        self.assertTrue(self.lock_a.held)
+        self.lock_b.release()
+        with self.assertRaises(lock.LockTimeout):
+            self.lock_b.acquire(timeout=0)
+        self.lock_a.release()
+        self.assertFalse(self.lock_a.held)
+        self.lock_b.acquire(timeout=0)
+
+    def test_deferred_release(self):
+        self.lock_a.deferrable = True
+        lock._locks[self.lock_a.path] = self.lock_a
+        try:
+            lock.defer_release()
+            self.lock_a.acquire()
+            self.lock_a.release()
+            with self.assertRaises(lock.LockTimeout):
+                self.lock_b.acquire(shared=True, timeout=0)
+            lock.release_all()
+            self.lock_b.acquire(shared=True, timeout=0)
+        finally:
+            lock.release_all()
+            del lock._locks[self.lock_a.path]
+
+
+@unittest.skipIf(lock.fcntl is None, 'no flock')
+class TestConcurrentCommands(sand_env.SandboxedCommandTestCase):
+
+    N = 8
+
+    def setUp(self):
+        super(TestConcurrentCommands, self).setUp()
+        self.env_backup = os.environ.copy()
+        os.environ['GIT_AUTHOR_NAME'] = os.environ['GIT_COMMITTER_NAME'] = "Pubs test"
+        os.environ['GIT_AUTHOR_EMAIL'] = os.environ['GIT_COMMITTER_EMAIL'] = "unittest@pubs.org"
+        self.execute_cmds([('pubs init',)])
+        conf = config.load_conf(path=self.default_conf_path)
+        conf['plugins']['active'] = ['git']
+        config.save_conf(conf, path=self.default_conf_path)
+        self.execute_cmds([('pubs import data/three_articles.bib',)])
+
+    def tearDown(self):
+        os.environ = self.env_backup
+        super(TestConcurrentCommands, self).tearDown()
+
+    def pubs(self, *args):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+        return subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys; from pubs import pubs_cmd; pubs_cmd.execute(sys.argv)',
+             '-c', self.default_conf_path] + list(args),
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def test_parallel_tags(self):
+        processes = [self.pubs('tag', 'Bell_1964', '+tag{}'.format(i))
+                     for i in range(self.N)]
+        processes += [self.pubs('tag', 'Einstein_1935', '+tag{}'.format(i))
+                      for i in range(self.N)]
+        processes += [self.pubs('list') for _ in range(self.N)]
+        for p in processes:
+            out, _ = p.communicate(timeout=120)
+            self.assertEqual(p.returncode, 0, out)
+
+        expected = ', '.join(sorted('tag{}'.format(i) for i in range(self.N)))
+        outs = self.execute_cmds([('pubs tag Bell_1964',), ('pubs tag Einstein_1935',),
+                                  ('pubs list tag:tag0',)])
+        self.assertEqual(outs[0].strip(), expected)
+        self.assertEqual(outs[1].strip(), expected)
+        self.assertEqual(len(outs[2].splitlines()), 2)
+        # the caches are consistent with the files
+        shutil.rmtree(os.path.join(self.default_pubs_dir, '.cache'))
+        self.assertEqual(self.execute_cmds([('pubs list tag:tag0',)])[0], outs[2])
+        # one commit per command, and nothing left uncommitted
+        git = ['git', '-C', self.default_pubs_dir]
+        commits = subprocess.check_output(git + ['rev-list', '--count', 'HEAD'])
+        self.assertEqual(int(commits), 2 * self.N + 1)
+        self.assertEqual(subprocess.check_output(git + ['status', '--porcelain']), b'')
+
+    def test_timeout_is_reported(self):
+        conf = config.load_conf(path=self.default_conf_path)
+        conf['main']['lock_timeout'] = 0.1
+        config.save_conf(conf, path=self.default_conf_path)
+        other = lock.FileLock(os.path.join(self.default_pubs_dir, '.cache', lock.REPOSITORY_LOCK))
+        other.acquire()
+        try:
+            p = self.pubs('tag', 'Bell_1964', 'x')
+            out, _ = p.communicate(timeout=60)
+        finally:
+            other.release()
+        self.assertNotEqual(p.returncode, 0)
+        self.assertNotIn(b'Traceback', out)
+        self.assertIn(b'locked by another pubs process', out)
+
+
+if __name__ == '__main__':
+    unittest.main()
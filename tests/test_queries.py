@@ -218,6 +218,15 @@ class TestFilterPaper(unittest.TestCase):
         self.assertFalse(get_paper_filter(
             ['title:Nin\u0303o'], strict=True)(latexenc_paper))
 
+    def test_uses_given_normalized_fields(self):
+        paper = doe_paper.deepcopy()
+        paper.normalized_fields = {'title': 'Niño', 'author': ['Erdős']}
+        self.assertTrue(get_paper_filter(['title:niño', 'author:erdős'])(paper))
+        self.assertFalse(get_paper_filter(['title:nice'])(paper))
+        self.assertTrue(get_paper_filter(['title:Nice'], strict=True)(paper))
+        self.assertTrue(get_paper_filter(['title:nice']).uses_normalized_fields)
+        self.assertFalse(get_paper_filter(['year:2013', 'tag:a']).uses_normalized_fields)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,16 @@
 import unittest
 from datetime import datetime
 
+import mock
+
 import dotdot
 import fake_env
 import fixtures
 
-from pubs.repo import Repository, _base27, CiteKeyCollision, CiteKeyNotFound
+from pubs.repo import (Repository, _base27, _from_base27, SortedCitekeys,
+                       CiteKeyCollision, CiteKeyNotFound)
 from pubs.paper import Paper
-from pubs import config
+from pubs import config, events
 
 
 class TestRepo(fake_env.TestFakeFs):
@@ -37,6 +40,38 @@ class TestCitekeyGeneration(TestRepo):
         c = self.repo.unique_citekey('bla/bla', fixtures.doe_bibentry)
         self.assertEqual(c, 'Doe2013b')
 
+    def test_from_base27(self):
+        for n in (0, 1, 26, 27, 702, 703, 10000):
+            self.assertEqual(_from_base27(_base27(n)), n)
+        self.assertIsNone(_from_base27('B'))
+
+    def test_first_free_skips_used_suffixes(self):
+        keys = SortedCitekeys(['Doe2013', 'Doe2013a', 'Doe2013c', 'Doe2013X', 'Doe2014'])
+        self.assertEqual(keys.first_free('Doe2013'), 'Doe2013b')
+        keys.add('Doe2013b')
+        self.assertEqual(keys.first_free('Doe2013'), 'Doe2013d')
+        self.assertEqual(keys.first_free('Doe2015'), 'Doe2015')
+
+
+class TestSortedCitekeys(TestRepo):
+
+    def test_prefix(self):
+        for citekey in ('Doe2013', 'Doe2013a', 'Dob', 'Doe2014'):
+            self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry,
+                                                     citekey=citekey))
+        self.assertEqual(self.repo.citekeys_from_prefix('Doe2013'),
+                         ('Doe2013', 'Doe2013a'))
+        self.assertEqual(self.repo.citekeys_from_prefix('Do'),
+                         ('Dob', 'Doe2013', 'Doe2013a', 'Doe2014'))
+        self.repo.remove_paper('Doe2013a')
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry,
+                                                 citekey='Doe2013b'))
+        self.assertEqual(self.repo.citekeys_from_prefix('Doe2013'),
+                         ('Doe2013', 'Doe2013b'))
+        self.assertEqual(self.repo.citekeys_from_prefix('x'), ())
+        self.assertIn('Dob', self.repo.sorted_citekeys)
+        self.assertEqual(len(self.repo.sorted_citekeys), len(self.repo.citekeys))
+
 
 class TestPushPaper(TestRepo):
 
@@ -91,5 +126,105 @@ class TestUpdatePaper(TestRepo):
     # TODO: should also check that associated files are updated
 
 
+class TestBatch(TestRepo):
+
+    def test_changes_are_written_on_exit(self):
+        with self.repo.batch():
+            self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+            self.repo.remove_paper('turing1950computing')
+            self.assertIn('Doe2013', self.repo)
+            self.assertEqual(self.repo.pull_paper('Doe2013').bibentry,
+                             fixtures.doe_bibentry)
+            self.assertNotIn('turing1950computing', self.repo)
+            # not yet on disk
+            self.assertFalse(self.repo.databroker.exists('Doe2013'))
+            self.assertTrue(self.repo.databroker.exists('turing1950computing'))
+        self.assertEqual(self.repo.databroker.pull_bibentry('Doe2013'),
+                         fixtures.doe_bibentry)
+        self.assertFalse(self.repo.databroker.exists('turing1950computing'))
+        self.assertEqual(self.repo.citekeys, set(['Doe2013']))
+
+    def test_rollback_on_exception(self):
+        with self.assertRaises(ValueError):
+            with self.repo.batch():
+                self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+                paper = self.repo.pull_paper('turing1950computing')
+                self.repo.rename_paper(paper, 'Turing1950')
+                raise ValueError()
+        self.assertNotIn('Doe2013', self.repo)
+        self.assertNotIn('Turing1950', self.repo)
+        self.assertIn('turing1950computing', self.repo)
+        self.assertEqual(self.repo.citekeys, set(['turing1950computing']))
+        self.assertEqual(self.repo.citekeys_from_prefix('T'), ())
+
+    def test_rollback_on_write_error(self):
+        paper = self.repo.pull_paper('turing1950computing')
+        with mock.patch.object(self.repo.databroker, 'push_bibentry',
+                               side_effect=IOError('disk full')):
+            with self.assertRaises(IOError):
+                self.repo.rename_paper(paper, 'Turing1950')
+        self.assertEqual(self.repo.citekeys, set(['turing1950computing']))
+        self.assertNotIn('Turing1950', self.repo)
+        self.assertFalse(self.repo.databroker.exists('Turing1950'))
+        self.assertEqual(self.repo.pull_paper('turing1950computing').bibentry,
+                         fixtures.turing_bibentry)
+
+    def test_written_papers_are_restored(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        push_metadata = self.repo.databroker.push_metadata
+        written = []
+
+        def failing_push_metadata(citekey, metadata):
+            written.append(citekey)
+            if len(written) == 2:  # the second paper fails
+                raise IOError('disk full')
+            push_metadata(citekey, metadata)
+
+        with mock.patch.object(self.repo.databroker, 'push_metadata',
+                               side_effect=failing_push_metadata):
+            with self.assertRaises(IOError):
+                with self.repo.batch():
+                    for citekey in ('turing1950computing', 'Doe2013'):
+                        paper = self.repo.pull_paper(citekey)
+                        paper.add_tag('new')
+                        self.repo.push_paper(paper, overwrite=True)
+        for citekey in ('turing1950computing', 'Doe2013'):
+            self.assertEqual(self.repo.databroker.pull_metadata(citekey)['tags'], set())
+
+    def test_metadata_only_push(self):
+        with mock.patch.object(self.repo.databroker, 'push_bibentry') as push_bibentry:
+            with self.repo.batch():
+                paper = self.repo.pull_paper('turing1950computing')
+                paper.add_tag('new')
+                self.repo.push_metadata(paper)
+        push_bibentry.assert_not_called()
+        self.assertEqual(self.repo.databroker.pull_metadata('turing1950computing')['tags'],
+                         set(['new']))
+
+    def test_metadata_only_push_then_full_push(self):
+        paper = self.repo.pull_paper('turing1950computing')
+        with self.repo.batch():
+            paper.add_tag('new')
+            self.repo.push_metadata(paper)
+            paper.bibentry['turing1950computing']['year'] = '1951'
+            self.repo.push_paper(paper, overwrite=True)
+        self.assertEqual(self.repo.databroker.pull_bibentry('turing1950computing')
+                         ['turing1950computing']['year'], '1951')
+
+    def test_single_event(self):
+        with mock.patch.object(events.BatchEvent, 'send', autospec=True) as send:
+            with self.repo.batch():
+                self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+                paper = self.repo.pull_paper('turing1950computing')
+                self.repo.rename_paper(paper, 'Turing1950')
+                self.assertEqual(send.call_count, 0)
+        self.assertEqual(send.call_count, 1)
+        event = send.call_args[0][0]
+        self.assertIsInstance(event, events.BatchEvent)
+        self.assertEqual(event.description.splitlines(),
+                         ['Added paper Doe2013.',
+                          'Renamed paper turing1950computing to Turing1950.'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,127 @@
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import unittest
+import subprocess
+
+import mock
+
+import dotdot
+import sand_env
+
+from pubs import databroker, server
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(hasattr(server.socket, 'AF_UNIX'), 'no Unix sockets')
+class ServerTestCase(sand_env.SandboxedCommandTestCase):
+
+    interval = '0.1'  # of the watcher of the server
+
+    def setUp(self):
+        super(ServerTestCase, self).setUp()
+        self.execute_cmds([('pubs init',),
+                           ('pubs import data/three_articles.bib',)])
+        self.expected = self.execute_cmds([('pubs list',)])[0]
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+        self.process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys; from pubs import pubs_cmd; pubs_cmd.execute(sys.argv)',
+             '-c', self.default_conf_path, 'server', '--interval', self.interval],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(200):
+            if server.is_running(self.default_conf_path):
+                break
+            time.sleep(0.05)
+        else:
+            self.fail('The server did not start.')
+
+    def tearDown(self):
+        server.stop(self.default_conf_path)
+        self.process.wait(10)
+        super(ServerTestCase, self).tearDown()
+
+
+class TestServer(ServerTestCase):
+
+    def test_forward(self):
+        self.assertEqual(self.execute_cmds([('pubs list',)])[0], self.expected)
+
+    def test_external_changes(self):
+        bibdir = os.path.join(self.default_pubs_dir, 'bib')
+        bibfile = os.path.join(bibdir, sorted(os.listdir(bibdir))[0])
+        with open(bibfile) as f:
+            bibstr = f.read()
+        with open(bibfile, 'w') as f:
+            f.write(bibstr.replace('title = {', 'title = {Revised ', 1))
+        time.sleep(0.5)
+        out = self.execute_cmds([('pubs list title:Revised',)])[0]
+        self.assertEqual(len(out.splitlines()), 1)
+
+    def test_stop(self):
+        self.execute_cmds([('pubs server --stop',)])
+        self.process.wait(10)
+        self.assertFalse(server.is_running(self.default_conf_path))
+        self.assertIsNone(server.forward(self.default_conf_path, ['list']))
+
+
+class TestServerWrites(ServerTestCase):
+    """Commands run by other processes are seen at once, not when the
+    watcher polls the files."""
+
+    interval = '600'
+
+    def test_add_then_list(self):
+        outs = self.execute_cmds([('pubs add data/pagerank.bib',),
+                                  ('pubs list',)])
+        self.assertIn('[Page99]', outs[1])
+        self.assertEqual(len(outs[1].splitlines()), 4)
+
+    def test_rename_then_tag(self):
+        outs = self.execute_cmds([('pubs rename Bell_1964 Bell1964',),
+                                  ('pubs tag Bell1964 physics',),
+                                  ('pubs list tag:physics',)])
+        self.assertIn('[Bell1964]', outs[2])
+
+    def test_without_notification(self):
+        with mock.patch.object(server, 'notify'):
+            outs = self.execute_cmds([('pubs remove -f Bell_1964',),
+                                      ('pubs list',)])
+        self.assertNotIn('Bell_1964', outs[1])
+
+
+class TestWatcher(sand_env.SandboxedCommandTestCase):
+
+    def test_changes_since_listing(self):
+        self.execute_cmds([('pubs init',),
+                           ('pubs import data/three_articles.bib',)])
+        broker = databroker.STORAGES['files'](self.default_pubs_dir)
+        listing = broker.listing(filestats=True)
+        # changed between the listing and the start of the watcher
+        listing['bibfiles']['Bell_1964'] -= 10
+        watcher = server.Watcher(self.default_pubs_dir, interval=0.05)
+        watcher.start(listing=listing)
+        try:
+            time.sleep(0.3)
+        finally:
+            watcher.stop()
+        self.assertEqual(list(watcher.pop_changes()), [('bibfiles', 'Bell_1964')])
+
+
+class TestForward(sand_env.SandboxedCommandTestCase):
+
+    def test_not_running(self):
+        self.assertFalse(server.is_running(self.default_conf_path))
+        self.assertIsNone(server.forward(self.default_conf_path, ['list']))
+
+    def test_not_served(self):
+        self.assertIsNone(server.forward(self.default_conf_path, ['add']))
+
+
+if __name__ == '__main__':
+    unittest.main()
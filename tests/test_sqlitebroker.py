@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+
+import dotdot
+import fixtures
+import sand_env
+
+from pubs import config, datacache
+from pubs.datacache import DataCache
+from pubs.sqlitebroker import SQLiteBroker, DB_NAME
+
+
+class TestSQLiteBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pubsdir = os.path.join(self.tmpdir, 'pubs')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_missing_database(self):
+        with self.assertRaises(IOError):
+            SQLiteBroker(self.pubsdir)
+
+    def test_push(self):
+        sb = SQLiteBroker(self.pubsdir, create=True)
+        sb.push('citekey1', 'abc', 'def')
+        self.assertEqual(sb.pull_metafile('citekey1'), 'abc')
+        self.assertEqual(sb.pull_bibfile('citekey1'), 'def')
+        sb.push_bibfile('citekey1', 'ghi')
+        self.assertEqual(sb.pull_bibfile('citekey1'), 'ghi')
+        self.assertTrue(sb.exists('citekey1', meta_check=True))
+
+    def test_persistence(self):
+        sb = SQLiteBroker(self.pubsdir, create=True)
+        sb.push('citekey1', 'abc', 'def')
+        sb.close()
+        sb = SQLiteBroker(self.pubsdir)
+        self.assertEqual(sb.pull_bibfile('citekey1'), 'def')
+
+    def test_remove(self):
+        sb = SQLiteBroker(self.pubsdir, create=True)
+        sb.push('citekey1', 'abc', 'def')
+        sb.remove('citekey1')
+        self.assertFalse(sb.exists('citekey1'))
+        with self.assertRaises(IOError):
+            sb.pull_bibfile('citekey1')
+        with self.assertRaises(IOError):
+            sb.mtime_metafile('citekey1')
+
+    def test_listing(self):
+        sb = SQLiteBroker(self.pubsdir, create=True)
+        sb.push('citekey1', 'abc', 'def')
+        sb.push_bibfile('citekey2', 'ghi')
+        listing = sb.listing(filestats=False)
+        self.assertEqual(set(listing['metafiles']), {'citekey1'})
+        self.assertEqual(set(listing['bibfiles']), {'citekey1', 'citekey2'})
+        listing = sb.listing()
+        self.assertEqual(listing['bibfiles']['citekey2'], sb.mtime_bibfile('citekey2'))
+
+    def test_cachefile(self):
+        sb = SQLiteBroker(self.pubsdir, create=True)
+        with self.assertRaises(IOError):
+            sb.pull_cachefile('cache')
+        sb.push_cachefile('cache', b'abc')
+        sb.append_cachefile('cache', b'def')
+        self.assertEqual(sb.pull_cachefile('cache'), b'abcdef')
+        sb.push_cachefile('cache', b'ghi')
+        self.assertEqual(sb.pull_cachefile('cache'), b'ghi')
+        sb.remove_cachefile('cache')
+        with self.assertRaises(IOError):
+            sb.pull_cachefile('cache')
+
+
+class TestSQLiteDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pubsdir = os.path.join(self.tmpdir, 'pubs')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_push_pull(self):
+        dc = DataCache(self.pubsdir, 'docsdir://', create=True, storage='sqlite')
+        dc.push_bibentry('turing1950computing', fixtures.turing_bibentry)
+        dc.push_metadata('turing1950computing', fixtures.turing_metadata)
+        dc.close()
+        self.assertFalse(os.path.exists(os.path.join(self.pubsdir, 'bib')))
+        dc = DataCache(self.pubsdir, 'docsdir://', storage='sqlite')
+        self.assertEqual(dc.pull_bibentry('turing1950computing'),
+                         fixtures.turing_bibentry)
+        self.assertEqual(dc.pull_metadata('turing1950computing'),
+                         fixtures.turing_metadata)
+        self.assertEqual(dc.citekeys(), {'turing1950computing'})
+
+    def test_close(self):
+        dc = DataCache(self.pubsdir, 'docsdir://', create=True, storage='sqlite')
+        dc.push_metadata('turing1950computing', fixtures.turing_metadata)
+        connection = dc.databroker.filebroker.connection
+        dc.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
+
+    def test_kept_open(self):
+        DataCache(self.pubsdir, 'docsdir://', create=True, storage='sqlite').close()
+        with mock.patch.object(datacache, '_kept', {}):  # in the server
+            dc = datacache.get_datacache(self.pubsdir, 'docsdir://', storage='sqlite')
+            dc.close()
+            self.assertIs(datacache.get_datacache(self.pubsdir, 'docsdir://',
+                                                  storage='sqlite'), dc)
+        self.assertEqual(dc.citekeys(), set())
+
+
+class TestStorageCommand(sand_env.SandboxedCommandTestCase):
+
+    def test_convert(self):
+        cmds = [('pubs init',),
+                ('pubs add data/pagerank.bib',),
+                ('pubs tag Page99 search',),
+                ('pubs storage',),
+                ('pubs list',),
+                ('pubs storage sqlite',),
+                ('pubs storage',),
+                ('pubs list',),
+                ('pubs list tag:search',),
+                ('pubs storage files',),
+                ('pubs list',),
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[3], 'files\n')
+        self.assertEqual(outs[6], 'sqlite\n')
+        self.assertEqual(outs[4], outs[7])
+        self.assertEqual(outs[4], outs[8])
+        self.assertEqual(outs[4], outs[10])
+        conf = config.load_conf(path=self.default_conf_path)
+        self.assertEqual(conf['main']['storage'], 'files')
+        self.assertFalse(os.path.exists(os.path.join(self.default_pubs_dir, DB_NAME)))
+
+    def test_source_kept_until_config_saved(self):
+        self.execute_cmds([('pubs init',), ('pubs add data/pagerank.bib',)])
+        with mock.patch.object(config, 'save_conf', side_effect=IOError('read-only')):
+            with self.assertRaises(sand_env.FakeSystemExit):
+                self.execute_cmds([('pubs storage sqlite',)])
+        outs = self.execute_cmds([('pubs storage',), ('pubs list',)])
+        self.assertEqual(outs[0], 'files\n')
+        self.assertIn('Page99', outs[1])
+        self.assertFalse(os.path.exists(os.path.join(self.default_pubs_dir, DB_NAME)))
+        self.assertTrue(os.path.exists(os.path.join(self.default_pubs_dir, '.cache', 'lock')))
+
+    def test_sqlite_repository(self):
+        self.execute_cmds([('pubs init',)])
+        conf = config.load_conf(path=self.default_conf_path)
+        conf['main']['storage'] = 'sqlite'
+        config.save_conf(conf)
+        shutil.rmtree(self.default_pubs_dir)
+        self.execute_cmds([('pubs init',)])
+        self.assertTrue(os.path.exists(os.path.join(self.default_pubs_dir, DB_NAME)))
+        self.assertFalse(os.path.exists(os.path.join(self.default_pubs_dir, 'meta')))
+        outs = self.execute_cmds([('pubs add data/pagerank.bib',),
+                                  ('pubs rename Page99 Page1999',),
+                                  ('pubs list',)])
+        self.assertIn('[Page1999]', outs[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+from __future__ import unicode_literals
+
+import os
+import json
+import time
+import pstats
+import unittest
+
+import dotdot
+import sand_env
+
+from pubs import timings
+
+
+class TestPhases(unittest.TestCase):
+
+    def tearDown(self):
+        timings.disable()
+
+    def test_disabled(self):
+        with timings.phase('io'):
+            pass
+        self.assertFalse(timings.enabled())
+
+    def test_nested_phases(self):
+        timings.enable()
+        with timings.phase('command'):
+            time.sleep(0.02)
+            for _ in range(2):
+                with timings.phase('io'):
+                    time.sleep(0.02)
+        res = timings.results()
+        self.assertEqual(list(res['phases']), ['io', 'command'])
+        self.assertEqual(res['phases']['io']['calls'], 2)
+        self.assertGreaterEqual(res['phases']['io']['time'], 0.04)
+        # time spent in io is not counted in command
+        self.assertLess(res['phases']['command']['time'], 0.04)
+        self.assertGreaterEqual(res['total'], 0.06)
+        self.assertIn('other', timings.format_results(res))
+
+
+class TestProfileOption(sand_env.SandboxedCommandTestCase):
+
+    def setUp(self):
+        super(TestProfileOption, self).setUp()
+        self.execute_cmds([('pubs init',),
+                           ('pubs add data/pagerank.bib',)])
+
+    def test_profile_json(self):
+        path = os.path.join(self.temp_dir, 'profile.json')
+        out = self.execute_cmds([('pubs --profile {} list'.format(path),)])[0]
+        self.assertIn('Page99', out)
+        self.assertFalse(timings.enabled())
+        with open(path) as f:
+            data = json.load(f)
+        self.assertIn('command', data['timings']['phases'])
+        self.assertIn('config', data['timings']['phases'])
+        self.assertTrue(any(s['function'] == 'command' and s['file'].endswith('list_cmd.py')
+                            for s in data['functions']))
+
+    def test_profile_pstats(self):
+        path = os.path.join(self.temp_dir, 'profile.prof')
+        self.execute_cmds([('pubs --timings --profile {} list'.format(path),)])
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
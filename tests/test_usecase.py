@@ -4,6 +4,7 @@ from __future__ import print_function, unicode_literals
 import unittest
 import os
 import re
+import errno
 import sys
 import shutil
 
@@ -77,6 +78,27 @@ class TestInput(unittest.TestCase):
         with self.assertRaises(fake_env.FakeInput.UnexpectedInput):
             ui.editor_input()
 
+    def test_message_lines_broken_pipe(self):
+        ui = uis.PrintUI(conf.load_default_conf())
+
+        class ClosedPipe(object):
+            def write(self, s):
+                raise IOError(errno.EPIPE, 'Broken pipe')
+
+            def flush(self):
+                pass
+
+        ui._stdout = ClosedPipe()
+        produced = []
+
+        def lines():
+            for i in range(10):
+                produced.append(i)
+                yield str(i)
+
+        ui.message_lines(lines())
+        self.assertEqual(produced, [0])
+
 
 class CommandTestCase(fake_env.TestFakeFs):
     """Abstract TestCase intializing the fake filesystem."""
@@ -570,6 +592,32 @@ class TestList(DataCommandTestCase):
         self.assertEqual(outs[4], correct[0])
         self.assertEqual(outs[6], correct[1])
 
+    def test_list_limit_offset_reverse(self):
+        cmds = ['pubs init',
+                'pubs import data/',
+                'pubs list -k -C',
+                'pubs list -k -C --limit 2',
+                'pubs list -k -C --limit 2 --offset 3',
+                'pubs list -k -C --reverse -n 2',
+                'pubs list -k -a --offset 6',
+                'pubs list -k -a --offset 8',
+                ]
+        outs = self.execute_cmds(cmds)
+        chrono = outs[2].splitlines()
+        self.assertEqual(len(chrono), 8)
+        self.assertEqual(outs[3].splitlines(), chrono[:2])
+        self.assertEqual(outs[4].splitlines(), chrono[3:5])
+        self.assertEqual(outs[5].splitlines(), chrono[::-1][:2])
+        self.assertEqual(outs[6].splitlines(), ['Schrodinger_1935', 'turing1950computing'])
+        self.assertEqual(outs[7], '')
+
+    def test_list_negative_limit_offset(self):
+        self.execute_cmds(['pubs init'])
+        for cmd in ('pubs list --limit -3', 'pubs list -n x', 'pubs list --offset -1'):
+            with self.assertRaises(FakeSystemExit) as cm:
+                self.execute_cmds([cmd])
+            self.assertEqual(cm.exception.code, 2)
+
 class TestTag(DataCommandTestCase):
 
     def setUp(self):
@@ -633,6 +681,40 @@ class TestTag(DataCommandTestCase):
         out = self.execute_cmds(cmds)
         self.assertEqual(out, correct)
 
+    def test_tag_citekeys(self):
+        cmds = ['pubs tag Page99 Turing1950 a+b',
+                'pubs tag Page99 Turing1950 :a',
+                'pubs tag Page99 Page99 :a',
+                'pubs list',
+                ]
+        correct = ['info: Tags of 2 papers updated (2 matching).\n',
+                   'info: Tags of 2 papers updated (2 matching).\n',
+                   'info: Tags of 0 papers updated (1 matching).\n',
+                   '[Page99] Page, Lawrence et al. "The PageRank Citation Ranking: Bringing Order to the Web." (1999) | b\n' +
+                   '[Turing1950] Turing, Alan M "Computing machinery and intelligence" Mind (1950) | b\n',
+                   ]
+        out = self.execute_cmds(cmds)
+        self.assertEqual(out, correct)
+
+    def test_tag_query(self):
+        cmds = ['pubs tag Page99 search',
+                'pubs tag --query year:1950 ai+search',
+                'pubs tag -q tag:search net',
+                'pubs list',
+                ]
+        correct = ['',
+                   'info: Tags of 1 paper updated (1 matching).\n',
+                   'info: Tags of 2 papers updated (2 matching).\n',
+                   '[Page99] Page, Lawrence et al. "The PageRank Citation Ranking: Bringing Order to the Web." (1999) | net, search\n' +
+                   '[Turing1950] Turing, Alan M "Computing machinery and intelligence" Mind (1950) | ai, net, search\n',
+                   ]
+        out = self.execute_cmds(cmds)
+        self.assertEqual(out, correct)
+
+    def test_tag_query_without_tags(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs tag --query year:1950'])
+
     def test_wrong_citekey(self):
         cmds = ['pubs tag Page999 a',
                 ]
@@ -925,6 +1007,16 @@ class TestUsecase(DataCommandTestCase):
         self.assertEqual(endecoder.EnDecoder().decode_bibdata(outs[2]),
                          fixtures.page_bibentry)
 
+    def test_export_all(self):
+        cmds = ['pubs init',
+                'pubs import data/three_articles.bib',
+                'pubs export',
+                ]
+        outs = self.execute_cmds(cmds)
+        with open('data/three_articles.bib') as f:
+            bibdata = endecoder.EnDecoder().decode_bibdata(f.read())
+        self.assertEqual(outs[2], endecoder.EnDecoder().encode_bibdata(bibdata) + os.linesep)
+
     def test_export_ignore_field(self):
         cmds = ['pubs init',
                 ('pubs add', [str_fixtures.bibtex_external0]),
@@ -1071,6 +1163,27 @@ class TestUsecase(DataCommandTestCase):
         self.execute_cmds(cmds)
         self.assertFalse(os.path.exists('data/pagerank.pdf'))
 
+    def test_doc_dedup(self):
+        size = os.path.getsize('data/pagerank.pdf') / 1024.
+        cmds = ['pubs init',
+                'pubs add data/pagerank.bib -d data/pagerank.pdf',
+                'pubs add data/pagerank.bib -d data/pagerank.pdf',
+                'pubs doc dedup --report',
+                'pubs doc dedup',
+                'pubs rename Page99a Preprint',
+                'pubs doc dedup -r',
+               ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[3], '2 documents, {:.1f} KB ({:.1f} KB on disk): '
+                                  'deduplication saves 0 B.\n'.format(2 * size, 2 * size))
+        saved = ('2 documents, {:.1f} KB ({:.1f} KB on disk): '
+                 'deduplication saves {:.1f} KB.\n'.format(2 * size, size, size))
+        self.assertEqual(outs[4], saved)
+        self.assertEqual(outs[6], saved)
+        docdir = os.path.join(self.default_pubs_dir, 'doc')
+        self.assertTrue(os.path.samefile(os.path.join(docdir, 'Page99.pdf'),
+                                         os.path.join(docdir, 'Preprint.pdf')))
+
     def test_doc_remove(self):
         cmds = ['pubs init',
                 'pubs add data/pagerank.bib',
@@ -1128,6 +1241,7 @@ class TestUsecase(DataCommandTestCase):
         self.assertEqual(lines[0], 'Repository statistics:')
         self.assertEqual(lines[1], 'Total papers: 4, 1 (25%) have a document attached')
         self.assertEqual(lines[2], 'Total tags: 3, 2 (50%) of papers have at least one tag')
+        self.assertEqual(lines[3], 'Most used tags: A (1), B (1), C (1)')
 
     def test_add_no_extension(self):
         """This tests checks that a paper which document has no extension does
@@ -1164,7 +1278,7 @@ class TestUsecase(DataCommandTestCase):
         self.assertEqual(correct, actual)
 
 
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_readme(self, reqget):
         """Test that the readme example work."""
         self.fs.add_real_file(os.path.join(self.rootpath, 'data/pagerank.pdf'), target_path='data/Loeb_2012.pdf')
@@ -1182,7 +1296,7 @@ class TestUsecase(DataCommandTestCase):
         self.execute_cmds(cmds, capture_output=True)
 
     @pytest.mark.skip(reason="isbn is not working anymore, see https://github.com/pubs/pubs/issues/276")
-    @mock.patch('pubs.apis.requests.get', side_effect=mock_requests.mock_requests_get)
+    @mock.patch('requests.get', side_effect=mock_requests.mock_requests_get)
     def test_isbn(self, reqget):
         """Test that the readme example work."""
         self.fs.add_real_file(os.path.join(self.rootpath, 'data/pagerank.pdf'), target_path='data/Loeb_2012.pdf')